@@ -8,12 +8,13 @@ Removes files within /tophat_data/ older than two days.
 
 
 import argparse
+import fnmatch
 import logging
-import os
 import sys
-from datetime import datetime
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+from tophat_catalog import ARTIFACT_KINDS, OutputCatalog
 
 # How many series of fetched_records or new_records to maintain, and where?
 DEFAULT_KEEP_COUNT = 2
@@ -29,47 +30,26 @@ logger = logging.getLogger(__name__)
 
 class FileCleanup:
     
-    def __init__(self, output_dir: str = OUTPUT_DIR, keep_count: int = DEFAULT_KEEP_COUNT):
+    def __init__(self, output_dir: str = OUTPUT_DIR, keep_count: int = DEFAULT_KEEP_COUNT,
+                 keep_days: Optional[int] = None, max_bytes: Optional[int] = None):
         self.output_dir = Path(output_dir)
         self.keep_count = keep_count
+        self.keep_days = keep_days
+        self.max_bytes = max_bytes
+        self.catalog = None
 
+    def open_catalog(self, dry_run: bool) -> OutputCatalog:
+        """Opened on first use; a dry run creates neither the directory nor the catalog"""
+        if self.catalog is None:
+            self.catalog = OutputCatalog(self.output_dir, readonly=dry_run)
+        return self.catalog
 
 
-    def get_timestamped_files(self, pattern: str) -> List[Tuple[Path, datetime]]:
-
-        files_with_timestamps = []
-        
-        if not self.output_dir.exists():
-            return files_with_timestamps
-        
-        for filepath in self.output_dir.glob(pattern):
-
-
-
-
-
-            # Extract timestamp from filename
 
+    def kinds_for_pattern(self, pattern: str) -> List[str]:
+        return [kind for kind, kind_pattern in ARTIFACT_KINDS.items()
+                if kind_pattern == pattern or fnmatch.fnmatch(kind_pattern, pattern)]
 
-            try:
-                filename = filepath.stem
-
-                parts = filename.split('_')
-                if len(parts) >= 3:
-                    date_part = parts[-2]  
-                    time_part = parts[-1]
-                    timestamp_str = f"{date_part}_{time_part}"
-                    timestamp = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
-                    files_with_timestamps.append((filepath, timestamp))
-            except (ValueError, IndexError) as e:
-                logger.warning(f"Could not parse timestamp from {filepath.name}: {e}")
-                continue
-
-
-        files_with_timestamps.sort(key=lambda x: x[1], reverse=True)
-        
-        return files_with_timestamps
-    
     def cleanup_old_files(self, pattern: str, dry_run: bool = False) -> Tuple[int, int]:
 
 
@@ -82,59 +62,29 @@ class FileCleanup:
 
 
 
-        files_with_timestamps = self.get_timestamped_files(pattern)
-        
-        if not files_with_timestamps:
-            logger.info(f"No files found matching {pattern}")
+        kinds = self.kinds_for_pattern(pattern)
+        if not kinds:
+            logger.info(f"No catalogued file type matches {pattern}")
             return (0, 0)
         
-        total_files = len(files_with_timestamps)
-        files_to_keep = files_with_timestamps[:self.keep_count]
-        files_to_delete = files_with_timestamps[self.keep_count:]
-
-        logger.info(f"Found {total_files} files matching {pattern}")
-        logger.info(f"Keeping {len(files_to_keep)} most recent files")
-        logger.info(f"Will delete {len(files_to_delete)} old files")
-
-
-
-
-
-
-        deleted_count = 0
-        for filepath, timestamp in files_to_delete:
-            if dry_run:
-                logger.info(f"[DRY RUN] Would delete: {filepath.name} ({timestamp})")
-            else:
-                try:
-                    filepath.unlink()
-                    logger.info(f"Deleted: {filepath.name} ({timestamp})")
-                    deleted_count += 1
-                except Exception as e:
-                    logger.error(f"Error deleting {filepath.name}: {e}")
-        
-        return (len(files_to_keep), deleted_count if not dry_run else len(files_to_delete))
+        results = self.cleanup_kinds(kinds, dry_run=dry_run)
+        return (sum(r['kept'] for r in results.values()), sum(r['deleted'] for r in results.values()))
+    
+    def cleanup_kinds(self, kinds: List[str], dry_run: bool = False) -> dict:
+        results = self.open_catalog(dry_run).apply(kinds=kinds, keep_count=self.keep_count,
+                                                   max_age_days=self.keep_days, max_bytes=self.max_bytes,
+                                                   dry_run=dry_run)
+        for kind, stats in results.items():
+            logger.info(f"{kind}: keeping {stats['kept']} files, "
+                        f"{'would delete' if dry_run else 'deleted'} {stats['deleted']}")
+        return results
     
     def cleanup_all(self, dry_run: bool = False) -> dict:
 
 
 
 
-        results = {}
-        
-        patterns = {
-            'fetched_csv': 'fetched_records_*.csv',
-            'fetched_json': 'fetched_records_*.json',
-            'new_csv': 'new_records_*.csv',
-            'new_json': 'new_records_*.json',
-        }
-        
-        for file_type, pattern in patterns.items():
-            logger.info(f"\nCleaning up {file_type} files...")
-            kept, deleted = self.cleanup_old_files(pattern, dry_run=dry_run)
-            results[file_type] = {'kept': kept, 'deleted': deleted}
-        
-        return results
+        return self.cleanup_kinds(list(ARTIFACT_KINDS), dry_run=dry_run)
 
 
 
@@ -153,7 +103,17 @@ def main():
         '--keep',
         type=int,
         default=DEFAULT_KEEP_COUNT,
-        help=f'Number of most recent files to keep (default: {DEFAULT_KEEP_COUNT})'
+        help=f'Number of most recent files to keep, 0 deletes them all (default: {DEFAULT_KEEP_COUNT})'
+    )
+    parser.add_argument(
+        '--keep-days',
+        type=int,
+        help='Also delete files from runs older than this many days'
+    )
+    parser.add_argument(
+        '--max-mb',
+        type=float,
+        help='Also delete the oldest runs once catalogued files exceed this size'
     )
     parser.add_argument(
         '--dry-run',
@@ -171,6 +131,8 @@ def main():
     )
     
     args = parser.parse_args()
+    if args.keep < 0:
+        parser.error('--keep must be 0 or more')
     
 
 
@@ -185,7 +147,9 @@ def main():
     # Create cleanup manager
     cleanup = FileCleanup(
         output_dir=args.output_dir,
-        keep_count=args.keep
+        keep_count=args.keep,
+        keep_days=args.keep_days,
+        max_bytes=int(args.max_mb * 1024 * 1024) if args.max_mb else None
     )
     
 
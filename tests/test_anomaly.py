@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from tophat_anomaly import AnomalyDetector, MIN_SAMPLES, buckets_for
+
+MONDAY_9AM = datetime(2026, 3, 2, 9, 0)
+
+
+def learn(detector, values, when=MONDAY_9AM):
+    for i, value in enumerate(values):
+        detector.observe({'new_records': value}, when - timedelta(weeks=i + 1))
+
+
+def test_scores_nothing_while_learning(tmp_path):
+    detector = AnomalyDetector(tmp_path / 'stats.json')
+    learn(detector, [10] * (MIN_SAMPLES - 1))
+    assert detector.score('new_records', 1000, MONDAY_9AM) is None
+
+
+def test_scores_against_most_specific_bucket(tmp_path):
+    detector = AnomalyDetector(tmp_path / 'stats.json')
+    learn(detector, [10, 12, 8, 11, 9, 10, 12, 8])
+    result = detector.score('new_records', 10, MONDAY_9AM)
+    assert result['bucket'] == buckets_for(MONDAY_9AM)[0]
+    assert result['mean'] == 10
+    assert abs(result['z']) < 0.01
+    assert not result['floored']
+
+
+def test_flags_a_spike_against_a_varied_history(tmp_path):
+    detector = AnomalyDetector(tmp_path / 'stats.json')
+    learn(detector, [10, 12, 8, 11, 9, 10, 12, 8])
+    outliers = detector.check({'new_records': 40}, MONDAY_9AM)
+    assert outliers['new_records']['z'] > 10
+    assert outliers['new_records']['value'] == 40
+
+
+def test_constant_history_does_not_flag_small_changes(tmp_path):
+    detector = AnomalyDetector(tmp_path / 'stats.json')
+    learn(detector, [0] * MIN_SAMPLES)
+    assert detector.check({'new_records': 2}, MONDAY_9AM) == {}
+    result = detector.score('new_records', 2, MONDAY_9AM)
+    assert result['z'] == 2.0
+    assert result['floored']
+
+
+def test_constant_history_marks_large_values_as_floored(tmp_path):
+    detector = AnomalyDetector(tmp_path / 'stats.json')
+    learn(detector, [0] * MIN_SAMPLES)
+    outliers = detector.check({'new_records': 600}, MONDAY_9AM)
+    assert outliers['new_records']['floored']
+
+
+def test_spread_is_at_least_a_share_of_the_mean(tmp_path):
+    detector = AnomalyDetector(tmp_path / 'stats.json')
+    learn(detector, [1000] * MIN_SAMPLES)
+    result = detector.score('new_records', 1150, MONDAY_9AM)
+    assert result['std'] == 100
+    assert result['z'] == 1.5
+
+
+def test_statistics_survive_a_save(tmp_path):
+    detector = AnomalyDetector(tmp_path / 'stats.json')
+    learn(detector, [10, 12, 8, 11, 9, 10, 12, 8])
+    detector.save()
+    reloaded = AnomalyDetector(tmp_path / 'stats.json')
+    assert reloaded.score('new_records', 10, MONDAY_9AM) == detector.score('new_records', 10, MONDAY_9AM)
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+from tophat_history import SnapshotStore
+from tophat_query import HistoryIndex
+
+
+def row(record_id, employer='Acme', received='2026-03-01T10:00:00'):
+    return {'Id': str(record_id).zfill(13), 'DocId': str(record_id), 'Employer': employer,
+            'Ein': '123456789', 'DateReceived': received}
+
+
+def day(value):
+    return datetime.fromisoformat(f"{value}T06:00:00")
+
+
+def test_base_and_deltas_rebuild_every_day(tmp_path):
+    store = SnapshotStore(str(tmp_path), base_interval=2)
+    runs = {
+        '2026-03-01': [row(1), row(2)],
+        '2026-03-02': [row(1, 'Acme Corp'), row(2), row(3)],
+        '2026-03-03': [row(1, 'Acme Corp'), row(3)],
+        '2026-03-04': [row(3), row(4)],
+    }
+    for when, records in runs.items():
+        store.record(records, day(when))
+
+    assert [entry['kind'] for entry in store.entries] == ['base', 'delta', 'delta', 'base']
+    reloaded = SnapshotStore(str(tmp_path))
+    for when, records in runs.items():
+        assert reloaded.snapshot(when) == sorted(records, key=lambda r: r['Id'], reverse=True)
+    assert reloaded.rebuild('2026-02-28') is None
+
+
+def test_rerun_replaces_the_days_entry(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.record([row(1)], day('2026-03-01'))
+    store.record([row(1), row(2)], day('2026-03-02'))
+    delta = store.record([row(1), row(2), row(3)], day('2026-03-02'))
+
+    assert store.dates() == ['2026-03-01', '2026-03-02']
+    assert [r['Id'] for r in delta['added']] == [row(2)['Id'], row(3)['Id']]
+    assert len(store.snapshot('2026-03-02')) == 3
+    assert sorted(p.name for p in tmp_path.glob('*.json.gz')) == ['base_20260301.json.gz',
+                                                                   'delta_20260302.json.gz']
+
+
+def test_history_never_rewrites_earlier_days(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.record([row(1)], day('2026-03-02'))
+    assert store.record([row(2)], day('2026-03-01')) is None
+    assert store.dates() == ['2026-03-02']
+
+
+def record_and_index(store, index, records, when):
+    index.update(when, store.record(records, day(when)))
+
+
+def test_ids_as_of_after_removal_and_readd(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    index = HistoryIndex(str(tmp_path))
+    record_and_index(store, index, [row(1), row(2)], '2026-03-01')
+    record_and_index(store, index, [row(2)], '2026-03-02')
+    record_and_index(store, index, [row(1), row(2)], '2026-03-03')
+
+    assert index.ids_as_of('2026-03-01') == [2, 1]
+    assert index.ids_as_of('2026-03-02') == [2]
+    assert index.ids_as_of('2026-03-03') == [2, 1]
+    assert index.first_seen(1)['first_seen'] == '2026-03-01'
+    assert index.first_seen(1)['removed_on'] is None
+
+
+def test_index_rerun_day_matches_a_rebuild(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    index = HistoryIndex(str(tmp_path))
+    record_and_index(store, index, [row(1), row(2)], '2026-03-01')
+    record_and_index(store, index, [row(1, 'Acme Corp')], '2026-03-02')
+    # Rerun of the same day: the first run's removal and change are taken back
+    record_and_index(store, index, [row(1), row(2), row(3)], '2026-03-02')
+
+    assert index.ids_as_of('2026-03-02') == [3, 2, 1]
+    assert index.first_seen(1)['Employer'] == 'Acme'
+    assert index.first_seen(1)['last_changed'] is None
+    assert index.first_seen(2)['removed_on'] is None
+    assert index.filings_per_day('2026-03-01', '2026-03-01') == [('2026-03-01', 3)]
+
+    rebuilt = HistoryIndex(str(tmp_path / 'rebuilt'))
+    rebuilt.rebuild(store)
+    for when in ('2026-03-01', '2026-03-02'):
+        assert rebuilt.ids_as_of(when) == index.ids_as_of(when)
+    for record_id in (1, 2, 3):
+        assert rebuilt.first_seen(record_id) == index.first_seen(record_id)
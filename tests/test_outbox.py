@@ -0,0 +1,66 @@
+from tophat_outbox import Outbox
+
+SINKS = ['email', 'webhook']
+
+
+def records(*ids):
+    return [{'Id': str(record_id).zfill(13), 'Employer': 'Acme'} for record_id in ids]
+
+
+def test_enqueue_skips_records_already_queued(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.sqlite'))
+    assert outbox.enqueue(records(1, 2), 'tophat', SINKS) == 2
+    assert outbox.enqueue(records(2, 3), 'tophat', SINKS) == 1
+    assert outbox.pending('tophat') == 6
+    # A different key lets the same filing alert again (e.g. a PDF change)
+    assert outbox.enqueue(records(1), 'tophat', SINKS, key=lambda r: f"{r['Id']}:pdf") == 1
+
+
+def test_claim_is_per_sink_and_acked_deliveries_stay_done(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.sqlite'))
+    outbox.enqueue(records(1, 2), 'tophat', SINKS, subject_prefix='[Test] ')
+    claimed = outbox.claim('email', 'tophat', 10)
+    assert [item['record']['Id'] for item in claimed] == [r['Id'] for r in records(1, 2)]
+    assert claimed[0]['subject_prefix'] == '[Test] '
+    assert outbox.claim('email', 'tophat', 10) == []
+    assert len(outbox.claim('webhook', 'tophat', 10)) == 2
+    assert outbox.claim('email', 'apprenticeship', 10) == []
+
+    outbox.ack('email', [item['id'] for item in claimed])
+    assert outbox.recover('email', 'tophat') == 0
+    assert outbox.pending('tophat') == 2
+
+
+def test_recover_releases_claims_a_crash_left_behind(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite')
+    outbox = Outbox(path)
+    outbox.enqueue(records(1, 2), 'tophat', SINKS)
+    assert len(outbox.claim('email', 'tophat', 10)) == 2
+    outbox.close()
+
+    restarted = Outbox(path)
+    assert restarted.claim('email', 'tophat', 10) == []
+    assert restarted.recover('webhook', 'tophat') == 0
+    assert restarted.recover('email', 'tophat') == 2
+    assert len(restarted.claim('email', 'tophat', 10)) == 2
+
+
+def test_failed_delivery_waits_for_its_backoff(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.sqlite'))
+    outbox.enqueue(records(1), 'tophat', ['webhook'])
+    claimed = outbox.claim('webhook', 'tophat', 10)
+    outbox.fail('webhook', claimed, 'HTTP 503', lambda attempts: 3600)
+    assert outbox.claim('webhook', 'tophat', 10) == []
+    assert outbox.status()[0]['last_error'] == 'HTTP 503'
+
+    assert outbox.retry_now() == 1
+    retried = outbox.claim('webhook', 'tophat', 10)
+    assert retried[0]['attempts'] == 1
+
+
+def test_readonly_outbox_reports_without_writing(tmp_path):
+    path = tmp_path / 'outbox.sqlite'
+    Outbox(str(path)).enqueue(records(1), 'tophat', SINKS)
+    before = path.read_bytes()
+    assert Outbox(str(path), readonly=True).pending('tophat') == 2
+    assert path.read_bytes() == before
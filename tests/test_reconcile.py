@@ -0,0 +1,38 @@
+from tophat_reconcile import drift_offsets, offsets_to_refetch, reconcile
+
+PAGE_SIZE = 10
+
+
+def page(offset, total, duplicates=0):
+    return {'offset': offset, 'total': total, 'duplicates': duplicates}
+
+
+def test_stable_scan_has_no_drift():
+    log = [page(offset, 30) for offset in (0, 10, 20)]
+    report = reconcile(range(1, 31), range(1, 31), log, PAGE_SIZE)
+    assert report['removed_ids'] == []
+    assert not report['drift']
+    assert offsets_to_refetch(report) == []
+
+
+def test_removed_ids_and_where_they_sat():
+    fetched = [i for i in range(1, 31) if i not in (5, 25)]
+    report = reconcile(fetched, range(1, 31), [page(0, 28), page(10, 28), page(20, 28)], PAGE_SIZE)
+    assert report['removed_ids'] == ['0000000000005', '0000000000025']
+    # Newest first: Id 25 sits on the first page, Id 5 on the third
+    assert report['removed_offsets'] == [0, 20]
+
+
+def test_inserts_mid_scan_refetch_the_top_and_the_shifted_page():
+    log = [page(0, 30), page(10, 33, duplicates=3), page(20, 33)]
+    assert drift_offsets(log, PAGE_SIZE) == [0, 10]
+
+
+def test_deletes_mid_scan_refetch_around_the_page():
+    log = [page(0, 30), page(10, 30), page(20, 28)]
+    assert drift_offsets(log, PAGE_SIZE) == [10, 20]
+
+
+def test_refetch_is_capped_drift_first():
+    report = {'drift_offsets': [0, 10, 20], 'removed_offsets': [30, 40]}
+    assert offsets_to_refetch(report, max_pages=4) == [0, 10, 20, 30]
@@ -0,0 +1,26 @@
+from tophat_records import FilingRecord, ein_of, normalize_ein
+
+
+def test_normalize_ein_strips_dashes_and_pads_dropped_zeros():
+    assert normalize_ein('12-3456789') == '123456789'
+    assert normalize_ein('23456789') == '023456789'
+    assert normalize_ein(23456789) == '023456789'
+    assert normalize_ein(' 023456789 ') == '023456789'
+
+
+def test_normalize_ein_empty_values():
+    assert normalize_ein(None) is None
+    assert normalize_ein('') is None
+    assert normalize_ein('  ') is None
+
+
+def test_record_keeps_normalized_ein_and_the_value_as_sent():
+    record = FilingRecord.from_row({'Id': '0000000000042', 'DocId': '42', 'Ein': '23456789'})
+    assert record.ein == '023456789'
+    assert ein_of(record) == '023456789'
+    assert record.get('Ein') == '23456789'
+
+
+def test_ein_of_dict_and_record_agree():
+    row = {'Id': '0000000000042', 'DocId': '42', 'Ein': '02-3456789'}
+    assert ein_of(row) == ein_of(FilingRecord.from_row(row)) == '023456789'
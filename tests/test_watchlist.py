@@ -0,0 +1,78 @@
+from tophat_watchlist import WatchlistPoller
+
+TARGETS = [
+    {'ein': '012345678', 'employer_name': '', 'label': 'Acme (EIN)'},
+    {'ein': '', 'employer_name': 'Acme', 'label': 'Acme (name)'},
+]
+
+
+class FakeMonitor:
+    """Serves the same search results to every query and records what was sent"""
+
+    outbox = None
+
+    def __init__(self):
+        self.rows = []
+        self.sent = []
+        self.send_ok = True
+
+    def fetch_page(self, offset, employer_name='', plan_name='', ein=''):
+        return {'rows': [dict(row) for row in self.rows]}
+
+    def notify(self, records, subject_prefix='', key=None):
+        if self.send_ok:
+            self.sent.append([record['Id'] for record in records])
+        return self.send_ok
+
+
+def filing(record_id):
+    return {'Id': str(record_id).zfill(13), 'Ein': '12345678', 'Employer': 'Acme',
+            'DateReceived': '2026-03-01T10:00:00'}
+
+
+def poller(tmp_path, monitor):
+    return WatchlistPoller(monitor, TARGETS, state_file=str(tmp_path / 'watchlist.json'), rate=1000)
+
+
+def test_first_sweep_only_learns_existing_filings(tmp_path):
+    monitor = FakeMonitor()
+    monitor.rows = [filing(1)]
+    assert poller(tmp_path, monitor).sweep() == []
+    assert monitor.sent == []
+
+
+def test_filing_matching_two_targets_is_sent_once(tmp_path):
+    monitor = FakeMonitor()
+    monitor.rows = [filing(1)]
+    poller(tmp_path, monitor).sweep()
+    monitor.rows = [filing(2), filing(1)]
+
+    hits = poller(tmp_path, monitor).sweep()
+    assert [hit['Id'] for hit in hits] == [filing(2)['Id']]
+    assert monitor.sent == [[filing(2)['Id']]]
+    assert poller(tmp_path, monitor).sweep() == []
+    assert len(monitor.sent) == 1
+
+
+def test_failed_send_is_retried_next_sweep(tmp_path):
+    monitor = FakeMonitor()
+    monitor.rows = [filing(1)]
+    poller(tmp_path, monitor).sweep()
+    monitor.rows = [filing(2), filing(1)]
+    monitor.send_ok = False
+    poller(tmp_path, monitor).sweep()
+    assert monitor.sent == []
+
+    monitor.send_ok = True
+    poller(tmp_path, monitor).sweep()
+    assert monitor.sent == [[filing(2)['Id']]]
+
+
+def test_sweep_without_sending_marks_hits_seen(tmp_path):
+    monitor = FakeMonitor()
+    monitor.rows = [filing(1)]
+    poller(tmp_path, monitor).sweep()
+    monitor.rows = [filing(2), filing(1)]
+    assert len(poller(tmp_path, monitor).sweep(send_email_notification=False)) == 1
+    assert poller(tmp_path, monitor).sweep() == []
+    assert monitor.sent == []
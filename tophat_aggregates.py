@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+
+Filing counts kept up to date from each run's new records.
+
+Counts by DateReceived day/week/month, by sponsor state (reference file), by
+Efile and by nonprofit status are stored in a small JSON file next to the
+state file, so reports never reload a fetched_records dump.
+
+python tophat_aggregates.py report --by month --last 12
+python tophat_aggregates.py report --by state
+python tophat_aggregates.py rebuild --check --reference-file reference.csv --irs-index irs_eo_bmf.sqlite
+
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+from tophat_records import ein_of, received_of
+
+DIMENSIONS = ['day', 'week', 'month', 'state', 'efile', 'nonprofit']
+
+logger = logging.getLogger(__name__)
+
+
+def aggregates_path(state_file) -> Path:
+    state_file = Path(state_file)
+    return state_file.with_name(f"{state_file.stem}_aggregates.json")
+
+
+def _empty() -> Dict:
+    return {'records': 0, 'updated': None, **{dimension: {} for dimension in DIMENSIONS}}
+
+
+class FilingAggregates:
+
+    def __init__(self, filepath):
+        self.filepath = Path(filepath)
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        if self.filepath.exists():
+            try:
+                with open(self.filepath, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Couldn't load aggregates: {e}")
+        return _empty()
+
+    def save(self):
+        try:
+            tmp = self.filepath.with_name(self.filepath.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+            tmp.replace(self.filepath)
+        except Exception as e:
+            logger.error(f"Error saving aggregates: {e}")
+
+    def add(self, records: Iterable[Dict], state_of: Callable[[str], Optional[str]],
+            nonprofit_of: Callable[[str], Optional[bool]]) -> int:
+        """Count records into every dimension; returns how many were added"""
+        added = 0
+        data = self.data
+        for record in records:
+            keys = {'state': state_of(ein_of(record)) or 'unknown',
+                    'efile': str(record.get('Efile') if record.get('Efile') not in (None, '') else 'unknown')}
+            nonprofit = nonprofit_of(ein_of(record))
+            keys['nonprofit'] = 'unknown' if nonprofit is None else ('nonprofit' if nonprofit else 'for-profit')
+
+            received = received_of(record)
+            if received:
+                year, week, _ = received.isocalendar()
+                keys['day'] = received.date().isoformat()
+                keys['week'] = f"{year}-W{week:02d}"
+                keys['month'] = received.strftime('%Y-%m')
+            else:
+                keys['day'] = keys['week'] = keys['month'] = 'unknown'
+
+            for dimension, key in keys.items():
+                counts = data[dimension]
+                counts[key] = counts.get(key, 0) + 1
+            added += 1
+
+        data['records'] += added
+        data['updated'] = datetime.now().isoformat()
+        return added
+
+    def rebuild(self, records: Iterable[Dict], state_of, nonprofit_of) -> Dict:
+        """Recompute from scratch; returns the previous counts for comparison"""
+        previous = self.data
+        self.data = _empty()
+        self.add(records, state_of, nonprofit_of)
+        return previous
+
+    def report(self, dimension: str, last: Optional[int] = None) -> Dict[str, int]:
+        counts = self.data.get(dimension, {})
+        if dimension in ('day', 'week', 'month'):
+            keys = sorted(k for k in counts if k != 'unknown')
+            if last:
+                keys = keys[-last:]
+            return {key: counts[key] for key in keys}
+        return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True)[:last or None])
+
+
+def baseline_records(baseline_file) -> Iterable[Dict]:
+    """The baseline CSV already holds Id, Ein, DateReceived and Efile for every known filing"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+
+def main():
+    # Imported here: the monitor itself imports this module
+    import tophat_api_monitor
+    from tophat_api_monitor import TopHatAPIMonitor
+
+    parser = argparse.ArgumentParser(
+        description='Report or rebuild incremental TopHat filing aggregates'
+    )
+    parser.add_argument('command', choices=['report', 'rebuild'])
+    parser.add_argument('--state-file', default=tophat_api_monitor.STATE_FILE)
+    parser.add_argument('--baseline-file', default=tophat_api_monitor.BASELINE_FILE)
+    parser.add_argument('--output-dir', default=tophat_api_monitor.OUTPUT_DIR)
+    parser.add_argument('--reference-file', help='Reference CSV with EIN-to-address mappings (rebuild)')
+    parser.add_argument('--irs-index', help='IRS EO BMF index for nonprofit status (rebuild)')
+    parser.add_argument('--by', choices=DIMENSIONS, default='month', help='Dimension to report (default: month)')
+    parser.add_argument('--last', type=int, help='Only the last N periods (or top N values)')
+    parser.add_argument('--check', action='store_true',
+                        help='Rebuild, report differences from the incremental counts, and keep the rebuilt counts')
+
+    args = parser.parse_args()
+    tophat_api_monitor.configure_logging()
+
+    aggregates = FilingAggregates(aggregates_path(args.state_file))
+
+    if args.command == 'report':
+        counts = aggregates.report(args.by, args.last)
+        print(f"Filings by {args.by} ({aggregates.data['records']} counted, updated {aggregates.data['updated']})")
+        for key, count in counts.items():
+            print(f"  {key:<12} {count:>7}")
+        return 0
+
+    monitor = TopHatAPIMonitor(state_file=args.state_file, output_dir=args.output_dir,
+                               baseline_file=args.baseline_file, reference_file=args.reference_file,
+                               irs_index=args.irs_index)
+    previous = aggregates.rebuild(baseline_records(args.baseline_file),
+                                  monitor.state_of_ein, monitor.nonprofit_status)
+    aggregates.save()
+    logger.info(f"Rebuilt aggregates from {aggregates.data['records']} baseline records")
+
+    if args.check:
+        mismatches = 0
+        for dimension in DIMENSIONS:
+            old, new = previous.get(dimension, {}), aggregates.data[dimension]
+            for key in sorted(set(old) | set(new)):
+                if old.get(key, 0) != new.get(key, 0):
+                    mismatches += 1
+                    print(f"{dimension} {key}: incremental {old.get(key, 0)}, rebuilt {new.get(key, 0)}")
+        print(f"{mismatches} mismatched count(s)")
+        return 1 if mismatches else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+
+Online statistics for spotting unusual runs: filing volume spikes and API misbehaviour.
+
+Per metric, a running mean/variance (Welford) is kept overall, per weekday and per
+weekday+hour of the run. Each run is scored against the most specific bucket with
+enough history, then folded in, so an update is O(1) whatever the run count.
+
+"""
+
+import json
+import logging
+import math
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MIN_SAMPLES = 8     # Observations a bucket needs before it is used for scoring
+Z_THRESHOLD = 3.5
+MIN_STD = 1e-6
+RELATIVE_STD_FLOOR = 0.1  # A bucket's spread is taken as at least this share of its mean
+
+# Smallest spread worth scoring against, in the metric's own units: a bucket that was
+# always 0 new filings shouldn't make 2 new filings a six-figure z-score
+STD_FLOORS = {
+    'new_records': 1.0,
+    'total_delta': 1.0,
+    'page_latency': 0.05,
+}
+
+METRIC_LABELS = {
+    'new_records': 'New filings',
+    'page_latency': 'Average page latency (s)',
+    'total_delta': 'Change in API total',
+}
+
+logger = logging.getLogger(__name__)
+
+
+def stats_path(state_file) -> Path:
+    state_file = Path(state_file)
+    return state_file.with_name(f"{state_file.stem}_stats.json")
+
+
+def welford_update(entry: Dict, value: float):
+    entry['n'] = entry.get('n', 0) + 1
+    delta = value - entry.get('mean', 0.0)
+    entry['mean'] = entry.get('mean', 0.0) + delta / entry['n']
+    entry['m2'] = entry.get('m2', 0.0) + delta * (value - entry['mean'])
+
+
+def std_of(entry: Dict) -> float:
+    if entry.get('n', 0) < 2:
+        return 0.0
+    return math.sqrt(entry['m2'] / (entry['n'] - 1))
+
+
+def buckets_for(when: datetime) -> List[str]:
+    """Most specific first"""
+    return [f"wd{when.weekday()}h{when.hour:02d}", f"wd{when.weekday()}", 'all']
+
+
+class AnomalyDetector:
+
+    def __init__(self, filepath, min_samples: int = MIN_SAMPLES, z_threshold: float = Z_THRESHOLD):
+        self.filepath = Path(filepath)
+        self.min_samples = min_samples
+        self.z_threshold = z_threshold
+        self.metrics = self._load()
+
+    def _load(self) -> Dict:
+        if self.filepath.exists():
+            try:
+                with open(self.filepath, 'r') as f:
+                    return json.load(f).get('metrics', {})
+            except Exception as e:
+                logger.warning(f"Couldn't load run statistics: {e}")
+        return {}
+
+    def save(self):
+        try:
+            tmp = self.filepath.with_name(self.filepath.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'updated': datetime.now().isoformat(), 'metrics': self.metrics}, f, indent=2)
+            tmp.replace(self.filepath)
+        except Exception as e:
+            logger.error(f"Error saving run statistics: {e}")
+
+    def score(self, metric: str, value: float, when: datetime) -> Optional[Dict]:
+        """z-score against the most specific bucket with enough history (None while learning)"""
+        buckets = self.metrics.get(metric, {})
+        for bucket in buckets_for(when):
+            entry = buckets.get(bucket)
+            if entry and entry['n'] >= self.min_samples:
+                measured = std_of(entry)
+                floor = STD_FLOORS.get(metric, MIN_STD)
+                std = max(measured, floor, RELATIVE_STD_FLOOR * abs(entry['mean']))
+                # floored: the history had (almost) no spread, so z says little about how unusual this is
+                return {'z': (value - entry['mean']) / std, 'mean': entry['mean'],
+                        'std': std, 'bucket': bucket, 'floored': measured < floor}
+        return None
+
+    def check(self, observations: Dict[str, float], when: datetime) -> Dict[str, Dict]:
+        """Outlying observations, keyed by metric"""
+        outliers = {}
+        for metric, value in observations.items():
+            result = self.score(metric, value, when)
+            if result and abs(result['z']) >= self.z_threshold:
+                outliers[metric] = dict(result, value=value)
+        return outliers
+
+    def observe(self, observations: Dict[str, float], when: datetime):
+        for metric, value in observations.items():
+            buckets = self.metrics.setdefault(metric, {})
+            for bucket in buckets_for(when):
+                welford_update(buckets.setdefault(bucket, {}), value)
+
+
+def describe(metric: str, outlier: Dict) -> str:
+    label = METRIC_LABELS.get(metric, metric)
+    return (f"{label} {outlier['value']:,.2f} vs usual {outlier['mean']:,.2f} "
+            f"± {outlier['std']:,.2f} (z={outlier['z']:+.1f}, {outlier['bucket']})")
@@ -9,18 +9,36 @@ import argparse
 import csv
 import json
 import logging
-import os
-import smtplib
 import sys
+import threading
 import time
 from datetime import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from pathlib import Path
-from typing import Dict, List, Optional, Set
-from urllib.parse import urlencode
-
-import requests
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set
+from urllib.parse import quote, urlencode
+
+# requests, smtplib/email.mime, pyarrow and the profilers are imported by the stage
+# that needs them, so --status and polls that find nothing start quickly
+if TYPE_CHECKING:
+    import requests
+
+from tophat_aggregates import FilingAggregates, aggregates_path, baseline_records
+from tophat_anomaly import AnomalyDetector, describe as describe_anomaly, stats_path
+from tophat_archive import RUN_ID_FORMAT, PageArchive
+from tophat_catalog import OutputCatalog
+from tophat_external import ExternalIndex
+from tophat_history import SnapshotStore
+from tophat_irs import IRSExemptIndex, propublica_url
+from tophat_logging import LOG_BACKUPS, LOG_FORMATS, LOG_MAX_BYTES, configure_logging as setup_logging, set_run_id
+from tophat_outbox import OUTBOX_FILE, Dispatcher, EmailSink, FeedSink, Outbox, WebhookSink
+from tophat_pdfs import PDF_CHECK_BUDGET, PdfIndex, PdfVerifier
+from tophat_pipeline import ScanPipeline
+from tophat_profile import PROFILE_MODES
+from tophat_query import HistoryIndex
+from tophat_reconcile import offsets_to_refetch, reconcile
+from tophat_records import (FilingRecord, as_dicts, copy_record, normalize_ein, doc_id_of, ein_of, id_of,
+                            received_of)
+from tophat_validate import RowValidator
 
 
 # Configuration
@@ -28,103 +46,263 @@ BASE_URL = "https://www.askebsa.dol.gov/tophatplansearch/Home/Search"
 RECORDS_PER_PAGE = 100
 REQUEST_DELAY = 1.0  # Seconds between requests
 PROPUBLICA_DELAY = 0.5 
+PROPUBLICA_API_URL = "https://projects.propublica.org/nonprofits/api/v2/organizations/{ein}.json"
 STATE_FILE = "tophat_monitor_state.json"
 BASELINE_FILE = "tophat_baseline.csv"
 OUTPUT_DIR = "tophat_data"
 LOG_FILE = "tophat_monitor.log"
 AUTO_CLEANUP_KEEP = 2
+DEFAULT_FORM_TYPE = "tophat"
+FORM_TYPES = {  # search form_type value -> label used in PDF links and digests
+    'tophat': 'Top Hat',
+    'apprenticeship': 'Apprenticeship',
+}
+FAST_LANE_MAX_PAGES = 10  # All-new leading pages past this means a lost baseline, not news
+DIGEST_MAX_RECORDS = 2000  # Larger digests are held back (lost baseline, bulk load); 0 = no limit
+DIGEST_OUTLIER_MIN = 500   # An outlying new-filing count this large is also held back
 
-# Set up logger
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
-class TopHatAPIMonitor:
-    
-    def __init__(self, state_file: str = STATE_FILE, output_dir: str = OUTPUT_DIR, 
-                 baseline_file: str = BASELINE_FILE, email_config: Optional[Dict] = None,
-                 reference_file: Optional[str] = None, keep_files: int = AUTO_CLEANUP_KEEP):
-        self.state_file = Path(state_file)
-        self.output_dir = Path(output_dir)
-        self.baseline_file = Path(baseline_file)
-        self.output_dir.mkdir(exist_ok=True)
-        self.email_config = email_config or {}
-        self.reference_file = Path(reference_file) if reference_file else None
-        self.keep_files = keep_files
-        
+def configure_logging(log_file: str = LOG_FILE, log_format: str = 'json', max_bytes: int = LOG_MAX_BYTES,
+                      backups: int = LOG_BACKUPS, rotate_daily: bool = False):
+    """Log to the (rotating) log file and stdout; called by the command-line entry points, not on import"""
+    setup_logging(log_file, log_format=log_format, max_bytes=max_bytes, backups=backups,
+                  rotate_when='midnight' if rotate_daily else None)
 
 
-        self.ein_to_address = {}
-        if self.reference_file and self.reference_file.exists():
-            self._load_reference_data()
-        
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'TopHat-Monitor/1.0'
-        })
-        
-    def _load_reference_data(self):
+class RateLimiter:
+    """Thread-safe minimum interval between requests"""
 
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_at = 0.0
 
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
 
 
-        try:
-            logger.info(f"Loading reference data from {self.reference_file}")
-            with open(self.reference_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
+def create_session(pool_size: int = 10) -> 'requests.Session':
+    """HTTP session (one connection pool) that several monitors can share"""
+    import requests
+    
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': 'TopHat-Monitor/1.0'
+    })
+    return session
+
+
+def load_reference_addresses(reference_file) -> Dict[str, Dict]:
+    """EIN -> mailing address from a Form 5500 reference CSV"""
+    ein_to_address = {}
+    try:
+        logger.info(f"Loading reference data from {reference_file}")
+        with open(reference_file, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                ein = row.get('SPONS_DFE_EIN_9DIGIT') or row.get('SPONS_DFE_EIN_FLOAT')
+                if ein:
+                    ein_clean = normalize_ein(ein)
+                    address_info = {
+                        'name': row.get('SPONSOR_DFE_NAME (SPONS_DFE_DBA_NAME)', '').strip(),
+                        'address1': row.get('SPONS_DFE_MAIL_US_ADDRESS1', '').strip(),
+                        'address2': row.get('SPONS_DFE_MAIL_US_ADDRESS2', '').strip(),
+                        'city': row.get('SPONS_DFE_MAIL_US_CITY', '').strip(),
+                        'state': row.get('SPONS_DFE_MAIL_US_STATE', '').strip(),
+                        'zip': row.get('SPONS_DFE_MAIL_US_ZIP', '').strip()
+                    }
+                    if any([address_info['address1'], address_info['city'], 
+                           address_info['state'], address_info['zip']]):
+                        ein_to_address[ein_clean] = address_info
+        logger.info(f"Loaded {len(ein_to_address)} EIN-to-address mappings")
+    except Exception as e:
+        logger.error(f"Error loading reference data: {e}")
+        return {}
+    return ein_to_address
 
 
+def pdf_link(record_id: str, form_label: str = FORM_TYPES[DEFAULT_FORM_TYPE]) -> str:
+    multizero_id = str(record_id).zfill(13)
+    return f"https://www.askebsa.dol.gov/tophatplansearch/Home/DownloadPdf?id={multizero_id}&form_type={quote(form_label)}"
 
-                    ein = row.get('SPONS_DFE_EIN_9DIGIT') or row.get('SPONS_DFE_EIN_FLOAT')
-                    
-                    if ein:
 
+def form_type_paths(form_type: str, state_file: str, output_dir: str, baseline_file: str) -> Dict[str, str]:
+    """Per-form-type state, output and baseline paths; the default form type keeps the plain names"""
+    if form_type == DEFAULT_FORM_TYPE:
+        return {'state_file': state_file, 'output_dir': output_dir, 'baseline_file': baseline_file}
+    state_path = Path(state_file)
+    baseline_path = Path(baseline_file)
+    return {
+        'state_file': str(state_path.with_name(f"{state_path.stem}_{form_type}{state_path.suffix}")),
+        'output_dir': str(Path(output_dir) / form_type),
+        'baseline_file': str(baseline_path.with_name(f"{baseline_path.stem}_{form_type}{baseline_path.suffix}")),
+    }
 
 
-                        ein_clean = str(ein).strip().replace('-', '')
-                        
+class DeliveryOptions:
+    """Durable outbox and the webhook/feed sinks it delivers to besides email"""
+    SETTINGS = {'outbox', 'webhook_url', 'feed_file'}  # Option names, also accepted in --profiles
+    
+    def __init__(self, outbox_file: Optional[str] = None, webhook_url: Optional[str] = None,
+                 feed_file: Optional[str] = None):
+        self.outbox_file = outbox_file
+        self.webhook_url = webhook_url
+        self.feed_file = feed_file
+    
+    @classmethod
+    def from_settings(cls, settings, form_type: str) -> 'DeliveryOptions':
+        # A webhook or feed needs an outbox to deliver from
+        outbox_file = settings.outbox or (OUTBOX_FILE if settings.webhook_url or settings.feed_file else None)
+        return cls(outbox_file, settings.webhook_url, namespaced_file(settings.feed_file, form_type))
 
 
-                        address_info = {
-                            'name': row.get('SPONSOR_DFE_NAME (SPONS_DFE_DBA_NAME)', '').strip(),
-                            'address1': row.get('SPONS_DFE_MAIL_US_ADDRESS1', '').strip(),
-                            'address2': row.get('SPONS_DFE_MAIL_US_ADDRESS2', '').strip(),
-                            'city': row.get('SPONS_DFE_MAIL_US_CITY', '').strip(),
-                            'state': row.get('SPONS_DFE_MAIL_US_STATE', '').strip(),
-                            'zip': row.get('SPONS_DFE_MAIL_US_ZIP', '').strip()
-                        }
-                        
+class SnapshotOptions:
+    """Where each run's full result set is kept: Parquet snapshots and/or the delta history"""
+    SETTINGS = {'columnar_dir', 'history_dir'}
+    
+    def __init__(self, columnar_dir: Optional[str] = None, history_dir: Optional[str] = None):
+        self.columnar_dir = columnar_dir
+        self.history_dir = history_dir
+    
+    @classmethod
+    def from_settings(cls, settings, form_type: str) -> 'SnapshotOptions':
+        return cls(namespaced_dir(settings.columnar_dir, form_type), namespaced_dir(settings.history_dir, form_type))
 
 
-                        if any([address_info['address1'], address_info['city'], 
-                               address_info['state'], address_info['zip']]):
-                            self.ein_to_address[ein_clean] = address_info
-            
-            logger.info(f"Loaded {len(self.ein_to_address)} EIN-to-address mappings")
-            
-        except Exception as e:
-            logger.error(f"Error loading reference data: {e}")
-            self.ein_to_address = {}
+class PdfOptions:
+    """PDF index and how many PDF requests a run may spend re-verifying filings"""
+    
+    def __init__(self, index_file: Optional[str] = None, check_budget: int = PDF_CHECK_BUDGET):
+        self.index_file = index_file
+        self.check_budget = check_budget
 
 
+# Settings a --profiles entry may override (same names as the command-line options)
+PROFILE_OPTIONS = {
+    'name', 'state_file', 'output_dir', 'baseline_file', 'email_config', 'reference_file',
+    'keep_files', 'keep_days', 'max_output_mb', 'max_digest_records', 'irs_index', 'external_index',
+} | DeliveryOptions.SETTINGS | SnapshotOptions.SETTINGS
 
 
+class TopHatAPIMonitor:
+    
+    def __init__(self, state_file: str = STATE_FILE, output_dir: str = OUTPUT_DIR, 
+                 baseline_file: str = BASELINE_FILE, email_config: Optional[Dict] = None,
+                 reference_file: Optional[str] = None, keep_files: int = AUTO_CLEANUP_KEEP,
+                 snapshots: Optional[SnapshotOptions] = None, fast_lane: bool = False, pipeline: bool = False,
+                 form_type: str = DEFAULT_FORM_TYPE, session: Optional['requests.Session'] = None,
+                 rate_limiter: Optional[RateLimiter] = None, archive_dir: Optional[str] = None,
+                 irs_index: Optional[str] = None, external_index: Optional[str] = None,
+                 delivery: Optional[DeliveryOptions] = None, pdfs: Optional[PdfOptions] = None,
+                 keep_days: Optional[int] = None, max_output_bytes: Optional[int] = None,
+                 max_digest_records: int = DIGEST_MAX_RECORDS, profile: Optional[str] = None,
+                 profile_name: Optional[str] = None):
+        snapshots = snapshots or SnapshotOptions()
+        delivery = delivery or DeliveryOptions()
+        pdfs = pdfs or PdfOptions()
+        self.state_file = Path(state_file)
+        self.aggregates = FilingAggregates(aggregates_path(state_file))
+        self.anomaly_detector = AnomalyDetector(stats_path(state_file))
+        self.max_digest_records = max_digest_records
+        self.run_assessment: Optional[Dict] = None
+        self.profile = profile  # 'full' or 'sample' (tophat_profile)
+        self.profiler = None  # RunProfiler while a profiled run is in progress
+        self.profile_name = profile_name  # --profiles entry (desk) this monitor serves
+        self.keep_records = False  # Return the full scan from run() even in pipeline mode
+        self.latency_sum = 0.0
+        self.latency_pages = 0
+        self.scan_complete = False  # The last scan reached the end of the results
+        self.early_alerted_ids: Set[str] = set()  # Fast-lane emails not yet in the baseline
+        self.output_dir = Path(output_dir)
+        self.baseline_file = Path(baseline_file)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.email_config = email_config or {}
+        self.reference_file = Path(reference_file) if reference_file else None
+        self.keep_files = keep_files
+        self.keep_days = keep_days
+        self.max_output_bytes = max_output_bytes
+        self.catalog = OutputCatalog(self.output_dir)
+        self.run_id = datetime.now().strftime(RUN_ID_FORMAT)
+        self.columnar_writer = None
+        if snapshots.columnar_dir:
+            from tophat_columnar import ColumnarSnapshotWriter  # pulls in pyarrow
+            self.columnar_writer = ColumnarSnapshotWriter(snapshots.columnar_dir)
+        self.history_store = SnapshotStore(snapshots.history_dir) if snapshots.history_dir else None
+        self.history_index = HistoryIndex(snapshots.history_dir) if snapshots.history_dir else None
+        self.fast_lane = fast_lane
+        self.pipeline = pipeline
+        self.form_type = form_type
+        self.form_label = FORM_TYPES.get(form_type, form_type)
+        self.rate_limiter = rate_limiter
+        self.archive = PageArchive(archive_dir) if archive_dir else None
+        self.replay = None  # ArchiveReplay while reprocessing an archived run
+        self.irs_index = IRSExemptIndex(irs_index) if irs_index else None
+        self.external_index = ExternalIndex(external_index) if external_index else None
+        self.pdf_index = PdfIndex(pdfs.index_file) if pdfs.index_file else None
+        self.pdf_check_budget = pdfs.check_budget
+        
+
+
+        self.ein_to_address = {}
+        if self.reference_file and self.reference_file.exists():
+            self._load_reference_data()
+        
+        self.page_log: List[Dict] = []
+        self.validator = RowValidator()
+        self.propublica_cache: Dict[str, Optional[str]] = {}
+        
+        self._session = session
+        
+        # Durable outbox: alerts are queued before the baseline moves, then delivered per sink
+        self.outbox = Outbox(delivery.outbox_file) if delivery.outbox_file else None
+        self.dispatcher = None
+        if self.outbox:
+            sinks = []
+            if self.email_config:
+                sinks.append(EmailSink(self))
+            if delivery.webhook_url:
+                sinks.append(WebhookSink(delivery.webhook_url, self, form_type))
+            if delivery.feed_file:
+                sinks.append(FeedSink(delivery.feed_file, self))
+            self.dispatcher = Dispatcher(self.outbox, sinks, form_type)
+        
+    def _load_reference_data(self):
+        self.ein_to_address = load_reference_addresses(self.reference_file)
+    
     def get_address_for_ein(self, ein: str) -> Optional[Dict]:
 
         if not ein:
             return None
         
-        ein_clean = str(ein).strip().replace('-', '')
-        
-        return self.ein_to_address.get(ein_clean)
+        return self.ein_to_address.get(normalize_ein(ein))
+    
+    def state_of_ein(self, ein: str) -> Optional[str]:
+        address_info = self.get_address_for_ein(ein)
+        return (address_info.get('state') or None) if address_info else None
+    
+    def nonprofit_status(self, ein: str) -> Optional[bool]:
+        """True/False from the IRS index, else None (not ProPublica answers, which depend on what
+        this process happened to look up, so a rebuild couldn't reproduce them)"""
+        if not ein or not self.irs_index:
+            return None
+        return self.irs_index.contains(ein)
+    
+    @property
+    def session(self) -> 'requests.Session':
+        """Created on first use, so runs that never reach the network don't import requests"""
+        if self._session is None:
+            self._session = create_session()
+        return self._session
     
     def check_propublica_nonprofit(self, ein: str) -> Optional[str]:
 
@@ -134,18 +312,29 @@ class TopHatAPIMonitor:
         
         """
 
-        if not ein:
+        ein_clean = normalize_ein(ein)
+        if not ein_clean:
             return None
         
-        ein_clean = str(ein).strip().replace('-', '')
+        # The HTML and text digests (and the pipeline's enrich stage) ask for the same EINs
+        if ein_clean in self.propublica_cache:
+            return self.propublica_cache[ein_clean]
+        
+        # Local EO BMF index first; the API is only asked about EINs it doesn't list
+        if self.irs_index and self.irs_index.contains(ein_clean):
+            url = propublica_url(ein_clean)
+            self.propublica_cache[ein_clean] = url
+            return url
         
-        api_url = f"https://projects.propublica.org/nonprofits/api/v2/organizations/{ein_clean}.json"
+        import requests
+        
+        api_url = PROPUBLICA_API_URL.format(ein=ein_clean)
 
 
 
 
         try:
-            logger.debug(f"Checking ProPublica API for EIN {ein_clean}")
+            logger.debug(f"Checking ProPublica API for EIN {ein_clean}", extra={'rate_limit': 'ein'})
             response = self.session.get(api_url, timeout=10)
 
 
@@ -155,17 +344,19 @@ class TopHatAPIMonitor:
 
                 if data.get('organization'):
 
-                    propublica_url = f"https://projects.propublica.org/nonprofits/organizations/{ein_clean}"
-                    logger.debug(f"Found nonprofit data for EIN {ein_clean}")
+                    url = propublica_url(ein_clean)
+                    logger.debug(f"Found nonprofit data for EIN {ein_clean}", extra={'rate_limit': 'ein_found'})
+                    self.propublica_cache[ein_clean] = url
                     time.sleep(PROPUBLICA_DELAY)
-                    return propublica_url
+                    return url
 
 
 
 
             # 404 means nonprofit not found
             elif response.status_code == 404:
-                logger.debug(f"No nonprofit data for EIN {ein_clean}")
+                logger.debug(f"No nonprofit data for EIN {ein_clean}", extra={'rate_limit': 'ein_missing'})
+                self.propublica_cache[ein_clean] = None
                 time.sleep(PROPUBLICA_DELAY)
                 return None
             
@@ -253,7 +444,7 @@ class TopHatAPIMonitor:
         
         try:
 
-            sorted_records = sorted(records, key=lambda x: str(x.get('Id', '')))
+            sorted_records = sorted(records, key=id_of)
             
             with open(self.baseline_file, 'w', newline='', encoding='utf-8') as f:
                 fieldnames = ['Id', 'DocId', 'Employer', 'Ein', 'PlanName', 'DateReceived', 'Efile']
@@ -283,75 +474,41 @@ class TopHatAPIMonitor:
 
 
     def cleanup_old_files(self):
-
-        if self.keep_files <= 0:
+        """Apply the retention policy to catalogued output files"""
+        if self.keep_files <= 0 and self.keep_days is None and self.max_output_bytes is None:
             logger.debug("Auto-cleanup disabled (keep_files <= 0)")
             return
         
         logger.info(f"Running auto-cleanup: keeping {self.keep_files} most recent file sets")
         
-        patterns = [
-            'fetched_records_*.csv',
-            'fetched_records_*.json',
-            'new_records_*.csv',
-            'new_records_*.json',
-        ]
-        
-        total_deleted = 0
-        
-        for pattern in patterns:
-            try:
-
-                files_with_timestamps = []
-                for filepath in self.output_dir.glob(pattern):
-                    try:
-
-                        filename = filepath.stem
-                        parts = filename.split('_')
-                        if len(parts) >= 3:
-                            date_part = parts[-2]
-                            time_part = parts[-1]
-                            timestamp_str = f"{date_part}_{time_part}"
-                            timestamp = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
-                            files_with_timestamps.append((filepath, timestamp))
-                    except (ValueError, IndexError):
-                        continue
-                
-
-                files_with_timestamps.sort(key=lambda x: x[1], reverse=True)
-              
-
-
-                
-
-                files_to_delete = files_with_timestamps[self.keep_files:]
-                for filepath, timestamp in files_to_delete:
-                    try:
-                        filepath.unlink()
-                        logger.debug(f"Deleted old file: {filepath.name}")
-                        total_deleted += 1
-                    except Exception as e:
-                        logger.warning(f"Could not delete {filepath.name}: {e}")
-                
-            except Exception as e:
-                logger.warning(f"Error during cleanup of {pattern}: {e}")
+        try:
+            results = self.catalog.apply(keep_count=self.keep_files if self.keep_files > 0 else None,
+                                         max_age_days=self.keep_days,
+                                         max_bytes=self.max_output_bytes)
+        except Exception as e:
+            logger.warning(f"Error during cleanup: {e}")
+            return
         
+        total_deleted = sum(r['deleted'] for r in results.values())
         if total_deleted > 0:
             logger.info(f"Cleanup complete: deleted {total_deleted} old files")
         else:
             logger.info("Cleanup done: no old files to delete")
-
-
-
-
+    
     def generate_pdf_link(self, record_id: str) -> str:
-        multizero_id = str(record_id).zfill(13)
-        return f"https://www.askebsa.dol.gov/tophatplansearch/Home/DownloadPdf?id={multizero_id}&form_type=Top%20Hat"
+        return pdf_link(record_id, self.form_label)
     
     def create_email_html(self, new_records: List[Dict]) -> str:
 
 
-        sorted_records = sorted(new_records, key=lambda x: int(x.get('DocId', 0) or 0), reverse=True)
+        sorted_records = sorted(new_records, key=doc_id_of, reverse=True)
+        
+        # Unusual volume or API behaviour on this run (tophat_anomaly)
+        anomaly_flags = (self.run_assessment or {}).get('flags', [])
+        anomaly_html = ''
+        if anomaly_flags:
+            anomaly_html = ('<div class="external-flags"><strong>Unusual run:</strong><br>'
+                            + '<br>'.join(anomaly_flags) + '</div>')
 
 
 
@@ -440,6 +597,14 @@ class TopHatAPIMonitor:
                 .nonprofit-icon {{
                     margin-right: 5px;
                 }}
+                .external-flags {{
+                    background-color: #fff3e0;
+                    padding: 10px;
+                    margin: 10px 0;
+                    border-left: 3px solid #ff9800;
+                    border-radius: 3px;
+                    font-size: 14px;
+                }}
                 .pdf-link {{
                     display: inline-block;
                     margin-top: 10px;
@@ -473,6 +638,7 @@ class TopHatAPIMonitor:
                 <p><strong>{len(new_records)}</strong> new TopHat filings detected</p>
                 <p><strong>Date:</strong> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
             </div>
+            {anomaly_html}
             
             <h2>New Filings</h2>
         """
@@ -485,13 +651,10 @@ class TopHatAPIMonitor:
             plan_name = record.get('PlanName', 'N/A') or 'Not specified'
             date_received = record.get('DateReceived', 'N/A')
             
-            # Format date
-            if date_received and 'T' in date_received:
-                try:
-                    dt = datetime.fromisoformat(date_received.replace('Z', '+00:00'))
-                    date_received = dt.strftime('%B %d, %Y at %I:%M %p')
-                except:
-                    pass
+            # Format date (already parsed on FilingRecord)
+            received = received_of(record)
+            if received:
+                date_received = received.strftime('%B %d, %Y at %I:%M %p')
             
             pdf_link = self.generate_pdf_link(record_id)
             
@@ -499,10 +662,10 @@ class TopHatAPIMonitor:
 
 
             # Get address information, via reference.csv
-            address_info = self.get_address_for_ein(ein)
+            address_info = self.get_address_for_ein(ein_of(record))
             
             # Check ProPublica Nonprofit Explorer
-            propublica_url = self.check_propublica_nonprofit(ein)
+            propublica_url = self.check_propublica_nonprofit(ein_of(record))
 
 
 
@@ -555,6 +718,15 @@ class TopHatAPIMonitor:
             else:
                 nonprofit_html = ''
             
+            # Watchlist target (tophat_watchlist.py), PPP loans / WARN notices near the filing date
+            # (--external-index), PDF changes (--pdf-index)
+            flags = ([f"Watchlist: {record['WatchLabel']}"] if record.get('WatchLabel') else []) + \
+                ([record['PdfChange']] if record.get('PdfChange') else []) + (record.get('ExternalFlags') or [])
+            if flags:
+                flags_html = '<div class="external-flags">' + '<br>'.join(flags) + '</div>'
+            else:
+                flags_html = ''
+            
             html += f"""
             <div class="record">
                 <div class="field">
@@ -571,6 +743,7 @@ class TopHatAPIMonitor:
                 </div>
                 {address_html}
                 {nonprofit_html}
+                {flags_html}
                 <div class="field">
                     <span class="label">Plan Name:</span>
                     <span class="value">{plan_name}</span>
@@ -598,7 +771,7 @@ class TopHatAPIMonitor:
         
         return html
     
-    def send_email(self, new_records: List[Dict]) -> bool:
+    def send_email(self, new_records: List[Dict], subject_prefix: str = '') -> bool:
         """Send email digest of new records"""
         if not self.email_config:
             logger.warning("Email configuration not provided, skipping email")
@@ -608,6 +781,10 @@ class TopHatAPIMonitor:
             logger.info("No new records to email")
             return True
         
+        import smtplib
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        
         try:
             # Extract email configuration
             smtp_server = self.email_config.get('smtp_server')
@@ -622,7 +799,9 @@ class TopHatAPIMonitor:
             
             # Create message
             msg = MIMEMultipart('alternative')
-            msg['Subject'] = f"TopHat Monitor: {len(new_records)} New Filing(s) Detected"
+            if self.form_type != DEFAULT_FORM_TYPE:
+                subject_prefix += f"[{self.form_label}] "
+            msg['Subject'] = f"{subject_prefix}TopHat Monitor: {len(new_records)} New Filing(s) Detected"
             msg['From'] = sender_email
             msg['To'] = ', '.join(recipient_emails)
             
@@ -634,11 +813,11 @@ class TopHatAPIMonitor:
 TopHat Filing Monitor - New Filings Digest
 
 {len(new_records)} new TopHat filings detected on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-
+{''.join(f"Unusual run: {flag}{chr(10)}" for flag in (self.run_assessment or {}).get('flags', []))}
 New Filings:
 {'='*60}
 """
-            for record in sorted(new_records, key=lambda x: int(x.get('DocId', 0) or 0), reverse=True):
+            for record in sorted(new_records, key=doc_id_of, reverse=True):
                 ein = record.get('Ein', 'N/A')
                 text_content += f"""
 DocId: {record.get('DocId', 'N/A')}
@@ -646,7 +825,7 @@ Employer: {record.get('Employer', 'N/A')}
 EIN: {ein}
 """
                 # Add address if available
-                address_info = self.get_address_for_ein(ein)
+                address_info = self.get_address_for_ein(ein_of(record))
                 if address_info:
                     text_content += "Address:\n"
                     if address_info.get('address1'):
@@ -668,10 +847,17 @@ EIN: {ein}
                     text_content += "Address: Not available in reference file\n"
                 
                 # Check ProPublica nonprofit data
-                propublica_url = self.check_propublica_nonprofit(ein)
+                propublica_url = self.check_propublica_nonprofit(ein_of(record))
                 if propublica_url:
                     text_content += f"Nonprofit Profile: {propublica_url}\n"
                 
+                if record.get('WatchLabel'):
+                    text_content += f"Watchlist: {record['WatchLabel']}\n"
+                if record.get('PdfChange'):
+                    text_content += f"PDF: {record['PdfChange']}\n"
+                for flag in record.get('ExternalFlags') or []:
+                    text_content += f"Flag: {flag}\n"
+                
                 text_content += f"""Plan Name: {record.get('PlanName', 'Not specified') or 'Not specified'}
 Date Received: {record.get('DateReceived', 'N/A')}
 PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
@@ -689,7 +875,8 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
             logger.info(f"Sending email to {len(recipient_emails)} recipient(s)")
             
             with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
+                if self.email_config.get('smtp_starttls', True):
+                    server.starttls()
                 server.login(sender_email, sender_password)
                 server.send_message(msg)
             
@@ -700,15 +887,153 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
             logger.error(f"Error sending email: {e}")
             return False
     
-    def fetch_page(self, offset: int = 0) -> Optional[Dict]:
-
-
-
+    def notify(self, records: List[Dict], subject_prefix: str = '',
+               key: Optional[Callable[[Dict], str]] = None) -> bool:
+        """Queue records in the outbox if there is one, otherwise email them now
+        (key: outbox dedupe key when one record can alert more than once)"""
+        if not self.outbox:
+            return self.send_email(records, subject_prefix=subject_prefix)
+        if not self.dispatcher.sinks:
+            logger.warning("Outbox has no sinks configured, skipping notification")
+            return False
+        queued = self.outbox.enqueue(records, self.form_type, self.dispatcher.sink_names, subject_prefix,
+                                     key=key)
+        logger.info(f"Outbox: queued {queued} record(s) for {', '.join(self.dispatcher.sink_names)}")
+        self.dispatcher.wake()
+        return True
+    
+    def queue_alerts(self, new_records: List[Dict], fast_lane: Optional['FastLane'] = None):
+        """Write this run's alerts to the outbox; called before the baseline is replaced"""
+        if fast_lane:
+            fast_lane.wait()
+        alert_records = [r for r in new_records if r.get('Id') not in self.early_alerted_ids
+                         and (not fast_lane or r.get('Id') not in fast_lane.alerted_ids)]
+        if not alert_records:
+            return
+        self.notify(self.annotate_alerts(alert_records))
+    
+    def annotate_alerts(self, records: List[Dict]) -> List[Dict]:
+        """Copies of records with their ExternalFlags; the scanned records stay as fetched"""
+        alerts = [copy_record(record) for record in records]
+        if self.external_index:
+            try:
+                flagged = self.external_index.annotate(alerts)
+                logger.info(f"External datasets: flagged {flagged} of {len(alerts)} new records")
+            except Exception as e:
+                logger.error(f"Error joining external datasets: {e}")
+        return alerts
+    
+    def assess_run(self, new_records: List[Dict], page_log: List[Dict], state: Dict,
+                   when: datetime) -> Dict:
+        """Score this run's volume and API behaviour against history; decides digest suppression"""
+        observations = {'new_records': len(new_records)}
+        if self.latency_pages:
+            observations['page_latency'] = self.latency_sum / self.latency_pages
+        api_total = page_log[-1]['total'] if page_log else None
+        previous_total = state.get('api_total')
+        if api_total is not None and previous_total is not None:
+            observations['total_delta'] = api_total - previous_total
+        
+        outliers = self.anomaly_detector.check(observations, when)
+        flags = [describe_anomaly(metric, outlier) for metric, outlier in outliers.items()]
+        if api_total is not None and previous_total is not None and api_total < previous_total:
+            flags.append(f"API total dropped from {previous_total} to {api_total}")
+        # Every page but the last should be full
+        short_pages = sum(1 for page in page_log[:-1] if page['rows'] < RECORDS_PER_PAGE)
+        if short_pages:
+            flags.append(f"{short_pages} page(s) came back short before the end of the results")
+        
+        count = len(new_records)
+        suppressed = bool(
+            (self.max_digest_records and count > self.max_digest_records) or
+            # A bucket with no real spread (a quiet stretch) can't tell a bulk load from a busy day;
+            # --max-digest-records still catches those
+            ('new_records' in outliers and outliers['new_records']['z'] > 0
+             and not outliers['new_records']['floored'] and count >= DIGEST_OUTLIER_MIN)
+        )
+        if suppressed:
+            flags.append(f"Digest of {count} new records held back; check the baseline "
+                         f"(new_records_*.csv has them all)")
+        
+        for flag in flags:
+            logger.warning(f"Anomaly: {flag}")
+        self.run_assessment = {
+            'observations': observations,
+            'flags': flags,
+            'digest_suppressed': suppressed,
+            'api_total': api_total,
+        }
+        return self.run_assessment
+    
+    def commit_alerts(self, new_records: List[Dict], page_log: List[Dict], state: Dict,
+                      fast_lane: Optional['FastLane'], use_outbox: bool, when: datetime):
+        """Runs just before the baseline is replaced: assess the run, then queue its alerts"""
+        assessment = self.assess_run(new_records, page_log, state, when)
+        if use_outbox and new_records and not assessment['digest_suppressed']:
+            self.queue_alerts(new_records, fast_lane)
+    
+    def external_flagged_ids(self, records: List[Dict]) -> Set[str]:
+        """Ids of records with nearby external events, without annotating the records"""
+        if not self.external_index or not records:
+            return set()
+        return {record.get('Id') for record in self.annotate_alerts(records) if record.get('ExternalFlags')}
+    
+    def start_pdf_checks(self, records: List[Dict], new_records: List[Dict]) -> Optional[PdfVerifier]:
+        """Track this scan's recent filings (new ones with external events for longer)
+        and re-check due PDFs in the background"""
+        try:
+            tracked = self.pdf_index.track(records, self.external_flagged_ids(new_records))
+            pruned = self.pdf_index.prune()
+            verifier = PdfVerifier(self.pdf_index, self.session, self.generate_pdf_link,
+                                   self.rate_limiter.wait if self.rate_limiter else lambda: time.sleep(REQUEST_DELAY),
+                                   budget=self.pdf_check_budget)
+            verifier.start()
+            logger.info(f"PDF checks: tracking {tracked} recent filings ({pruned} aged out), "
+                        f"up to {self.pdf_check_budget} requests in the background")
+            return verifier
+        except Exception as e:
+            logger.error(f"Error starting PDF checks: {e}")
+            return None
+    
+    def finish_pdf_checks(self, verifier: PdfVerifier, send_email_notification: bool) -> Dict:
+        """Wait for the verifier and alert on PDFs that appeared or were replaced"""
+        verifier.join()
+        summary = verifier.summary()
+        logger.info(f"PDF checks: {summary}")
+        if verifier.alerts:
+            for alert in verifier.alerts:
+                logger.info(f"PDF change: {alert.get('Id')} {alert.get('Employer')}: {alert['PdfChange']}")
+            sent = True
+            # With sending off (or nowhere to send) the hashes are stored, or the same
+            # PDFs would be downloaded again every run
+            if send_email_notification and (self.dispatcher.sinks if self.outbox else self.email_config):
+                sent = self.notify(verifier.alerts, subject_prefix='[PDF updated] ',
+                                   key=lambda record: f"{record.get('Id')}:pdf:{record['PdfSha256']}")
+                if self.outbox:
+                    # The run's digest was drained already; deliver these the same way
+                    self.dispatcher.start()
+                    self.dispatcher.drain()
+            if sent:
+                verifier.save_changes()
+            else:
+                logger.error(f"PDF checks: {len(verifier.alerts)} change alert(s) not sent; rechecked next run")
+        return summary
+    
+    def pace(self):
+        """Delay between page requests, unless a shared rate limiter already spaces them"""
+        if self.rate_limiter is None and self.replay is None:
+            time.sleep(REQUEST_DELAY)
+    
+    def fetch_page(self, offset: int = 0, employer_name: str = '', plan_name: str = '',
+                   ein: str = '') -> Optional[Dict]:
+        """One page of search results; the filters narrow the search (watchlist polls)"""
+        import requests
+        
         params = {
-            'form_type': 'tophat',
-            'employer_name': '',
-            'plan_name': '',
-            'ein': '',
+            'form_type': self.form_type,
+            'employer_name': employer_name,
+            'plan_name': plan_name,
+            'ein': ein,
             'sort': 'DocId',
             'order': 'desc',
             'offset': offset,
@@ -716,13 +1041,25 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
         }
         
         url = f"{BASE_URL}?{urlencode(params)}"
+        filtered = bool(employer_name or plan_name or ein)
+        
+        if self.replay is not None and not filtered:
+            return self.replay.page(offset)
+        
+        if self.rate_limiter:
+            self.rate_limiter.wait()
         
         try:
-            logger.debug(f"Fetching offset {offset}")
+            logger.debug(f"Fetching {self.form_type} offset {offset}", extra={'rate_limit': 'fetch'})
+            request_start = time.monotonic()
             response = self.session.get(url, timeout=30)
+            self.latency_sum += time.monotonic() - request_start
+            self.latency_pages += 1
             response.raise_for_status()
             
             data = response.json()
+            if self.archive and not filtered:
+                self.archive.store(offset, response.content, data)
             return data
             
         except requests.exceptions.RequestException as e:
@@ -732,7 +1069,8 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
             logger.error(f"Error parsing JSON at offset {offset}: {e}")
             return None
     
-    def fetch_all_records(self, full_scan: bool = False) -> List[Dict]:
+    def fetch_all_records(self, full_scan: bool = False,
+                          on_page: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
 \
 
 
@@ -743,6 +1081,8 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
         offset = 0
         total_records = None
         seen_ids: Set[str] = set()
+        self.page_log = []
+        self.scan_complete = False
         
         # Incremental runs, limit to 1000 records
         # For full scans, fetch everything
@@ -774,10 +1114,13 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
             
             if not rows:
                 logger.info(f"No more records at offset {offset}")
+                self.scan_complete = True
                 break
             
 
-            for row in rows:
+            duplicates = 0
+            page_start = len(all_records)
+            for row in self.validator.validate_page(rows, offset):
                 record_id = row.get('Id') 
                 
                 if record_id is None:
@@ -788,13 +1131,27 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
 
 
                 if record_id in seen_ids:
+                    duplicates += 1
                     continue
                 
+                record = self.to_record(row)
+                if record is None:
+                    continue
                 seen_ids.add(record_id)
-                all_records.append(row)
+                all_records.append(record)
+            
+            self.page_log.append({
+                'offset': offset,
+                'total': data.get('total', total_records),
+                'rows': len(rows),
+                'duplicates': duplicates
+            })
+            
+            if on_page:
+                on_page(all_records[page_start:])
             
             logger.info(f"Processed offset {offset}: found {len(rows)} records, "
-                       f"{len(all_records)} total fetched")
+                       f"{len(all_records)} total fetched", extra={'rate_limit': 'page'})
             
 
             offset += RECORDS_PER_PAGE
@@ -807,14 +1164,74 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
 
             if offset >= total_records:
                 logger.info(f"Reached end of data at offset {offset}")
+                self.scan_complete = True
                 break
             
 
-            time.sleep(REQUEST_DELAY)
+            self.pace()
         
         logger.info(f"Fetch complete. Found {len(all_records)} records")
         return all_records
     
+    def to_record(self, row: Dict) -> Optional[FilingRecord]:
+        """Parse one API row into a FilingRecord (None if its Id isn't numeric)"""
+        try:
+            return FilingRecord.from_row(row)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping unparseable row Id={row.get('Id')!r}: {e}")
+            return None
+    
+    def refetch_offsets(self, offsets: List[int], all_records: List[Dict]) -> int:
+        """Re-request specific pages and add any rows the scan missed"""
+        seen_ids = {record.get('Id') for record in all_records}
+        added = 0
+        
+        for offset in offsets:
+            self.pace()
+            data = self.fetch_page(offset)
+            if data is None:
+                logger.warning(f"Re-fetch failed for offset {offset}")
+                continue
+            
+            for row in self.validator.validate_page(data.get('rows', []), offset):
+                record_id = row.get('Id')
+                if record_id is None or record_id in seen_ids:
+                    continue
+                record = self.to_record(row)
+                if record is None:
+                    continue
+                seen_ids.add(record_id)
+                all_records.append(record)
+                added += 1
+        
+        logger.info(f"Re-fetched {len(offsets)} page(s): recovered {added} records")
+        return added
+    
+    def reconcile_scan(self, all_records: List[Dict], baseline_ids: Set[str]) -> Dict:
+        """Report removed Ids and pagination drift, re-fetching only the affected offsets"""
+        report = reconcile((r.get('Id') for r in all_records), baseline_ids,
+                           self.page_log, RECORDS_PER_PAGE)
+        
+        offsets = offsets_to_refetch(report)
+        if offsets:
+            logger.info(f"Reconciliation: re-fetching offsets {offsets}")
+            if self.refetch_offsets(offsets, all_records):
+                report = reconcile((r.get('Id') for r in all_records), baseline_ids,
+                                   self.page_log, RECORDS_PER_PAGE)
+            report['refetched_offsets'] = offsets
+        
+        self.log_reconciliation(report)
+        return report
+    
+    def log_reconciliation(self, report: Dict):
+        if report['drift']:
+            logger.warning(f"Pagination drift: total {report['total_start']} -> {report['total_end']}, "
+                           f"{report['duplicates_skipped']} duplicate rows skipped")
+        if report['removed_ids']:
+            logger.warning(f"{len(report['removed_ids'])} baseline Ids no longer returned by the API")
+        else:
+            logger.info("Reconciliation: no baseline Ids missing")
+    
     def save_records_csv(self, records: List[Dict], filename: str):
         """Save to CSV"""
         if not records:
@@ -839,6 +1256,7 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
                 writer.writerows(records)
             
             logger.info(f"Saved {len(records)} records to {filepath}")
+            self.catalog.register(filepath, self.run_id)
         except Exception as e:
             logger.error(f"Error saving CSV: {e}")
     
@@ -854,86 +1272,311 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
         
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(records, f, indent=2, default=str)
+                json.dump(as_dicts(records), f, indent=2, default=str)
             
             logger.info(f"Saved {len(records)} records to {filepath}")
+            self.catalog.register(filepath, self.run_id)
         except Exception as e:
             logger.error(f"Error saving JSON: {e}")
     
-    def run(self, send_email_notification: bool = True):
+    def profile_stage(self, name: str):
+        if self.profiler:
+            self.profiler.stage(name)
+    
+    def run(self, send_email_notification: bool = True, records: Optional[List[Dict]] = None):
+        """Scan, diff against the baseline, save and notify (records: skip the fetch, e.g. a merged distributed scan)"""
+        if self.profile:
+            from tophat_profile import RunProfiler
+            self.profiler = RunProfiler(self.profile)
+        try:
+            return self._run(send_email_notification, records)
+        except Exception as e:
+            self.record_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            if self.profiler:
+                profiler, self.profiler = self.profiler, None
+                report_dir = self.output_dir / f"profile_{self.run_id}"
+                if profiler.finish(report_dir):
+                    self.catalog.register(report_dir, self.run_id, 'profile')
+    
+    def remember_early_alerts(self, record_ids: Set[str]):
+        """Persist fast-lane alerts at once, so a scan that then fails doesn't send them again"""
+        self.early_alerted_ids |= record_ids
+        state = self.load_state()
+        state['early_alerted_ids'] = sorted(self.early_alerted_ids)
+        self.save_state(state)
+    
+    def record_error(self, message: str):
+        """Keep the latest failure in the state file for --status"""
+        state = self.load_state()
+        state['last_error'] = {'at': datetime.now().isoformat(), 'run_id': self.run_id, 'message': message}
+        self.save_state(state)
+    
+    def _run(self, send_email_notification: bool, records: Optional[List[Dict]]):
 
 
 
 
 
-        start_time = datetime.now()
+        started = datetime.now()
+        # Reprocessed runs keep the original fetch time for file names and history
+        start_time = self.replay.started_at if self.replay else started
         logger.info("="*60)
-        logger.info(f"TopHat API Monitor started at {start_time}")
+        logger.info(f"TopHat API Monitor started at {started}")
         logger.info(f"Mode: FULL SCAN (fetch all records, compare against baseline)")
+        logger.info(f"Form type: {self.form_type}")
+        if self.profile_name:
+            logger.info(f"Profile: {self.profile_name}")
         logger.info("="*60)
         
 
 
 
+        self.profile_stage('load_baseline')
         baseline_ids = self.load_baseline()
         
         state = self.load_state()
+        self.early_alerted_ids = set(state.get('early_alerted_ids', []))
+        
+        fast_lane = None
+        if self.fast_lane and baseline_ids and send_email_notification:
+            fast_lane = FastLane(self, baseline_ids, started)
+        
+        timestamp = start_time.strftime(RUN_ID_FORMAT)
+        self.run_id = timestamp
+        set_run_id(timestamp)
+        reconciliation = None
+        if self.archive and self.replay is None and records is None:
+            self.archive.start_run(timestamp)
         
-        logger.info("Fetch all records from API")
-        all_records = self.fetch_all_records(full_scan=True)
+        use_outbox = bool(self.outbox and send_email_notification)
+        self.run_assessment = None
+        self.validator = RowValidator()
+        self.latency_sum = 0.0
+        self.latency_pages = 0
+        if use_outbox:
+            # Retries left over from earlier runs go out while this one scans
+            self.dispatcher.start()
         
-        if all_records:
-            # Sort Id as descending (newest first)
-            all_records.sort(key=lambda x: int(x.get('Id', 0) or 0), reverse=True)
-            logger.info(f"Fetched {len(all_records)} records total:")
-            new_records = self.identify_new_records(all_records, baseline_ids)
+        self.profile_stage('scan')
+        if self.pipeline and records is None:
+            # Dedupe, diff, writes and enrichment overlap with fetching
+            logger.info("Stream all records from API through the scan pipeline")
+            scan = ScanPipeline(
+                self, baseline_ids, timestamp, RECORDS_PER_PAGE,
+                0 if self.rate_limiter or self.replay else REQUEST_DELAY,
+                fast_lane=fast_lane,
+                keep_records=bool(self.columnar_writer or self.history_store or self.pdf_index
+                                  or self.keep_records),
+                enrich=bool(send_email_notification and self.email_config and baseline_ids),
+                on_commit=lambda rows: self.commit_alerts(rows, scan.page_log, state, fast_lane,
+                                                          use_outbox, started)
+            )
+            scan.run()
+            if self.run_assessment is None:
+                self.assess_run(scan.new_records, scan.page_log, state, started)
+            all_records = scan.records
+            self.scan_complete = scan.complete and not scan.errors
+            fetched_count = scan.fetched
+            new_records = scan.new_records
+            reconciliation = scan.reconciliation
+            if reconciliation:
+                self.log_reconciliation(reconciliation)
+            logger.info(f"Identified {len(new_records)} new records")
+            date_range = (scan.oldest_date or 'N/A', scan.newest_date or 'N/A')
+            watermark = scan.max_doc_id
+        else:
+            if records is not None:
+                logger.info(f"Processing {len(records)} records supplied by the caller")
+                self.page_log = []
+                if records and isinstance(records[0], dict):
+                    records = self.validator.validate_page(records)
+                all_records = [r for r in map(self.to_record, records) if r is not None]
+                self.scan_complete = True
+            else:
+                logger.info("Fetch all records from API")
+                all_records = self.fetch_all_records(full_scan=True,
+                                                     on_page=fast_lane.on_page if fast_lane else None)
+            new_records = []
             
-
-
-            timestamp = start_time.strftime('%Y%m%d_%H%M%S')
-            self.save_records_csv(all_records, f"fetched_records_{timestamp}.csv")
-            self.save_records_json(all_records, f"fetched_records_{timestamp}.json")
+            if all_records:
+                self.profile_stage('diff')
+                reconciliation = (self.reconcile_scan(all_records, baseline_ids)
+                                  if baseline_ids and self.scan_complete else None)
+                
+                # Sort Id as descending (newest first)
+                all_records.sort(key=id_of, reverse=True)
+                logger.info(f"Fetched {len(all_records)} records total:")
+                new_records = self.identify_new_records(all_records, baseline_ids)
+                date_range = (all_records[-1].get('DateReceived', 'N/A'),
+                              all_records[0].get('DateReceived', 'N/A'))
+                watermark = max(doc_id_of(r) for r in all_records)
+                
+                self.profile_stage('save_outputs')
+                self.save_records_csv(all_records, f"fetched_records_{timestamp}.csv")
+                self.save_records_json(all_records, f"fetched_records_{timestamp}.json")
+                
+                # Save new records
+                if new_records:
+                    self.save_records_csv(new_records, f"new_records_{timestamp}.csv")
+                    self.save_records_json(new_records, f"new_records_{timestamp}.json")
+                
+                # Alerts must be durable before the baseline forgets these Ids are new
+                self.profile_stage('save_baseline')
+                if self.scan_complete:
+                    self.commit_alerts(new_records, self.page_log, state, fast_lane, use_outbox, started)
+                    
+                    # Append baseline with all current records
+                    all_current_records = list(all_records)
+                    self.save_baseline(all_current_records)
+                else:
+                    # Baseline Ids past the failed page would otherwise come back as new next run
+                    logger.warning("Scan incomplete; keeping previous baseline")
+                    self.assess_run(new_records, self.page_log, state, started)
+            fetched_count = len(all_records)
+        
+        if self.archive:
+            self.archive.end_run()
+        # Runs alongside history and delivery; a replay never touches the network
+        pdf_verifier = None
+        pdf_checks = None
+        if self.pdf_index and all_records and self.replay is None:
+            pdf_verifier = self.start_pdf_checks(all_records, new_records)
+        scan_seconds = (datetime.now() - started).total_seconds()
+        time_to_alert = None
+        
+        validation = self.validator.summary()
+        quarantine_file = self.validator.save(self.output_dir / f"quarantine_{timestamp}.jsonl")
+        if quarantine_file:
+            self.catalog.register(quarantine_file, timestamp, 'quarantine')
+            logger.warning(f"Validation: {validation['rejected']} rejected, {validation['repaired']} repaired, "
+                           f"{validation['flagged']} flagged rows ({validation['reasons']}); see {quarantine_file}")
+        
+        if fetched_count:
+            self.profile_stage('history')
+            if reconciliation and (reconciliation['removed_ids'] or reconciliation['drift']):
+                self.save_records_json([reconciliation], f"reconciliation_{timestamp}.json")
             
-
-
-            # Save new records
-            if new_records:
-                self.save_records_csv(new_records, f"new_records_{timestamp}.csv")
-                self.save_records_json(new_records, f"new_records_{timestamp}.json")
+            # Columnar snapshot partitioned by fetch date (optional)
+            if self.columnar_writer:
+                self.columnar_writer.write_snapshot(all_records, start_time)
+            
+            # Compressed base/delta history, kept regardless of --keep-files (a partial
+            # scan would read as mass removals)
+            if self.history_store and self.scan_complete:
+                try:
+                    delta = self.history_store.record(all_records, start_time)
+                    if delta is not None:
+                        self.history_index.update(start_time, delta)
+                except Exception as e:
+                    logger.error(f"Error saving snapshot history: {e}")
             
 
-
-            # Append baseline with all current records
-            all_current_records = list(all_records)
-            self.save_baseline(all_current_records)
+            # Wait for the fast-lane digest so it isn't repeated below
+            self.profile_stage('notify')
+            if fast_lane:
+                fast_lane.wait()
+                if fast_lane.sent_at:
+                    time_to_alert = (fast_lane.sent_at - started).total_seconds()
+            alert_records = [r for r in new_records if r.get('Id') not in self.early_alerted_ids
+                             and (not fast_lane or r.get('Id') not in fast_lane.alerted_ids)]
+            assessment = self.run_assessment or {}
+            if assessment.get('digest_suppressed'):
+                logger.error(f"Digest suppressed: {len(new_records)} new records is not a normal run")
+                alert_records = []
+            if not self.scan_complete and alert_records:
+                # Still new against the kept baseline, so the next complete scan alerts them once
+                logger.error(f"Scan incomplete: {len(alert_records)} new records held for the next complete scan")
+                alert_records = []
+            
+            if use_outbox:
+                # Already queued; give the sinks a bounded time to acknowledge
+                if not self.dispatcher.drain() and alert_records and time_to_alert is None:
+                    time_to_alert = (datetime.now() - started).total_seconds()
+            else:
+                # Send email if there are new records
+                if alert_records and send_email_notification:
+                    logger.info(f"Preparing to send email")
+                    if self.send_email(self.annotate_alerts(alert_records)) and time_to_alert is None:
+                        time_to_alert = (datetime.now() - started).total_seconds()
+            
+            # After the digest, so PDF checks never delay new-filing alerts
+            if pdf_verifier:
+                pdf_checks = self.finish_pdf_checks(pdf_verifier, send_email_notification)
             
 
+            # Incremental filing counts (tophat_aggregates.py report)
+            self.profile_stage('save_state')
+            # A replayed run was counted when it happened; a lost baseline or bulk load would count
+            # filings already counted again, so those recount from the new baseline instead
+            if self.scan_complete and self.replay is None:
+                if assessment.get('digest_suppressed') or not baseline_ids:
+                    self.aggregates.rebuild(baseline_records(self.baseline_file), self.state_of_ein,
+                                            self.nonprofit_status)
+                    self.aggregates.save()
+                elif new_records:
+                    self.aggregates.add(new_records, self.state_of_ein, self.nonprofit_status)
+                    self.aggregates.save()
+            
             new_state = {
                 'last_run': start_time.isoformat(),
-                'records_fetched': len(all_records),
-                'new_records_found': len(new_records)
+                # last_run is the archived fetch time on --reprocess; --status compares errors with this
+                'finished_at': datetime.now().isoformat(),
+                'records_fetched': fetched_count,
+                'new_records_found': len(new_records),
+                'form_type': self.form_type,
+                'watermark': watermark,
+                'removed_records_found': len(reconciliation['removed_ids']) if reconciliation else 0,
+                'pagination_drift': reconciliation['drift'] if reconciliation else False,
+                'scan_seconds': round(scan_seconds, 2),
+                'time_to_alert_seconds': round(time_to_alert, 2) if time_to_alert is not None else None,
+                'api_total': assessment.get('api_total', state.get('api_total')),
+                'anomalies': assessment.get('flags', []),
+                'digest_suppressed': assessment.get('digest_suppressed', False),
+                'validation': validation,
+                'pdf_checks': pdf_checks,
+                'scan_complete': self.scan_complete,
+                # Once the baseline holds them, the early alerts need no more remembering
+                'early_alerted_ids': [] if self.scan_complete else sorted(self.early_alerted_ids),
+                'last_error': state.get('last_error')
             }
             self.save_state(new_state)
-    
-
-            # Send email if there are new records
-            if new_records and send_email_notification:
-                logger.info(f"Preparing to send email")
-                self.send_email(new_records)
-
+            if not self.scan_complete:
+                self.record_error("Scan incomplete (API error mid-scan); previous baseline kept")
+            
+            # Fold this run into the rolling statistics (a first run or held-back digest isn't a
+            # normal volume; a replayed run was already counted when it happened)
+            if self.replay is None:
+                observations = dict(assessment.get('observations', {}))
+                if assessment.get('digest_suppressed') or not baseline_ids or not self.scan_complete:
+                    observations.pop('new_records', None)
+                self.anomaly_detector.observe(observations, start_time)
+                self.anomaly_detector.save()
 
 
 
             logger.info("="*60)
             logger.info(f"SUMMARY:")
-            logger.info(f"  Records fetched: {len(all_records)}")
+            logger.info(f"  Records fetched: {fetched_count}")
             logger.info(f"  New records (not in baseline): {len(new_records)}")
-            if all_records:
-                logger.info(f"  Date range: {all_records[-1].get('DateReceived', 'N/A')[:10]} to {all_records[0].get('DateReceived', 'N/A')[:10]}")
+            if reconciliation:
+                logger.info(f"  Baseline records removed: {len(reconciliation['removed_ids'])}")
+            logger.info(f"  Scan time: {scan_seconds:.2f} seconds")
+            if time_to_alert is not None:
+                logger.info(f"  Time to alert: {time_to_alert:.2f} seconds"
+                            f"{' (fast lane)' if fast_lane and fast_lane.sent_at else ''}")
+            for flag in assessment.get('flags', []):
+                logger.info(f"  Anomaly: {flag}")
+            logger.info(f"  Date range: {date_range[0][:10]} to {date_range[1][:10]}")
             logger.info("="*60)
             
         else:
             logger.info("No records fetched")
+            if records is None:
+                self.record_error("No records fetched (API errors or an empty result)")
+            if use_outbox:
+                self.dispatcher.drain()
         
 
 
@@ -941,9 +1584,10 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
 
 
         # Auto-cleanup old files
+        self.profile_stage('cleanup')
         self.cleanup_old_files()
         
-        elapsed = datetime.now() - start_time
+        elapsed = datetime.now() - started
         logger.info(f"Monitor completed in {elapsed.total_seconds():.2f} seconds")
         
         return all_records if all_records else []
@@ -953,6 +1597,243 @@ PDF Link: {self.generate_pdf_link(record.get('Id', record.get('DocId', '')))}
 
 
 
+def parse_form_types(value: str) -> List[str]:
+    """'tophat,apprenticeship' or 'key=Label' entries; new labels are registered in FORM_TYPES"""
+    form_types = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, label = item.partition('=')
+        key = key.strip()
+        if label.strip():
+            FORM_TYPES[key] = label.strip()
+        if key not in form_types:
+            form_types.append(key)
+    return form_types or [DEFAULT_FORM_TYPE]
+
+
+def namespaced_dir(directory: Optional[str], form_type: str) -> Optional[str]:
+    if not directory or form_type == DEFAULT_FORM_TYPE:
+        return directory
+    return str(Path(directory) / form_type)
+
+
+def namespaced_file(filepath: Optional[str], form_type: str) -> Optional[str]:
+    if not filepath or form_type == DEFAULT_FORM_TYPE:
+        return filepath
+    path = Path(filepath)
+    return str(path.with_name(f"{path.stem}_{form_type}{path.suffix}"))
+
+
+def run_monitors(groups: List[List[TopHatAPIMonitor]], send_email_notification: bool = True) -> bool:
+    """Run each form type's profiles (see fan_out) concurrently; returns False if any run failed"""
+    failures = []
+
+    def run_one(group):
+        try:
+            if not fan_out(group, send_email_notification=send_email_notification):
+                failures.append(group[0].form_type)
+        except Exception as e:
+            logger.exception(f"{group[0].form_type} run failed: {e}")
+            failures.append(group[0].form_type)
+
+    threads = [threading.Thread(target=run_one, args=(group,), name=f"monitor-{group[0].form_type}")
+               for group in groups]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return not failures
+
+
+def fan_out(monitors: List[TopHatAPIMonitor], send_email_notification: bool = True) -> bool:
+    """The first profile scans; every other profile diffs, saves and notifies from that scan"""
+    primary, others = monitors[0], monitors[1:]
+    primary.keep_records = bool(others)
+    records = primary.run(send_email_notification=send_email_notification)
+    if not others:
+        return True
+    if not records or not primary.scan_complete:
+        logger.warning(f"No complete {primary.form_type} scan; skipping {len(others)} other profile(s)")
+        return False
+    
+    failures = []
+    for monitor in others:
+        # Enrichment lookups are per EIN, not per desk
+        monitor.propublica_cache = primary.propublica_cache
+        try:
+            monitor.run(send_email_notification=send_email_notification,
+                        records=[record.copy() for record in records])
+        except Exception as e:
+            logger.exception(f"Profile {monitor.profile_name} failed: {e}")
+            failures.append(monitor.profile_name)
+    return not failures
+
+
+def load_profiles(filepath: str) -> List[Dict]:
+    """--profiles file: a JSON list (or {"profiles": [...]}) of named setting overrides"""
+    with open(filepath, 'r') as f:
+        profiles = json.load(f)
+    if isinstance(profiles, dict):
+        profiles = profiles.get('profiles', [])
+    if not profiles:
+        raise ValueError(f"No profiles in {filepath}")
+    names = set()
+    for profile in profiles:
+        if not isinstance(profile, dict) or not profile.get('name'):
+            raise ValueError(f"Every profile needs a name: {profile!r}")
+        unknown = set(profile) - PROFILE_OPTIONS
+        if unknown:
+            raise ValueError(f"Profile {profile['name']}: unknown setting(s) {', '.join(sorted(unknown))}")
+        if profile['name'] in names:
+            raise ValueError(f"Duplicate profile name {profile['name']}")
+        names.add(profile['name'])
+    return profiles
+
+
+def load_email_config(filepath: Optional[str]) -> Optional[Dict]:
+    if not filepath:
+        return None
+    try:
+        with open(filepath, 'r') as f:
+            email_config = json.load(f)
+        logger.info(f"Email configuration loaded from {filepath}")
+        return email_config
+    except Exception as e:
+        logger.error(f"Error loading email configuration: {e}")
+        return None
+
+
+def reprocess(monitors: List[TopHatAPIMonitor], run_id: str) -> int:
+    """Replay archived runs (oldest first) through the normal scan path"""
+    for monitor in monitors:
+        run_ids = monitor.archive.runs() if run_id == 'all' else [run_id]
+        for archived_run in run_ids:
+            logger.info(f"Reprocessing archived {monitor.form_type} run {archived_run}")
+            try:
+                monitor.replay = monitor.archive.replay(archived_run)
+            except FileNotFoundError:
+                logger.error(f"No archived {monitor.form_type} run {archived_run}")
+                return 1
+            try:
+                monitor.run(send_email_notification=False)
+            finally:
+                monitor.replay = None
+    return 0
+
+
+def monitor_status(form_type: str, state_file: str, baseline_file: str,
+                   outbox_file: Optional[str] = None) -> Dict:
+    """Last run, watermark, pending alerts and last error, from the state file and outbox only"""
+    status = {'form_type': form_type}
+    try:
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {}
+    except Exception as e:
+        state = {'last_error': {'message': f"Unreadable state file: {e}"}}
+    for key in ('last_run', 'finished_at', 'watermark', 'records_fetched', 'new_records_found',
+                'scan_seconds', 'anomalies', 'digest_suppressed', 'validation', 'pdf_checks', 'last_error'):
+        status[key] = state.get(key)
+    
+    baseline_path = Path(baseline_file)
+    status['baseline_updated'] = (datetime.fromtimestamp(baseline_path.stat().st_mtime).isoformat()
+                                  if baseline_path.exists() else None)
+    
+    status['pending_alerts'] = None
+    if outbox_file and Path(outbox_file).exists():
+        outbox = Outbox(outbox_file, readonly=True)
+        try:
+            status['pending_alerts'] = outbox.pending(form_type)
+        finally:
+            outbox.close()
+    return status
+
+
+def print_status(status: Dict) -> bool:
+    """Print one form type's status; False if its latest run failed"""
+    last_error = status['last_error'] or {}
+    last_finished = status['finished_at'] or status['last_run']
+    failing = bool(last_error) and (last_finished is None or last_error.get('at', '') > last_finished)
+    print(f"{status['form_type']}:")
+    print(f"  Last run:         {status['last_run'] or 'never'}"
+          f"{' (FAILED since)' if failing else ''}")
+    print(f"  Watermark DocId:  {status['watermark']}")
+    print(f"  Baseline records: {status['records_fetched']} (file updated {status['baseline_updated']})")
+    print(f"  New last run:     {status['new_records_found']}"
+          f"{' (digest held back)' if status['digest_suppressed'] else ''}")
+    if status['scan_seconds'] is not None:
+        print(f"  Scan time:        {status['scan_seconds']} s")
+    print(f"  Pending alerts:   {status['pending_alerts'] if status['pending_alerts'] is not None else 'no outbox'}")
+    validation = status['validation'] or {}
+    if validation.get('rejected') or validation.get('repaired') or validation.get('flagged'):
+        print(f"  Quarantined rows: {validation['rejected']} rejected, {validation['repaired']} repaired, "
+              f"{validation['flagged']} flagged")
+    pdf_checks = status['pdf_checks']
+    if pdf_checks:
+        print(f"  PDF checks:       {pdf_checks['requests']} requests, {pdf_checks['alerts']} appeared/replaced")
+    for flag in status['anomalies'] or []:
+        print(f"  Anomaly:          {flag}")
+    if last_error:
+        print(f"  Last error:       {last_error.get('at', '?')} {last_error.get('message')}")
+    return not failing
+
+
+class FastLane:
+    """Email the leading (newest) new filings while the rest of the scan continues"""
+
+    def __init__(self, monitor: TopHatAPIMonitor, baseline_ids: Set[str], started_at: datetime,
+                 max_pages: int = FAST_LANE_MAX_PAGES):
+        self.monitor = monitor
+        self.baseline_ids = baseline_ids
+        self.started_at = started_at
+        self.max_pages = max_pages
+        self.pages = 0
+        self.records: List[Dict] = []
+        self.alerted_ids: Set[str] = set()
+        self.sent_at: Optional[datetime] = None
+        self.done = False
+        self.thread: Optional[threading.Thread] = None
+
+    def on_page(self, rows: List[Dict]):
+        if self.done:
+            return
+        
+        self.pages += 1
+        page_new = [r for r in rows if str(r.get('Id', '')) not in self.baseline_ids]
+        self.records.extend(page_new)
+        
+        # Pages arrive DocId desc, so the first page with a known Id ends the new run
+        if len(page_new) < len(rows):
+            self.done = True
+            if self.records:
+                logger.info(f"Fast lane: {len(self.records)} new record(s) in the leading "
+                            f"{self.pages} page(s); sending early alert")
+                self.thread = threading.Thread(target=self._deliver, name='fast-lane', daemon=True)
+                self.thread.start()
+        elif self.pages >= self.max_pages:
+            logger.warning(f"Fast lane: first {self.pages} pages are all new; "
+                           f"skipping early alert")
+            self.done = True
+            self.records = []
+
+    def _deliver(self):
+        # Skip filings an earlier, failed run already alerted early
+        records = [r for r in self.records if r.get('Id') not in self.monitor.early_alerted_ids]
+        if records and self.monitor.notify(records, subject_prefix='[Early alert] '):
+            self.alerted_ids = {r.get('Id') for r in records}
+            self.monitor.remember_early_alerts(self.alerted_ids)
+            self.sent_at = datetime.now()
+            logger.info(f"Fast lane alert sent "
+                        f"{(self.sent_at - self.started_at).total_seconds():.2f}s after start")
+
+    def wait(self):
+        if self.thread:
+            self.thread.join()
+
+
 def main():
 
     parser = argparse.ArgumentParser(
@@ -990,6 +1871,105 @@ def main():
         default=AUTO_CLEANUP_KEEP,
         help=f'Number of recent file sets to keep (default: {AUTO_CLEANUP_KEEP}, 0=disable cleanup)'
     )
+    parser.add_argument(
+        '--keep-days',
+        type=int,
+        help='Also delete output files from runs older than this many days'
+    )
+    parser.add_argument(
+        '--max-output-mb',
+        type=float,
+        help='Also delete the oldest runs\' output files once the output directory exceeds this size'
+    )
+    parser.add_argument(
+        '--max-digest-records',
+        type=int,
+        default=DIGEST_MAX_RECORDS,
+        help=f'Hold back the digest when a run finds more new records than this, e.g. after a '
+             f'lost baseline (default: {DIGEST_MAX_RECORDS}, 0=no limit)'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='full',
+        choices=PROFILE_MODES,
+        help='Profile each stage of the run (CPU top functions and allocation diffs); reports go to '
+             '<output-dir>/profile_<run id>/. "sample" is a low-overhead stack sampler for production'
+    )
+    parser.add_argument(
+        '--columnar-dir',
+        help='Also write a Parquet snapshot partitioned by fetch date to this directory (requires pyarrow)'
+    )
+    parser.add_argument(
+        '--history-dir',
+        help='Keep compressed daily snapshot history (full base + deltas) in this directory'
+    )
+    parser.add_argument(
+        '--fast-lane',
+        action='store_true',
+        help='Email new filings from the leading pages before the full scan finishes'
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Stream pages through dedupe/diff, file writers and enrichment while fetching'
+    )
+    parser.add_argument(
+        '--archive-dir',
+        help='Store every raw API page (gzip, content-addressed) in this directory'
+    )
+    parser.add_argument(
+        '--reprocess',
+        metavar='RUN_ID',
+        help='Rebuild baseline, diffs and exports from archived pages instead of the API '
+             '(a run id from tophat_archive.py --list, or "all"); never sends email, and needs its own '
+             '--baseline-file, --state-file and --output-dir'
+    )
+    parser.add_argument(
+        '--irs-index',
+        help='SQLite index built by tophat_irs.py from the IRS EO BMF; '
+             'ProPublica is only queried for EINs not in it'
+    )
+    parser.add_argument(
+        '--external-index',
+        help='SQLite index built by tophat_external.py; flags PPP loans and WARN notices '
+             'near each new filing in the digest'
+    )
+    parser.add_argument(
+        '--pdf-index',
+        help='SQLite index of statement PDF hashes; recent and flagged filings are re-checked after '
+             'each scan and an alert goes out when a PDF appears or is replaced (first profile only)'
+    )
+    parser.add_argument(
+        '--pdf-check-budget',
+        type=int,
+        default=PDF_CHECK_BUDGET,
+        help=f'Requests per run for PDF checks (default: {PDF_CHECK_BUDGET})'
+    )
+    parser.add_argument(
+        '--outbox',
+        help=f'Queue alerts durably in this SQLite outbox before the baseline is saved and '
+             f'deliver them in the background with retries (default with --webhook-url/--feed-file: {OUTBOX_FILE})'
+    )
+    parser.add_argument(
+        '--webhook-url',
+        help='Also POST new records as JSON to this URL (through the outbox)'
+    )
+    parser.add_argument(
+        '--feed-file',
+        help='Also keep an RSS feed of new records at this path (through the outbox)'
+    )
+    parser.add_argument(
+        '--profiles',
+        help='JSON list of named profiles (desks), each overriding output/state/baseline paths, '
+             'reference file, email config, indexes and sinks; one scan feeds them all'
+    )
+    parser.add_argument(
+        '--form-types',
+        default=DEFAULT_FORM_TYPE,
+        help=f'Comma-separated form types to monitor, optionally key=Label '
+             f'(known: {", ".join(FORM_TYPES)}; default: {DEFAULT_FORM_TYPE})'
+    )
     parser.add_argument(
         '--no-email',
         action='store_true',
@@ -1000,8 +1980,89 @@ def main():
         action='store_true',
         help='Enable debug logging'
     )
+    parser.add_argument(
+        '--log-format',
+        choices=LOG_FORMATS,
+        default='json',
+        help='Log file format; the console is always text (default: json)'
+    )
+    parser.add_argument(
+        '--log-max-mb',
+        type=float,
+        default=LOG_MAX_BYTES / (1024 * 1024),
+        help=f'Rotate {LOG_FILE} at this size (default: {LOG_MAX_BYTES // (1024 * 1024)})'
+    )
+    parser.add_argument(
+        '--log-backups',
+        type=int,
+        default=LOG_BACKUPS,
+        help=f'Rotated log files to keep (default: {LOG_BACKUPS})'
+    )
+    parser.add_argument(
+        '--log-rotate-daily',
+        action='store_true',
+        help='Rotate the log file at midnight instead of by size'
+    )
+    parser.add_argument(
+        '--status',
+        action='store_true',
+        help='Print last run, watermark, pending alerts and last error from the state file and exit'
+    )
     
     args = parser.parse_args()
+    
+    profiles = [{}]
+    if args.profiles:
+        try:
+            profiles = load_profiles(args.profiles)
+        except (OSError, ValueError) as e:
+            print(f"Error loading profiles: {e}", file=sys.stderr)
+            return 1
+    # Each profile's settings: the command line, overridden by the profile's entries
+    profile_settings = [argparse.Namespace(**{**vars(args), **profile}) for profile in profiles]
+    for i, (profile, settings) in enumerate(zip(profiles, profile_settings)):
+        # Outbox entries are unique per record, so profiles can't share one
+        if profile and 'outbox' not in profile and (settings.outbox or settings.webhook_url or settings.feed_file):
+            outbox = Path(settings.outbox or OUTBOX_FILE)
+            settings.outbox = str(outbox.with_name(f"{outbox.stem}_{profile['name']}{outbox.suffix}"))
+        # Every profile sees the same scan, so the command-line snapshot and history
+        # directories are written by the first profile only
+        if i > 0:
+            for key in ('columnar_dir', 'history_dir'):
+                if key not in profile:
+                    setattr(settings, key, None)
+    for key in ('state_file', 'baseline_file', 'output_dir', 'outbox', 'columnar_dir', 'history_dir', 'feed_file'):
+        values = [getattr(settings, key) for settings in profile_settings if getattr(settings, key)]
+        if len(set(values)) < len(values):
+            print(f"Each profile needs its own {key}", file=sys.stderr)
+            return 1
+    # A replay writes a baseline, state and outputs; the live ones are never the default target
+    if args.reprocess:
+        for settings in profile_settings:
+            live = [flag for flag, key, default in (('--baseline-file', 'baseline_file', BASELINE_FILE),
+                                                    ('--state-file', 'state_file', STATE_FILE),
+                                                    ('--output-dir', 'output_dir', OUTPUT_DIR))
+                    if getattr(settings, key) == default]
+            if live:
+                print(f"--reprocess would overwrite the live files; give it a scratch {', '.join(live)}",
+                      file=sys.stderr)
+                return 1
+    
+    if args.status:
+        healthy = True
+        for form_type in parse_form_types(args.form_types):
+            for profile, settings in zip(profiles, profile_settings):
+                paths = form_type_paths(form_type, settings.state_file, settings.output_dir,
+                                        settings.baseline_file)
+                status = monitor_status(form_type, paths['state_file'], paths['baseline_file'],
+                                        settings.outbox or OUTBOX_FILE)
+                if profile:
+                    status['form_type'] = f"{form_type} ({profile['name']})"
+                healthy = print_status(status) and healthy
+        return 0 if healthy else 1
+    
+    configure_logging(log_format=args.log_format, max_bytes=int(args.log_max_mb * 1024 * 1024),
+                      backups=args.log_backups, rotate_daily=args.log_rotate_daily)
 
 
 
@@ -1010,28 +2071,53 @@ def main():
     if args.debug:
         logger.setLevel(logging.DEBUG)
     
-    # Load email config
-    email_config = None
-    if args.email_config and not args.no_email:
-        try:
-            with open(args.email_config, 'r') as f:
-                email_config = json.load(f)
-            logger.info(f"Email configuration loaded from {args.email_config}")
-        except Exception as e:
-            logger.error(f"Error loading email configuration: {e}")
-    
 
 
 
 
-    monitor = TopHatAPIMonitor(
-        state_file=args.state_file,
-        output_dir=args.output_dir,
-        baseline_file=args.baseline_file,
-        email_config=email_config,
-        reference_file=args.reference_file,
-        keep_files=args.keep_files
-    )
+    form_types = parse_form_types(args.form_types)
+    
+    # Several form types share one connection pool and one global rate limit
+    shared = len(form_types) > 1
+    session = create_session(pool_size=2 * len(form_types)) if shared else None
+    rate_limiter = RateLimiter(REQUEST_DELAY) if shared else None
+    
+    email_configs = {}
+    if not args.no_email:
+        for settings in profile_settings:
+            if settings.email_config and settings.email_config not in email_configs:
+                email_configs[settings.email_config] = load_email_config(settings.email_config)
+    
+    # One group per form type: the first profile scans, the others reuse its records (fan_out)
+    groups = []
+    for form_type in form_types:
+        group = []
+        for i, settings in enumerate(profile_settings):
+            group.append(TopHatAPIMonitor(
+                email_config=email_configs.get(settings.email_config),
+                reference_file=settings.reference_file,
+                keep_files=settings.keep_files,
+                keep_days=settings.keep_days,
+                max_digest_records=settings.max_digest_records,
+                profile=args.profile,
+                profile_name=profiles[i].get('name'),
+                max_output_bytes=int(settings.max_output_mb * 1024 * 1024) if settings.max_output_mb else None,
+                snapshots=SnapshotOptions.from_settings(settings, form_type),
+                fast_lane=args.fast_lane and i == 0,
+                pipeline=args.pipeline,
+                form_type=form_type,
+                session=session,
+                rate_limiter=rate_limiter,
+                archive_dir=namespaced_dir(args.archive_dir, form_type) if i == 0 else None,
+                irs_index=settings.irs_index,
+                external_index=settings.external_index,
+                pdfs=PdfOptions(namespaced_file(args.pdf_index, form_type) if i == 0 else None,
+                                args.pdf_check_budget),
+                delivery=DeliveryOptions.from_settings(settings, form_type),
+                **form_type_paths(form_type, settings.state_file, settings.output_dir, settings.baseline_file)
+            ))
+        groups.append(group)
+    monitors = [group[0] for group in groups]
     
 
 
@@ -1042,9 +2128,16 @@ def main():
     if args.keep_files != AUTO_CLEANUP_KEEP:
         logger.info(f"Auto-cleanup: keeping {args.keep_files} file sets")
     
+    if args.reprocess:
+        if not args.archive_dir:
+            logger.error("--reprocess needs --archive-dir")
+            return 1
+        return reprocess(monitors, args.reprocess)
+    
     try:
-        monitor.run(send_email_notification=not args.no_email)
-        return 0
+        if len(groups) == 1:
+            return 0 if fan_out(groups[0], send_email_notification=not args.no_email) else 1
+        return 0 if run_monitors(groups, send_email_notification=not args.no_email) else 1
     except KeyboardInterrupt:
         logger.info("User interruption")
         return 1
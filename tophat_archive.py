@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+
+Raw API page archive, so scans can be reprocessed offline without refetching.
+
+Every page body is stored gzip-compressed under its SHA-256 (identical pages across
+runs are stored once); runs/<run_id>.jsonl lists the pages each run fetched, in order.
+
+python tophat_archive.py --list
+python tophat_api_monitor.py --archive-dir tophat_archive --reprocess all --baseline-file rebuilt.csv \
+    --state-file rebuilt_state.json --output-dir rebuilt
+
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import sys
+import threading
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ARCHIVE_DIR = "tophat_archive"
+RUN_ID_FORMAT = '%Y%m%d_%H%M%S'
+
+logger = logging.getLogger(__name__)
+
+
+class PageArchive:
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR):
+        self.archive_dir = Path(archive_dir)
+        self.blob_dir = self.archive_dir / "blobs"
+        self.run_dir = self.archive_dir / "runs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.run_id: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / f"{digest}.json.gz"
+
+    def start_run(self, run_id: str):
+        self.run_id = run_id
+        logger.info(f"Archiving raw pages for run {run_id}")
+
+    def end_run(self):
+        self.run_id = None
+
+    def store(self, offset: int, content: bytes, data: Dict):
+        """Keep one raw page body for the current run (no-op outside a run)"""
+        if self.run_id is None:
+            return
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+        entry = {
+            'offset': offset,
+            'sha256': digest,
+            'total': data.get('total'),
+            'rows': len(data.get('rows', [])),
+            'fetched_at': datetime.now().isoformat(),
+        }
+        try:
+            with self._lock:
+                if not path.exists():
+                    path.parent.mkdir(exist_ok=True)
+                    tmp = path.with_name(path.name + '.tmp')
+                    with gzip.open(tmp, 'wb') as f:
+                        f.write(content)
+                    tmp.replace(path)
+                with open(self.run_dir / f"{self.run_id}.jsonl", 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+        except Exception as e:
+            logger.error(f"Error archiving page at offset {offset}: {e}")
+
+    def runs(self) -> List[str]:
+        return sorted(path.stem for path in self.run_dir.glob('*.jsonl'))
+
+    def pages(self, run_id: str) -> List[Dict]:
+        with open(self.run_dir / f"{run_id}.jsonl", 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def load_page(self, digest: str) -> Dict:
+        with gzip.open(self.blob_path(digest), 'rb') as f:
+            content = f.read()
+        if hashlib.sha256(content).hexdigest() != digest:
+            raise ValueError(f"Archived page {digest} is corrupt")
+        return json.loads(content)
+
+    def replay(self, run_id: str) -> 'ArchiveReplay':
+        return ArchiveReplay(self, run_id)
+
+    def disk_usage(self) -> int:
+        return sum(path.stat().st_size for path in self.archive_dir.rglob('*') if path.is_file())
+
+
+class ArchiveReplay:
+    """Serves a run's archived pages by offset, in the order they were first fetched"""
+
+    def __init__(self, archive: PageArchive, run_id: str):
+        self.archive = archive
+        self.run_id = run_id
+        self.started_at = datetime.strptime(run_id, RUN_ID_FORMAT)
+        self._pages = defaultdict(deque)
+        for entry in archive.pages(run_id):
+            self._pages[entry['offset']].append(entry['sha256'])
+
+    def page(self, offset: int) -> Optional[Dict]:
+        digests = self._pages.get(offset)
+        if not digests:
+            logger.warning(f"Run {self.run_id} has no archived page at offset {offset}")
+            return None
+        # Re-fetches were archived as later copies; the last copy answers any further request
+        digest = digests.popleft() if len(digests) > 1 else digests[0]
+        try:
+            return self.archive.load_page(digest)
+        except Exception as e:
+            logger.error(f"Error reading archived page at offset {offset}: {e}")
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect the raw TopHat API page archive'
+    )
+    parser.add_argument(
+        '--archive-dir',
+        default=ARCHIVE_DIR,
+        help=f'Archive directory (default: {ARCHIVE_DIR})'
+    )
+    parser.add_argument(
+        '--list',
+        action='store_true',
+        help='List archived runs'
+    )
+    parser.add_argument(
+        '--run',
+        help='Print the archived page list for one run'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    archive = PageArchive(args.archive_dir)
+
+    if args.run:
+        for entry in archive.pages(args.run):
+            print(f"offset {entry['offset']:>7}  rows {entry['rows']:>4}  total {entry['total']}  {entry['sha256'][:12]}")
+        return 0
+
+    for run_id in archive.runs():
+        pages = archive.pages(run_id)
+        print(f"{run_id}: {len(pages)} pages, {sum(p['rows'] for p in pages)} rows")
+    print(f"Archive size: {archive.disk_usage() / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+
+Manifest of output artifacts (fetched/new records, reconciliation and --profile reports).
+
+Each file is registered with its run id, kind, size and SHA-256 when it is written,
+so retention (count, age, total bytes) is a query on the manifest instead of a
+glob + strptime over the output directory. Shared by the monitor's auto-cleanup
+and cleanup_files.py.
+
+"""
+
+import fnmatch
+import hashlib
+import logging
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+CATALOG_FILE = "catalog.sqlite"
+RUN_ID_FORMAT = '%Y%m%d_%H%M%S'
+
+# kind -> filename pattern (also used to adopt files written before the catalog existed)
+ARTIFACT_KINDS = {
+    'fetched_csv': 'fetched_records_*.csv',
+    'fetched_json': 'fetched_records_*.json',
+    'new_csv': 'new_records_*.csv',
+    'new_json': 'new_records_*.json',
+    'reconciliation': 'reconciliation_*.json',
+    'quarantine': 'quarantine_*.jsonl',
+    'profile': 'profile_*',  # --profile report directories
+}
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    name TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    registered TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_kind_run ON artifacts (kind, run_id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_run ON artifacts (run_id);
+"""
+
+
+def kind_for(filename: str) -> Optional[str]:
+    for kind, pattern in ARTIFACT_KINDS.items():
+        if fnmatch.fnmatch(filename, pattern):
+            return kind
+    return None
+
+
+def artifact_size(filepath: Path) -> int:
+    if filepath.is_dir():
+        return sum(path.stat().st_size for path in filepath.rglob('*') if path.is_file())
+    return filepath.stat().st_size
+
+
+def file_sha256(filepath: Path) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OutputCatalog:
+
+    def __init__(self, output_dir: str, readonly: bool = False):
+        """readonly writes nothing (the local API server, dry runs); a directory without a
+        catalog yet is adopted into a throwaway in-memory one"""
+        self.output_dir = Path(output_dir)
+        db_path = self.output_dir / CATALOG_FILE
+        self._lock = threading.Lock()
+        if readonly and db_path.exists():
+            self.conn = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True,
+                                        check_same_thread=False, timeout=60)
+            return
+        if readonly:
+            self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+            self.adopt()
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        is_new = not db_path.exists()
+        # The pipeline's write stage registers files from its own thread
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+        self.conn.executescript(SCHEMA)
+        if is_new:
+            self.adopt()
+
+    def close(self):
+        self.conn.close()
+
+    def register(self, filepath: Path, run_id: str, kind: Optional[str] = None):
+        """Record a freshly written artifact"""
+        filepath = Path(filepath)
+        kind = kind or kind_for(filepath.name)
+        if kind is None:
+            logger.debug(f"Not cataloguing {filepath.name}: unknown artifact kind")
+            return
+        try:
+            size = artifact_size(filepath)
+            # Report directories are kept or deleted whole; only files get a checksum
+            sha256 = None if filepath.is_dir() else file_sha256(filepath)
+        except OSError as e:
+            logger.warning(f"Could not catalog {filepath.name}: {e}")
+            return
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO artifacts (name, run_id, kind, size, sha256, registered) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (filepath.name, run_id, kind, size, sha256, datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def adopt(self) -> int:
+        """One-time scan for artifacts written before the catalog existed (no checksum)"""
+        rows = []
+        for kind, pattern in ARTIFACT_KINDS.items():
+            for filepath in self.output_dir.glob(pattern):
+                parts = filepath.stem.split('_')
+                run_id = '_'.join(parts[-2:])
+                try:
+                    datetime.strptime(run_id, RUN_ID_FORMAT)
+                except ValueError:
+                    logger.warning(f"Could not parse timestamp from {filepath.name}")
+                    continue
+                rows.append((filepath.name, run_id, kind, artifact_size(filepath), None,
+                             datetime.now().isoformat()))
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO artifacts (name, run_id, kind, size, sha256, registered) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+        if rows:
+            logger.info(f"Catalog: adopted {len(rows)} existing files in {self.output_dir}")
+        return len(rows)
+
+    def artifacts(self, kind: Optional[str] = None) -> List[Dict]:
+        """Catalogued artifacts, newest run first"""
+        sql = "SELECT name, run_id, kind, size, sha256 FROM artifacts"
+        params: Tuple = ()
+        if kind:
+            sql += " WHERE kind = ?"
+            params = (kind,)
+        sql += " ORDER BY run_id DESC"
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [{'name': r[0], 'run_id': r[1], 'kind': r[2], 'size': r[3], 'sha256': r[4]} for r in rows]
+
+    def expired(self, kinds: Optional[List[str]] = None, keep_count: Optional[int] = None,
+                max_age_days: Optional[int] = None, max_bytes: Optional[int] = None) -> List[Dict]:
+        """Artifacts a retention policy would delete (oldest runs first); keep_count None
+        sets no count limit, 0 deletes every run"""
+        kinds = kinds or list(ARTIFACT_KINDS)
+        doomed: Dict[str, Dict] = {}
+        with self._lock:
+            for kind in kinds:
+                if keep_count == 0:
+                    rows = self.conn.execute(
+                        "SELECT name, run_id, kind, size FROM artifacts WHERE kind = ?", (kind,)
+                    ).fetchall()
+                    for row in rows:
+                        doomed[row[0]] = {'name': row[0], 'run_id': row[1], 'kind': row[2], 'size': row[3]}
+                elif keep_count is not None:
+                    rows = self.conn.execute(
+                        "SELECT name, run_id, kind, size FROM artifacts WHERE kind = ? AND run_id < ("
+                        "  SELECT MIN(run_id) FROM (SELECT DISTINCT run_id FROM artifacts WHERE kind = ? "
+                        "  ORDER BY run_id DESC LIMIT ?))",
+                        (kind, kind, keep_count)
+                    ).fetchall()
+                    for row in rows:
+                        doomed[row[0]] = {'name': row[0], 'run_id': row[1], 'kind': row[2], 'size': row[3]}
+
+                if max_age_days is not None:
+                    cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime(RUN_ID_FORMAT)
+                    rows = self.conn.execute(
+                        "SELECT name, run_id, kind, size FROM artifacts WHERE kind = ? AND run_id < ?",
+                        (kind, cutoff)
+                    ).fetchall()
+                    for row in rows:
+                        doomed[row[0]] = {'name': row[0], 'run_id': row[1], 'kind': row[2], 'size': row[3]}
+
+            if max_bytes is not None:
+                placeholders = ', '.join('?' for _ in kinds)
+                runs = self.conn.execute(
+                    f"SELECT run_id, SUM(size) FROM artifacts WHERE kind IN ({placeholders}) "
+                    f"GROUP BY run_id ORDER BY run_id DESC", kinds
+                ).fetchall()
+                used = 0
+                over_budget = []
+                for i, (run_id, size) in enumerate(runs):
+                    used += size
+                    # The newest run is always kept, whatever its size
+                    if i > 0 and used > max_bytes:
+                        over_budget.append(run_id)
+                for run_id in over_budget:
+                    rows = self.conn.execute(
+                        f"SELECT name, run_id, kind, size FROM artifacts WHERE run_id = ? "
+                        f"AND kind IN ({placeholders})", [run_id] + kinds
+                    ).fetchall()
+                    for row in rows:
+                        doomed[row[0]] = {'name': row[0], 'run_id': row[1], 'kind': row[2], 'size': row[3]}
+
+        return sorted(doomed.values(), key=lambda a: a['run_id'])
+
+    def apply(self, kinds: Optional[List[str]] = None, keep_count: Optional[int] = None,
+              max_age_days: Optional[int] = None, max_bytes: Optional[int] = None,
+              dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+        """Delete expired artifacts; returns kept/deleted counts per kind"""
+        kinds = kinds or list(ARTIFACT_KINDS)
+        doomed = self.expired(kinds, keep_count, max_age_days, max_bytes)
+
+        deleted_names = set()
+        for artifact in doomed:
+            if dry_run:
+                logger.info(f"[DRY RUN] Would delete: {artifact['name']} ({artifact['run_id']})")
+                continue
+            filepath = self.output_dir / artifact['name']
+            try:
+                if filepath.is_dir():
+                    shutil.rmtree(filepath)
+                else:
+                    filepath.unlink()
+                logger.debug(f"Deleted old file: {artifact['name']}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Could not delete {artifact['name']}: {e}")
+                continue
+            deleted_names.add(artifact['name'])
+
+        if deleted_names:
+            with self._lock:
+                self.conn.executemany("DELETE FROM artifacts WHERE name = ?",
+                                      [(name,) for name in deleted_names])
+                self.conn.commit()
+
+        with self._lock:
+            counts = dict(self.conn.execute(
+                "SELECT kind, COUNT(*) FROM artifacts GROUP BY kind"
+            ).fetchall())
+        results = {}
+        for kind in kinds:
+            removed = sum(1 for artifact in doomed if artifact['kind'] == kind)
+            results[kind] = {
+                'kept': counts.get(kind, 0) - (removed if dry_run else 0),
+                'deleted': removed if dry_run else sum(
+                    1 for artifact in doomed if artifact['kind'] == kind and artifact['name'] in deleted_names),
+            }
+        return results
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+
+Columnar (Parquet) snapshots of fetched records, partitioned by fetch date.
+
+python tophat_columnar.py --snapshot-dir tophat_columnar --import tophat_data/fetched_records_*.json
+
+Requires pyarrow (optional dependency): pip install pyarrow
+
+"""
+
+import argparse
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+SNAPSHOT_DIR = "tophat_columnar"
+PARTITION_KEY = "fetch_date"
+
+logger = logging.getLogger(__name__)
+
+
+def _to_int(value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_datetime(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _to_str(value) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value)
+
+
+def snapshot_schema():
+    """Typed schema for one snapshot partition"""
+    return pa.schema([
+        ('DocId', pa.int64()),
+        ('Id', pa.int64()),
+        ('Employer', pa.string()),
+        ('Ein', pa.string()),
+        ('Pn', pa.string()),
+        ('PlanName', pa.string()),
+        ('FormType', pa.dictionary(pa.int32(), pa.string())),
+        ('DateReceived', pa.timestamp('s', tz='UTC')),
+        ('PdfLink', pa.string()),
+        ('PdfCreated', pa.int8()),
+        ('TextFilePath', pa.string()),
+        ('Efile', pa.int8()),
+    ])
+
+
+class ColumnarSnapshotWriter:
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR):
+        self.snapshot_dir = Path(snapshot_dir)
+
+    @staticmethod
+    def available() -> bool:
+        return pa is not None
+
+    def partition_dir(self, fetched_at: datetime) -> Path:
+        return self.snapshot_dir / f"{PARTITION_KEY}={fetched_at.strftime('%Y-%m-%d')}"
+
+    def build_table(self, records: List[Dict]):
+        """Convert raw API rows into a typed Arrow table"""
+        columns = {
+            'DocId': pa.array([_to_int(r.get('DocId')) for r in records], pa.int64()),
+            'Id': pa.array([_to_int(r.get('Id')) for r in records], pa.int64()),
+            'Employer': pa.array([_to_str(r.get('Employer')) for r in records], pa.string()),
+            'Ein': pa.array([_to_str(r.get('Ein')) for r in records], pa.string()),
+            'Pn': pa.array([_to_str(r.get('Pn')) for r in records], pa.string()),
+            'PlanName': pa.array([_to_str(r.get('PlanName')) for r in records], pa.string()),
+            'FormType': pa.array([_to_str(r.get('FormType')) for r in records],
+                                 pa.string()).dictionary_encode(),
+            'DateReceived': pa.array([_to_datetime(r.get('DateReceived')) for r in records],
+                                     pa.timestamp('s', tz='UTC')),
+            'PdfLink': pa.array([_to_str(r.get('PdfLink')) for r in records], pa.string()),
+            'PdfCreated': pa.array([_to_int(r.get('PdfCreated')) for r in records], pa.int8()),
+            'TextFilePath': pa.array([_to_str(r.get('TextFilePath')) for r in records], pa.string()),
+            'Efile': pa.array([_to_int(r.get('Efile')) for r in records], pa.int8()),
+        }
+        return pa.Table.from_pydict(columns, schema=snapshot_schema())
+
+    def write_snapshot(self, records: List[Dict], fetched_at: datetime) -> Optional[Path]:
+        """Append one run's records as a new partition file"""
+        if not records:
+            return None
+
+        if not self.available():
+            logger.error("pyarrow is not installed; skipping columnar snapshot")
+            return None
+
+        partition = self.partition_dir(fetched_at)
+        filepath = partition / f"fetched_records_{fetched_at.strftime('%Y%m%d_%H%M%S')}.parquet"
+
+        try:
+            partition.mkdir(parents=True, exist_ok=True)
+            table = self.build_table(records)
+            pq.write_table(table, filepath, compression='zstd')
+            logger.info(f"Saved columnar snapshot of {len(records)} records to {filepath}")
+            return filepath
+        except Exception as e:
+            logger.error(f"Error saving columnar snapshot: {e}")
+            return None
+
+    def dataset(self):
+        """Open every partition as one dataset (filter on fetch_date, DateReceived, ...)"""
+        import pyarrow.dataset as ds
+        return ds.dataset(self.snapshot_dir, format='parquet', partitioning='hive')
+
+
+def _timestamp_from_filename(filepath: Path) -> Optional[datetime]:
+    parts = filepath.stem.split('_')
+    if len(parts) < 3:
+        return None
+    try:
+        return datetime.strptime(f"{parts[-2]}_{parts[-1]}", '%Y%m%d_%H%M%S')
+    except ValueError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write columnar snapshots from fetched_records JSON files'
+    )
+    parser.add_argument(
+        '--snapshot-dir',
+        default=SNAPSHOT_DIR,
+        help=f'Directory for partitioned Parquet snapshots (default: {SNAPSHOT_DIR})'
+    )
+    parser.add_argument(
+        '--import',
+        dest='import_files',
+        nargs='+',
+        required=True,
+        help='fetched_records_TIMESTAMP.json files to convert'
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Enable debug logging'
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    writer = ColumnarSnapshotWriter(args.snapshot_dir)
+    if not writer.available():
+        logger.error("pyarrow is required: pip install pyarrow")
+        return 1
+
+    written = 0
+    for name in args.import_files:
+        filepath = Path(name)
+        fetched_at = _timestamp_from_filename(filepath)
+        if fetched_at is None:
+            logger.warning(f"Could not parse timestamp from {filepath.name}, skipping")
+            continue
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading {filepath}: {e}")
+            continue
+        if writer.write_snapshot(records, fetched_at):
+            written += 1
+
+    print(f"Imported {written} of {len(args.import_files)} files into {args.snapshot_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
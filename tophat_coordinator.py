@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+
+Split one full scan across several hosts using a shared SQLite work queue.
+
+python tophat_coordinator.py init --db /shared/tophat_scan.sqlite
+python tophat_coordinator.py worker --db /shared/tophat_scan.sqlite      (on each host)
+python tophat_coordinator.py status --db /shared/tophat_scan.sqlite
+python tophat_coordinator.py merge --db /shared/tophat_scan.sqlite --email-config email_config.json
+
+Chunks of the offset range are leased with a timeout. If a worker dies, only its
+leased chunks are handed out again once the lease expires. Each scan belongs to one
+--form-type, so workers for different form types can share the file.
+
+Every page reports the API total. When it has moved since the scan was created, the
+worker widens its chunk by the difference so rows that shifted across the chunk
+boundary are still fetched (duplicates are dropped by Id), and merge re-reads the
+top pages for filings that arrived after chunk 0 was fetched.
+
+"""
+
+import argparse
+import json
+import logging
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import tophat_api_monitor
+from tophat_api_monitor import DEFAULT_FORM_TYPE, FORM_TYPES, RECORDS_PER_PAGE, TopHatAPIMonitor, form_type_paths
+
+COORDINATOR_DB = "tophat_scan.sqlite"
+CHUNK_PAGES = 20
+LEASE_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id TEXT PRIMARY KEY,
+    created TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    form_type TEXT NOT NULL DEFAULT 'tophat'
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    scan_id TEXT NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scan_id, start_offset)
+);
+CREATE TABLE IF NOT EXISTS rows (
+    scan_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (scan_id, id)
+);
+"""
+
+
+class ScanCoordinator:
+
+    def __init__(self, db_path: str = COORDINATOR_DB):
+        self.db_path = db_path
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+        # Queue files created before scans carried a form type
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(scans)")}
+        if 'form_type' not in columns:
+            self.conn.execute(f"ALTER TABLE scans ADD COLUMN form_type TEXT NOT NULL "
+                              f"DEFAULT '{DEFAULT_FORM_TYPE}'")
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def create_scan(self, total: int, chunk_pages: int = CHUNK_PAGES,
+                    form_type: str = DEFAULT_FORM_TYPE) -> str:
+        """Register a scan and split [0, total) into leasable chunks"""
+        # Readable, but unique even for scans created in the same second
+        scan_id = f"{form_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        chunk_size = chunk_pages * RECORDS_PER_PAGE
+        self._transaction()
+        try:
+            self.conn.execute(
+                "INSERT INTO scans (scan_id, created, total, status, form_type) VALUES (?, ?, ?, 'open', ?)",
+                (scan_id, datetime.now().isoformat(), total, form_type)
+            )
+            self.conn.executemany(
+                "INSERT INTO chunks (scan_id, start_offset, end_offset, status) VALUES (?, ?, ?, 'pending')",
+                [(scan_id, start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Created scan {scan_id}: {total} records in chunks of {chunk_size}")
+        return scan_id
+
+    def current_scan(self, form_type: str = DEFAULT_FORM_TYPE) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT scan_id FROM scans WHERE status = 'open' AND form_type = ? "
+            "ORDER BY created DESC LIMIT 1",
+            (form_type,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def scan_total(self, scan_id: str) -> int:
+        """The API total when the scan was created (the chunks were cut from it)"""
+        return self.conn.execute("SELECT total FROM scans WHERE scan_id = ?", (scan_id,)).fetchone()[0]
+
+    def lease_chunk(self, scan_id: str, worker: str, lease_seconds: int = LEASE_SECONDS) -> Optional[Dict]:
+        """Claim the next pending (or expired) chunk for this worker"""
+        now = time.time()
+        self._transaction()
+        try:
+            row = self.conn.execute(
+                "SELECT start_offset, end_offset FROM chunks "
+                "WHERE scan_id = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                "ORDER BY start_offset LIMIT 1",
+                (scan_id, now)
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE chunks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE scan_id = ? AND start_offset = ?",
+                (worker, now + lease_seconds, scan_id, row[0])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return {'start': row[0], 'end': row[1]}
+
+    def renew_lease(self, scan_id: str, start: int, worker: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+        cursor = self.conn.execute(
+            "UPDATE chunks SET lease_expires = ? "
+            "WHERE scan_id = ? AND start_offset = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease_seconds, scan_id, start, worker)
+        )
+        return cursor.rowcount == 1
+
+    def release_chunk(self, scan_id: str, start: int, worker: str):
+        self.conn.execute(
+            "UPDATE chunks SET status = 'pending', worker = NULL, lease_expires = 0 "
+            "WHERE scan_id = ? AND start_offset = ? AND worker = ?",
+            (scan_id, start, worker)
+        )
+
+    def _insert_rows(self, scan_id: str, rows: List[Dict]) -> int:
+        cursor = self.conn.executemany(
+            "INSERT OR IGNORE INTO rows (scan_id, id, data) VALUES (?, ?, ?)",
+            [(scan_id, str(row['Id']), json.dumps(row)) for row in rows if row.get('Id') is not None]
+        )
+        return cursor.rowcount
+
+    def add_rows(self, scan_id: str, rows: List[Dict]) -> int:
+        """Store rows outside any chunk; returns how many were not already stored"""
+        self._transaction()
+        try:
+            added = self._insert_rows(scan_id, rows)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def complete_chunk(self, scan_id: str, start: int, worker: str, rows: List[Dict]):
+        """Store a chunk's rows and mark it done in one transaction"""
+        self._transaction()
+        try:
+            self._insert_rows(scan_id, rows)
+            self.conn.execute(
+                "UPDATE chunks SET status = 'done', lease_expires = 0 WHERE scan_id = ? AND start_offset = ?",
+                (scan_id, start)
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def progress(self, scan_id: str) -> Dict:
+        counts = dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM chunks WHERE scan_id = ? GROUP BY status", (scan_id,)
+        ).fetchall())
+        rows = self.conn.execute("SELECT COUNT(*) FROM rows WHERE scan_id = ?", (scan_id,)).fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0),
+            'leased': counts.get('leased', 0),
+            'done': counts.get('done', 0),
+            'rows': rows,
+        }
+
+    def merged_records(self, scan_id: str) -> List[Dict]:
+        return [json.loads(data) for (data,) in
+                self.conn.execute("SELECT data FROM rows WHERE scan_id = ?", (scan_id,))]
+
+    def mark_merged(self, scan_id: str):
+        self.conn.execute("UPDATE scans SET status = 'merged' WHERE scan_id = ?", (scan_id,))
+
+
+def chunk_offsets(start: int, end: int, drift: int) -> List[int]:
+    """Page offsets covering a chunk after the API total moved by drift: filings added above
+    push its rows down (fetch further), filings removed above pull them up (start earlier)"""
+    low = max(start + min(drift, 0), 0) // RECORDS_PER_PAGE * RECORDS_PER_PAGE
+    return list(range(low, end + max(drift, 0), RECORDS_PER_PAGE))
+
+
+def run_worker(coordinator: ScanCoordinator, monitor: TopHatAPIMonitor, worker: str,
+               lease_seconds: int = LEASE_SECONDS) -> int:
+    """Fetch leased chunks until the current scan has none left; returns chunks completed"""
+    scan_id = coordinator.current_scan(monitor.form_type)
+    if scan_id is None:
+        logger.info(f"No open {monitor.form_type} scan to work on")
+        return 0
+    scan_total = coordinator.scan_total(scan_id)
+
+    completed = 0
+    while True:
+        chunk = coordinator.lease_chunk(scan_id, worker, lease_seconds)
+        if chunk is None:
+            break
+
+        logger.info(f"{worker}: leased offsets {chunk['start']}-{chunk['end']}")
+        rows = []
+        failed = False
+        fetched = set()
+        pending = chunk_offsets(chunk['start'], chunk['end'], 0)
+        while pending:
+            offset = pending.pop(0)
+            data = monitor.fetch_page(offset)
+            if data is None:
+                failed = True
+                break
+            fetched.add(offset)
+            rows.extend(data.get('rows', []))
+            # Re-checked on every page, since the total can move while the chunk is fetched
+            drift = data.get('total', scan_total) - scan_total
+            if drift:
+                widened = [o for o in chunk_offsets(chunk['start'], chunk['end'], drift)
+                           if o not in fetched and o not in pending]
+                if widened:
+                    logger.info(f"{worker}: API total moved by {drift}; also fetching offsets {widened}")
+                    pending = sorted(pending + widened)
+            coordinator.renew_lease(scan_id, chunk['start'], worker, lease_seconds)
+            monitor.pace()
+
+        if failed:
+            logger.warning(f"{worker}: giving chunk {chunk['start']} back after a fetch error")
+            coordinator.release_chunk(scan_id, chunk['start'], worker)
+            break
+
+        coordinator.complete_chunk(scan_id, chunk['start'], worker, rows)
+        completed += 1
+
+    logger.info(f"{worker}: completed {completed} chunk(s)")
+    return completed
+
+
+def top_up(coordinator: ScanCoordinator, monitor: TopHatAPIMonitor, scan_id: str,
+           max_pages: int = CHUNK_PAGES) -> Optional[int]:
+    """Fetch the leading pages again for filings added since chunk 0 was fetched; stops at the
+    first page holding a stored Id. Returns rows added, or None if a page failed"""
+    added = 0
+    for page in range(max_pages):
+        data = monitor.fetch_page(page * RECORDS_PER_PAGE)
+        if data is None:
+            return None
+        rows = data.get('rows', [])
+        new = coordinator.add_rows(scan_id, rows)
+        added += new
+        if new < len(rows) or not rows:
+            return added
+        monitor.pace()
+    logger.warning(f"Top-up stopped after {max_pages} all-new pages")
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Coordinate one TopHat scan across several worker hosts'
+    )
+    parser.add_argument(
+        'command',
+        choices=['init', 'worker', 'status', 'merge'],
+        help='init a scan, run a worker, show status, or merge and notify once'
+    )
+    parser.add_argument(
+        '--db',
+        default=COORDINATOR_DB,
+        help=f'Shared SQLite work-queue file (default: {COORDINATOR_DB})'
+    )
+    parser.add_argument(
+        '--chunk-pages',
+        type=int,
+        default=CHUNK_PAGES,
+        help=f'Pages per leased chunk (default: {CHUNK_PAGES})'
+    )
+    parser.add_argument(
+        '--lease-seconds',
+        type=int,
+        default=LEASE_SECONDS,
+        help=f'Lease timeout before a chunk is handed to another worker (default: {LEASE_SECONDS})'
+    )
+    parser.add_argument(
+        '--worker-id',
+        default=socket.gethostname(),
+        help='Name recorded on leased chunks (default: hostname)'
+    )
+    parser.add_argument(
+        '--form-type',
+        choices=sorted(FORM_TYPES),
+        default=DEFAULT_FORM_TYPE,
+        help=f'Form type this scan covers (default: {DEFAULT_FORM_TYPE})'
+    )
+    parser.add_argument('--state-file', default=tophat_api_monitor.STATE_FILE)
+    parser.add_argument('--output-dir', default=tophat_api_monitor.OUTPUT_DIR)
+    parser.add_argument('--baseline-file', default=tophat_api_monitor.BASELINE_FILE)
+    parser.add_argument('--email-config', help='Path to email configuration JSON file (merge only)')
+    parser.add_argument('--reference-file', help='Reference CSV with EIN-to-address mappings (merge only)')
+    parser.add_argument('--no-email', action='store_true', help='Disable email (merge only)')
+
+    args = parser.parse_args()
+    tophat_api_monitor.configure_logging()
+
+    coordinator = ScanCoordinator(args.db)
+
+    paths = form_type_paths(args.form_type, args.state_file, args.output_dir, args.baseline_file)
+
+    if args.command == 'status':
+        scan_id = coordinator.current_scan(args.form_type)
+        if scan_id is None:
+            print(f"No open {args.form_type} scan")
+            return 0
+        progress = coordinator.progress(scan_id)
+        print(f"Scan {scan_id}: {progress['done']} done, {progress['leased']} leased, "
+              f"{progress['pending']} pending chunks; {progress['rows']} rows stored")
+        return 0
+
+    if args.command == 'init':
+        monitor = TopHatAPIMonitor(output_dir=paths['output_dir'], form_type=args.form_type)
+        data = monitor.fetch_page(0)
+        if data is None:
+            logger.error("Could not read total from the API")
+            return 1
+        scan_id = coordinator.create_scan(data.get('total', 0), args.chunk_pages, args.form_type)
+        print(scan_id)
+        return 0
+
+    if args.command == 'worker':
+        monitor = TopHatAPIMonitor(output_dir=paths['output_dir'], form_type=args.form_type)
+        run_worker(coordinator, monitor, args.worker_id, args.lease_seconds)
+        return 0
+
+    # merge
+    scan_id = coordinator.current_scan(args.form_type)
+    if scan_id is None:
+        logger.error(f"No open {args.form_type} scan to merge")
+        return 1
+    progress = coordinator.progress(scan_id)
+    if progress['pending'] or progress['leased']:
+        logger.error(f"Scan {scan_id} is not finished: {progress}")
+        return 1
+
+    email_config = None
+    if args.email_config and not args.no_email:
+        with open(args.email_config, 'r') as f:
+            email_config = json.load(f)
+
+    monitor = TopHatAPIMonitor(
+        email_config=email_config,
+        reference_file=args.reference_file,
+        form_type=args.form_type,
+        **paths
+    )
+    added = top_up(coordinator, monitor, scan_id)
+    if added is None:
+        logger.error(f"Could not re-read the top of the results; scan {scan_id} left open")
+        return 1
+    if added:
+        logger.info(f"Top-up: {added} filing(s) added since the scan started")
+    monitor.run(send_email_notification=not args.no_email, records=coordinator.merged_records(scan_id))
+    coordinator.mark_merged(scan_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+
+Join new filings against bulk PPP loan, WARN notice and DOL FOIA top hat datasets.
+
+The datasets are loaded once into an SQLite index keyed by EIN and by normalized
+employer name (plus event date), so each new record costs a few index probes
+instead of a scan of millions of PPP rows. Each event is keyed by a hash of its
+indexed fields, so ingesting the same file again adds nothing.
+
+python tophat_external.py --ingest ppp public_150k_plus.csv public_up_to_150k_1.csv
+python tophat_external.py --ingest warn warn_ca_2020.csv --state CA
+python tophat_external.py --ingest foia tophat_foia.csv
+python tophat_external.py --match "Assumption University" --date 2020-09-09
+
+"""
+
+import argparse
+import csv
+import hashlib
+import logging
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tophat_records import ein_of, normalize_ein, received_of
+
+EXTERNAL_INDEX_FILE = "tophat_external.sqlite"
+MATCH_WINDOW_DAYS = 365  # PPP/WARN events this close to the filing date are flagged
+INGEST_BATCH = 50000
+
+# Candidate column names per field; bulk files from different years/states disagree
+SOURCE_COLUMNS = {
+    'ppp': {
+        'name': ['BorrowerName'],
+        'state': ['BorrowerState'],
+        'date': ['DateApproved'],
+        'amount': ['CurrentApprovalAmount', 'InitialApprovalAmount'],
+        'detail': ['LoanNumber'],
+    },
+    'warn': {
+        'name': ['Company', 'Company Name', 'Employer', 'Employer Name', 'Business Name'],
+        'state': ['State'],
+        'date': ['Notice Date', 'WARN Received Date', 'Received Date', 'Date Received'],
+        'amount': ['Employees Affected', 'No. Of Employees', 'Number of Workers',
+                   'Number of Employees Affected'],
+        'detail': ['City', 'Location'],
+    },
+    'foia': {
+        'ein': ['Sponsor EIN', 'EIN'],
+        'name': ['Employer Name', 'Filing Name'],
+        'state': ['Employer State'],
+        'date': ['Filing Date'],
+        'amount': ['Participants'],
+        'detail': ['Plan Name or Paper Filing Notes', 'Plan Name'],
+    },
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%Y-%m-%dT%H:%M:%S', '%d-%b-%y', '%B %d, %Y']
+
+_PUNCTUATION = re.compile(r"[^A-Z0-9 ]+")
+_SUFFIXES = re.compile(r"\b(THE|INC|INCORPORATED|LLC|LLP|LP|LTD|LIMITED|CORP|CORPORATION|CO|COMPANY|"
+                       r"PC|PLLC|PA|NA|GROUP|HOLDINGS)\b")
+_SPACES = re.compile(r"\s+")
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    source TEXT NOT NULL,
+    ein TEXT,
+    name_key TEXT,
+    name TEXT,
+    state TEXT,
+    event_date TEXT,
+    amount REAL,
+    detail TEXT,
+    row_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ein ON events (ein, event_date) WHERE ein IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_name ON events (name_key, event_date);
+"""
+ROW_KEY_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_events_row_key ON events (row_key)"
+EVENT_FIELDS = ('source', 'ein', 'name_key', 'name', 'state', 'event_date', 'amount', 'detail')
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Upper-case employer name without punctuation or corporate suffixes"""
+    if not name:
+        return ''
+    key = _PUNCTUATION.sub(' ', name.upper().replace('&', ' AND '))
+    key = _SUFFIXES.sub(' ', key)
+    return _SPACES.sub(' ', key).strip()
+
+
+def parse_date(value: Optional[str]) -> Optional[str]:
+    """ISO date (YYYY-MM-DD) from the handful of formats the bulk files use"""
+    if not value:
+        return None
+    value = value.strip()
+    # Some exports append a time of day to the date
+    for candidate in (value, value.split('T')[0].split(' ')[0]):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, fmt).date().isoformat()
+            except ValueError:
+                continue
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).date().isoformat()
+    except ValueError:
+        return None
+
+
+def parse_amount(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(str(value).replace('$', '').replace(',', '').strip())
+    except ValueError:
+        return None
+
+
+def row_key(*values) -> str:
+    """Identity of one event: the same source row always gives the same key"""
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+
+def _pick(row: Dict, candidates: List[str]) -> Optional[str]:
+    for column in candidates:
+        value = row.get(column)
+        if value not in (None, ''):
+            return value.strip()
+    return None
+
+
+def describe(match: Dict) -> str:
+    """One-line digest flag for a matched event"""
+    amount = match['amount']
+    if match['source'] == 'ppp':
+        text = f"PPP loan approved {match['event_date']}"
+        if amount:
+            text += f" (${amount:,.0f})"
+    elif match['source'] == 'warn':
+        text = f"WARN layoff notice {match['event_date']}"
+        if amount:
+            text += f" ({amount:,.0f} workers)"
+    else:
+        text = f"Earlier top hat filing {match['event_date']}"
+        if match['detail']:
+            text += f": {match['detail']}"
+    if match['state']:
+        text += f", {match['state']}"
+    return f"{text} - {match['name']}"
+
+
+class ExternalIndex:
+
+    def __init__(self, db_path: str = EXTERNAL_INDEX_FILE, readonly: bool = False):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if readonly:
+            self.conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                        check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            return
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        if 'row_key' not in {row[1] for row in self.conn.execute("PRAGMA table_info(events)")}:
+            self._add_row_keys()
+        self.conn.execute(ROW_KEY_INDEX)
+
+    def close(self):
+        self.conn.close()
+
+    def _add_row_keys(self):
+        """Key an index built before events had one, dropping rows ingested twice"""
+        logger.info("Adding row keys to the external index (one-time)")
+        self.conn.create_function('row_key', len(EVENT_FIELDS), row_key, deterministic=True)
+        fields = ', '.join(EVENT_FIELDS)
+        with self.conn:
+            self.conn.execute("ALTER TABLE events ADD COLUMN row_key TEXT")
+            self.conn.execute(f"UPDATE events SET row_key = row_key({fields})")
+            removed = self.conn.execute(
+                "DELETE FROM events WHERE rowid NOT IN (SELECT MIN(rowid) FROM events GROUP BY row_key)"
+            ).rowcount
+        if removed:
+            logger.info(f"Removed {removed} duplicate events")
+
+    def ingest(self, source: str, filepath: str, state: Optional[str] = None) -> int:
+        """Load one bulk CSV for a source ('ppp', 'warn' or 'foia')"""
+        columns = SOURCE_COLUMNS[source]
+        sql = ("INSERT OR IGNORE INTO events (source, ein, name_key, name, state, event_date, amount, "
+               "detail, row_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+        count = 0
+        added = 0
+        batch = []
+        with open(filepath, 'r', encoding='utf-8', errors='replace', newline='') as f:
+            with self._lock:
+                for row in csv.DictReader(f):
+                    name = _pick(row, columns['name'])
+                    ein = normalize_ein(_pick(row, columns.get('ein', [])))
+                    name_key = normalize_name(name)
+                    if not name_key and not ein:
+                        continue
+                    values = (
+                        source, ein, name_key or None, name,
+                        _pick(row, columns['state']) or state,
+                        parse_date(_pick(row, columns['date'])),
+                        parse_amount(_pick(row, columns['amount'])),
+                        _pick(row, columns['detail']),
+                    )
+                    batch.append(values + (row_key(*values),))
+                    if len(batch) >= INGEST_BATCH:
+                        added += self.conn.executemany(sql, batch).rowcount
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    added += self.conn.executemany(sql, batch).rowcount
+                    count += len(batch)
+                self.conn.commit()
+        logger.info(f"Ingested {added} new {source} rows from {filepath}"
+                    f"{f' ({count - added} already indexed)' if count > added else ''}")
+        return added
+
+    def matches(self, ein: Optional[str], employer: Optional[str], filed: Optional[datetime],
+                window_days: int = MATCH_WINDOW_DAYS) -> List[Dict]:
+        """Events for this EIN or normalized name, within window_days of the filing"""
+        clauses = []
+        params: List = []
+        ein = normalize_ein(ein)
+        if ein:
+            clauses.append("ein = ?")
+            params.append(ein)
+        name_key = normalize_name(employer)
+        if name_key:
+            clauses.append("name_key = ?")
+            params.append(name_key)
+        if not clauses:
+            return []
+
+        sql = f"SELECT * FROM events WHERE ({' OR '.join(clauses)})"
+        if filed is not None:
+            sql += " AND event_date BETWEEN ? AND ?"
+            params += [(filed - timedelta(days=window_days)).date().isoformat(),
+                       (filed + timedelta(days=window_days)).date().isoformat()]
+        sql += " ORDER BY event_date"
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def annotate(self, records: List[Dict], window_days: int = MATCH_WINDOW_DAYS) -> int:
+        """Set ExternalFlags on records with nearby PPP/WARN/FOIA events; returns records flagged"""
+        flagged = 0
+        for record in records:
+            found = self.matches(ein_of(record), record.get('Employer'), received_of(record),
+                                 window_days)
+            flags = [describe(match) for match in found]
+            if flags:
+                record['ExternalFlags'] = flags
+                flagged += 1
+        return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Index PPP, WARN and FOIA bulk data for joining against new top hat filings'
+    )
+    parser.add_argument(
+        '--db',
+        default=EXTERNAL_INDEX_FILE,
+        help=f'Index file (default: {EXTERNAL_INDEX_FILE})'
+    )
+    parser.add_argument(
+        '--ingest',
+        nargs='+',
+        metavar=('SOURCE', 'CSV'),
+        help=f'Load CSV files for one source ({", ".join(SOURCE_COLUMNS)})'
+    )
+    parser.add_argument(
+        '--state',
+        help='State to record for WARN files that have no state column'
+    )
+    parser.add_argument(
+        '--match',
+        metavar='EMPLOYER',
+        help='Show events for an employer name'
+    )
+    parser.add_argument('--ein', help='EIN to match (with or instead of --match)')
+    parser.add_argument('--date', help='Filing date for the match window (YYYY-MM-DD)')
+    parser.add_argument(
+        '--window-days',
+        type=int,
+        default=MATCH_WINDOW_DAYS,
+        help=f'Days either side of the filing date (default: {MATCH_WINDOW_DAYS})'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    index = ExternalIndex(args.db)
+
+    if args.ingest:
+        source, files = args.ingest[0], args.ingest[1:]
+        if source not in SOURCE_COLUMNS or not files:
+            parser.error(f"--ingest needs a source ({', '.join(SOURCE_COLUMNS)}) and at least one CSV")
+        for filepath in files:
+            index.ingest(source, filepath, state=args.state)
+
+    if args.match or args.ein:
+        filed = datetime.fromisoformat(args.date) if args.date else None
+        for match in index.matches(args.ein, args.match, filed, args.window_days):
+            print(describe(match))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
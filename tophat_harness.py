@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+
+End-to-end harness for TopHatAPIMonitor.run against local stand-ins.
+
+A mock DOL search API and ProPublica endpoint (one local HTTP server) and an SMTP
+sink replace the network, so the real run() path (requests, pagination, diff,
+reconciliation, baseline, digest email) is exercised at scale without leaving the
+machine. Rows are a pure function of their Id, and every mutation is scripted at
+a fixed offset, so a scenario plays out the same way on every run.
+
+Scenarios, in order, against one baseline:
+
+- first_run: no baseline; every row is new (the digest is held back past --max-digest-records)
+- quiet_run: nothing changed; no alert
+- daily_run: a few filings added; exactly those are alerted
+- mid_scan_failure: a page fails once; nothing is alerted and the baseline is kept,
+  then the next run alerts the new filings once
+- renumbered: filings inserted and deleted near the top while the scan is past them,
+  so every later row changes offset; across that run and the next, each new filing
+  is alerted exactly once and the deleted ones are reported removed by the next run
+
+Each run is also held to a time budget (per 100k rows) and a peak-RSS budget.
+
+python tophat_harness.py --rows 90000
+python tophat_harness.py --rows 1000000 --pipeline --report harness_1m.json
+
+"""
+
+import argparse
+import csv
+import email
+import email.policy
+import hashlib
+import json
+import logging
+import re
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+from urllib.parse import parse_qs, urlsplit
+
+import tophat_api_monitor
+from tophat_api_monitor import DIGEST_MAX_RECORDS, TopHatAPIMonitor
+from tophat_logging import configure_logging
+from tophat_profile import peak_rss_mb
+from tophat_records import ID_WIDTH
+
+HARNESS_ROWS = 90_000
+FIRST_ID = 100_000
+BASE_RECEIVED = datetime(2020, 1, 1)
+SECONDS_PER_100K = 60.0  # Wall-time budget per run
+MAX_RSS_MB = 2048.0
+SEARCH_PATH = '/tophatplansearch/Home/Search'
+PROPUBLICA_PATH = '/nonprofits/api/v2/organizations/'
+
+_DOC_ID_LINE = re.compile(r'^DocId: (\d+)\r?$', re.M)
+
+logger = logging.getLogger(__name__)
+
+
+def harness_row(record_id: int) -> Dict:
+    """The API row for an Id; every field derives from the Id"""
+    return {
+        'DocId': str(record_id),
+        'Id': str(record_id).zfill(ID_WIDTH),
+        'Employer': f"Harness Employer {record_id % 9973}",
+        'Ein': str(100_000_000 + (record_id * 7919) % 900_000_000),
+        'Pn': '001',
+        'PlanName': f"Top Hat Plan {record_id % 7}",
+        'FormType': 'Top Hat',
+        'DateReceived': (BASE_RECEIVED + timedelta(minutes=record_id - FIRST_ID)).strftime('%Y-%m-%dT%H:%M:%S'),
+        'PdfLink': None,
+        'PdfCreated': 1,
+        'TextFilePath': None,
+        'Efile': 1,
+    }
+
+
+class MockDOL:
+    """Search results (newest Id first) and ProPublica answers, with scripted failures and mutations"""
+
+    def __init__(self, rows: int):
+        self.ids = array('q', range(FIRST_ID, FIRST_ID + rows))  # Ascending
+        self._lock = threading.Lock()
+        self.fail_once: Set[int] = set()
+        self.after_page: Dict[int, Callable[[], None]] = {}
+        self.search_requests = 0
+        self.propublica_requests: Counter = Counter()
+
+    def current_ids(self) -> Set[str]:
+        with self._lock:
+            return {str(record_id).zfill(ID_WIDTH) for record_id in self.ids}
+
+    def add(self, count: int) -> List[str]:
+        """New filings at the top of the results"""
+        with self._lock:
+            start = self.ids[-1] + 1
+            self.ids.extend(range(start, start + count))
+        return [str(record_id).zfill(ID_WIDTH) for record_id in range(start, start + count)]
+
+    def remove_at(self, positions: List[int]) -> List[str]:
+        """Delete the filings at these result positions (0 = newest)"""
+        with self._lock:
+            doomed = [self.ids[len(self.ids) - 1 - position] for position in positions]
+            for record_id in doomed:
+                self.ids.remove(record_id)
+        return [str(record_id).zfill(ID_WIDTH) for record_id in doomed]
+
+    def search(self, offset: int, limit: int):
+        with self._lock:
+            self.search_requests += 1
+            if offset in self.fail_once:
+                self.fail_once.discard(offset)
+                return 500, {'error': 'scripted failure'}
+            end = len(self.ids) - offset
+            page = [harness_row(record_id) for record_id in reversed(self.ids[max(end - limit, 0):max(end, 0)])]
+            payload = {'total': len(self.ids), 'rows': page}
+            mutation = self.after_page.pop(offset, None)
+        if mutation:
+            mutation()
+        return 200, payload
+
+    def propublica(self, ein: str):
+        with self._lock:
+            self.propublica_requests[ein] += 1
+        if int(ein) % 3:
+            return 404, {}
+        return 200, {'organization': {'ein': ein, 'name': 'Harness Nonprofit'}}
+
+
+def make_handler(mock: MockDOL):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path == SEARCH_PATH:
+                params = parse_qs(parts.query)
+                status, payload = mock.search(int(params['offset'][0]), int(params['limit'][0]))
+            elif parts.path.startswith(PROPUBLICA_PATH):
+                status, payload = mock.propublica(parts.path[len(PROPUBLICA_PATH):].split('.')[0])
+            else:
+                status, payload = 404, {}
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Accepts any login and keeps every message (plain SMTP, no STARTTLS)"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSession)
+        self.messages: List[bytes] = []
+        self.lock = threading.Lock()
+
+    def digests(self, start: int = 0) -> List[Dict]:
+        """Subject and DocIds of each message received since index start"""
+        with self.lock:
+            messages = self.messages[start:]
+        digests = []
+        for raw in messages:
+            message = email.message_from_bytes(raw, policy=email.policy.default)
+            text = message.get_body(('plain',)).get_content()
+            digests.append({'subject': message['Subject'], 'doc_ids': _DOC_ID_LINE.findall(text)})
+        return digests
+
+
+class SMTPSession(socketserver.StreamRequestHandler):
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        self.reply('220 harness ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.wfile.write(b'250-harness\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif command.startswith('AUTH'):
+                self.reply('235 Authentication successful')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b'.\n', b''):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                with self.server.lock:
+                    self.server.messages.append(b''.join(lines))
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+def file_digest(filepath: Path) -> Optional[str]:
+    if not filepath.exists():
+        return None
+    return hashlib.sha256(filepath.read_bytes()).hexdigest()
+
+
+def baseline_ids(filepath: Path) -> Set[str]:
+    if not filepath.exists():
+        return set()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return {row['Id'] for row in csv.DictReader(f) if row.get('Id')}
+
+
+class Harness:
+
+    def __init__(self, workdir: Path, rows: int = HARNESS_ROWS, pipeline: bool = False,
+                 seconds_per_100k: float = SECONDS_PER_100K, max_rss_mb: float = MAX_RSS_MB,
+                 max_digest_records: int = DIGEST_MAX_RECORDS):
+        self.workdir = workdir
+        self.rows = rows
+        self.pipeline = pipeline
+        self.time_budget = max(30.0, seconds_per_100k * rows / 100_000)
+        self.max_rss_mb = max_rss_mb
+        self.max_digest_records = max_digest_records
+        self.mock = MockDOL(rows)
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(self.mock))
+        self.smtp = SMTPSink()
+        self.results: List[Dict] = []
+        self.state_file = workdir / 'state.json'
+        self.baseline_file = workdir / 'baseline.csv'
+
+    def start(self):
+        for server in (self.http, self.smtp):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.http.server_address[1]}"
+        # Point the monitor at the stand-ins, without its politeness delays
+        tophat_api_monitor.BASE_URL = base + SEARCH_PATH
+        tophat_api_monitor.PROPUBLICA_API_URL = base + PROPUBLICA_PATH + '{ein}.json'
+        tophat_api_monitor.REQUEST_DELAY = 0
+        tophat_api_monitor.PROPUBLICA_DELAY = 0
+
+    def stop(self):
+        self.http.shutdown()
+        self.smtp.shutdown()
+
+    def run_monitor(self, scenario: str) -> Dict:
+        """One monitor run; returns what it alerted and how long it took"""
+        # Run ids (and output file names) have one-second resolution
+        time.sleep(1 - datetime.now().microsecond / 1e6)
+        monitor = TopHatAPIMonitor(
+            state_file=str(self.state_file), output_dir=str(self.workdir / 'out'),
+            baseline_file=str(self.baseline_file), pipeline=self.pipeline,
+            max_digest_records=self.max_digest_records,
+            email_config={'smtp_server': '127.0.0.1', 'smtp_port': self.smtp.server_address[1],
+                          'smtp_starttls': False, 'sender_email': 'monitor@harness',
+                          'sender_password': 'harness', 'recipient_emails': ['desk@harness']},
+        )
+        sent_before = len(self.smtp.messages)
+        requests_before = self.mock.search_requests
+        self.mock.propublica_requests.clear()
+        started = time.perf_counter()
+        monitor.run(send_email_notification=True)
+        seconds = time.perf_counter() - started
+
+        with open(self.state_file, 'r') as f:
+            state = json.load(f)
+        digests = self.smtp.digests(sent_before)
+        alerted = [str(doc_id).zfill(ID_WIDTH) for digest in digests for doc_id in digest['doc_ids']]
+        result = {
+            'scenario': scenario,
+            'seconds': round(seconds, 2),
+            'peak_rss_mb': round(peak_rss_mb() or 0, 1),
+            'search_requests': self.mock.search_requests - requests_before,
+            'state': state,
+            'emails': len(digests),
+            'alerted': alerted,
+            'checks': [],
+        }
+        self.check(result, 'time budget', seconds <= self.time_budget,
+                   f"{seconds:.1f}s of {self.time_budget:.0f}s")
+        self.check(result, 'memory budget', (result['peak_rss_mb'] or 0) <= self.max_rss_mb,
+                   f"{result['peak_rss_mb']} MB of {self.max_rss_mb:.0f} MB")
+        self.check(result, 'no record alerted twice', len(alerted) == len(set(alerted)),
+                   f"{len(alerted) - len(set(alerted))} repeats")
+        lookups = self.mock.propublica_requests
+        self.check(result, 'one ProPublica lookup per EIN', not lookups or max(lookups.values()) == 1,
+                   f"{sum(lookups.values())} lookups for {len(lookups)} EINs")
+        self.results.append(result)
+        return result
+
+    @staticmethod
+    def check(result: Dict, name: str, ok: bool, detail: str = ''):
+        result['checks'].append({'name': name, 'ok': bool(ok), 'detail': detail})
+        if not ok:
+            logger.error(f"{result['scenario']}: FAILED {name} ({detail})")
+
+    def first_run(self):
+        result = self.run_monitor('first_run')
+        expected = self.mock.current_ids()
+        self.check(result, 'every row fetched', result['state']['records_fetched'] == self.rows)
+        self.check(result, 'baseline holds every Id', baseline_ids(self.baseline_file) == expected)
+        held_back = bool(self.max_digest_records) and self.rows > self.max_digest_records
+        if held_back:
+            self.check(result, 'oversized first digest held back',
+                       result['emails'] == 0 and result['state']['digest_suppressed'])
+        else:
+            self.check(result, 'every row alerted', set(result['alerted']) == expected)
+
+    def quiet_run(self):
+        result = self.run_monitor('quiet_run')
+        self.check(result, 'nothing new', result['state']['new_records_found'] == 0)
+        self.check(result, 'no email', result['emails'] == 0, f"{result['emails']} sent")
+
+    def daily_run(self, count: int = 5):
+        added = self.mock.add(count)
+        result = self.run_monitor('daily_run')
+        self.check(result, 'exactly the new filings alerted', sorted(result['alerted']) == sorted(added),
+                   f"{len(result['alerted'])} alerted, {count} added")
+        self.check(result, 'baseline matches the API', baseline_ids(self.baseline_file) == self.mock.current_ids())
+
+    def mid_scan_failure(self, count: int = 3):
+        added = self.mock.add(count)
+        failing = (len(self.mock.ids) // 2 // 100) * 100
+        self.mock.fail_once.add(failing)
+        before = file_digest(self.baseline_file)
+        result = self.run_monitor('mid_scan_failure')
+        self.check(result, 'scan reported incomplete', result['state'].get('scan_complete') is False)
+        self.check(result, 'nothing alerted from a partial scan', result['emails'] == 0,
+                   f"{result['emails']} sent")
+        self.check(result, 'previous baseline kept', file_digest(self.baseline_file) == before)
+        self.check(result, 'failure recorded for --status', bool(result['state'].get('last_error')))
+
+        result = self.run_monitor('mid_scan_failure_recovery')
+        self.check(result, 'new filings alerted once after recovery', sorted(result['alerted']) == sorted(added),
+                   f"{len(result['alerted'])} alerted, {count} added")
+        self.check(result, 'baseline matches the API', baseline_ids(self.baseline_file) == self.mock.current_ids())
+
+    def renumbered(self):
+        added = self.mock.add(4)
+        old_ids = baseline_ids(self.baseline_file)
+        mutation_offset = (len(self.mock.ids) // 3 // 100) * 100
+        changes = {}
+
+        def renumber():
+            # Behind the scan: two filings land on top, three near the top are withdrawn
+            changes['added'] = self.mock.add(2)
+            changes['removed'] = self.mock.remove_at([10, 150, 260])
+
+        self.mock.after_page[mutation_offset] = renumber
+        result = self.run_monitor('renumbered')
+        removed = set(changes['removed'])
+        baseline = baseline_ids(self.baseline_file)
+        self.check(result, 'no surviving Id dropped from the baseline', old_ids - removed <= baseline,
+                   f"{len(old_ids - removed - baseline)} missing")
+        first_alerted = list(result['alerted'])
+
+        result = self.run_monitor('renumbered_followup')
+        expected = sorted(added + changes['added'])
+        every_alert = first_alerted + result['alerted']
+        self.check(result, 'each new filing alerted exactly once across both runs',
+                   sorted(every_alert) == expected,
+                   f"{len(first_alerted)} + {len(result['alerted'])} alerted, {len(expected)} added")
+        # The scan had already passed the withdrawn filings, so only the next run can miss them
+        self.check(result, 'withdrawn filings reported removed',
+                   result['state']['removed_records_found'] == len(removed),
+                   f"{result['state']['removed_records_found']} of {len(removed)}")
+        self.check(result, 'baseline matches the API', baseline_ids(self.baseline_file) == self.mock.current_ids())
+
+    def run_all(self) -> bool:
+        self.start()
+        try:
+            for scenario in (self.first_run, self.quiet_run, self.daily_run, self.mid_scan_failure,
+                             self.renumbered):
+                logger.info(f"Scenario {scenario.__name__} ({len(self.mock.ids)} rows)")
+                scenario()
+        finally:
+            self.stop()
+        return all(check['ok'] for result in self.results for check in result['checks'])
+
+    def report(self) -> str:
+        lines = [f"{'run':<28} {'requests':>10} {'seconds':>8} {'RSS MB':>8}  checks"]
+        for result in self.results:
+            failed = [check['name'] for check in result['checks'] if not check['ok']]
+            lines.append(f"{result['scenario']:<28} {result['search_requests']:>10} {result['seconds']:>8.2f} "
+                         f"{result['peak_rss_mb']:>8.1f}  "
+                         f"{'ok' if not failed else 'FAILED: ' + '; '.join(failed)}")
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Drive TopHatAPIMonitor.run end to end against a local mock API, ProPublica and SMTP sink'
+    )
+    parser.add_argument(
+        '--rows',
+        type=int,
+        default=HARNESS_ROWS,
+        help=f'Filings in the mock API at the start (default: {HARNESS_ROWS}; at least 1000)'
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Run the monitor in --pipeline mode'
+    )
+    parser.add_argument(
+        '--max-digest-records',
+        type=int,
+        default=DIGEST_MAX_RECORDS,
+        help=f'Monitor --max-digest-records (default: {DIGEST_MAX_RECORDS})'
+    )
+    parser.add_argument(
+        '--seconds-per-100k',
+        type=float,
+        default=SECONDS_PER_100K,
+        help=f'Wall-time budget per run, per 100k rows (default: {SECONDS_PER_100K:.0f})'
+    )
+    parser.add_argument(
+        '--max-rss-mb',
+        type=float,
+        default=MAX_RSS_MB,
+        help=f'Peak RSS budget for the whole process (default: {MAX_RSS_MB:.0f})'
+    )
+    parser.add_argument(
+        '--workdir',
+        help='Keep the monitor\'s files here instead of a temporary directory'
+    )
+    parser.add_argument(
+        '--report',
+        help='Also write the results as JSON to this file'
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='Show the monitor\'s own log lines'
+    )
+    args = parser.parse_args()
+
+    if args.rows < 1000:
+        print("--rows must be at least 1000", file=sys.stderr)
+        return 1
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix='tophat_harness_'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    configure_logging(str(workdir / 'harness.log'), log_format='text',
+                      level=logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger(__name__).setLevel(logging.INFO)
+
+    harness = Harness(workdir, rows=args.rows, pipeline=args.pipeline, seconds_per_100k=args.seconds_per_100k,
+                      max_rss_mb=args.max_rss_mb, max_digest_records=args.max_digest_records)
+    passed = harness.run_all()
+    print(harness.report())
+    print(f"{'PASSED' if passed else 'FAILED'} ({args.rows} rows, {'pipeline' if args.pipeline else 'barrier'} mode)")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'rows': args.rows, 'pipeline': args.pipeline, 'passed': passed,
+                       'results': harness.results}, f, indent=2, default=str)
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
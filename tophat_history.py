@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+
+Compressed snapshot history: a periodic full base plus daily deltas keyed by Id.
+
+python tophat_history.py --list
+python tophat_history.py --date 2026-02-14 --output records_20260214.json
+
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tophat_records import as_dict
+
+HISTORY_DIR = "tophat_history"
+MANIFEST_FILE = "manifest.json"
+BASE_INTERVAL = 30  # Deltas written before the next full base
+
+logger = logging.getLogger(__name__)
+
+
+def to_day(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value)[:10]).isoformat()
+
+
+def _write_gzip_json(filepath: Path, payload):
+    tmp_path = filepath.with_name(filepath.name + '.tmp')
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        json.dump(payload, f, separators=(',', ':'), default=str)
+    os.replace(tmp_path, filepath)
+
+
+def _read_gzip_json(filepath: Path):
+    with gzip.open(filepath, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class SnapshotStore:
+
+    def __init__(self, history_dir: str = HISTORY_DIR, base_interval: int = BASE_INTERVAL):
+        self.history_dir = Path(history_dir)
+        self.base_interval = base_interval
+        self.manifest_file = self.history_dir / MANIFEST_FILE
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        self.entries = self._load_manifest()
+
+    def _load_manifest(self) -> List[Dict]:
+        if not self.manifest_file.exists():
+            return []
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f).get('entries', [])
+        except Exception as e:
+            logger.warning(f"Couldn't load history manifest: {e}")
+            return []
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_file.with_name(MANIFEST_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'entries': self.entries}, f, indent=2)
+        os.replace(tmp_path, self.manifest_file)
+
+    def dates(self) -> List[str]:
+        return [entry['date'] for entry in self.entries]
+
+    def load_entry(self, entry: Dict):
+        """Payload of one manifest entry: a list of rows (base) or a delta dict"""
+        return _read_gzip_json(self.history_dir / entry['file'])
+
+    def rebuild(self, as_of) -> Optional[Dict[str, Dict]]:
+        """Return the dataset (Id -> row) as it stood on the given day"""
+        day = to_day(as_of)
+        entries = [entry for entry in self.entries if entry['date'] <= day]
+        if not entries:
+            return None
+
+        base_index = max(i for i, entry in enumerate(entries) if entry['kind'] == 'base')
+        records = {}
+        for row in self.load_entry(entries[base_index]):
+            records[str(row.get('Id'))] = row
+
+        for entry in entries[base_index + 1:]:
+            delta = self.load_entry(entry)
+            for record_id in delta['removed']:
+                records.pop(record_id, None)
+            for row in delta['added']:
+                records[str(row.get('Id'))] = row
+            for row in delta['changed']:
+                records[str(row.get('Id'))] = row
+
+        return records
+
+    def snapshot(self, as_of) -> List[Dict]:
+        """Rows on the given day, newest Id first"""
+        records = self.rebuild(as_of) or {}
+        return sorted(records.values(), key=lambda x: int(x.get('Id', 0) or 0), reverse=True)
+
+    @staticmethod
+    def diff(previous: Dict[str, Dict], current: Dict[str, Dict]) -> Dict:
+        """Added, changed and removed rows between two Id -> row mappings"""
+        return {
+            'added': [row for record_id, row in current.items() if record_id not in previous],
+            'changed': [row for record_id, row in current.items()
+                        if record_id in previous and previous[record_id] != row],
+            'removed': [record_id for record_id in previous if record_id not in current],
+        }
+
+    def record(self, records: List[Dict], run_time: datetime) -> Optional[Dict]:
+        """Store one run's records as a base or a delta against the previous day"""
+        if not records:
+            return None
+
+        day = to_day(run_time)
+        if self.entries and self.entries[-1]['date'] > day:
+            logger.warning(f"History already has entries after {day}; not recording")
+            return None
+
+        # A second run on the same day replaces that day's entry (its file goes only once the
+        # new file and manifest are on disk)
+        replaced = None
+        if self.entries and self.entries[-1]['date'] == day:
+            replaced = self.entries.pop()
+
+        current = {}
+        for row in records:
+            record_id = row.get('Id')
+            if record_id is not None:
+                current[str(record_id)] = as_dict(row)
+
+        previous = self.rebuild(self.entries[-1]['date']) if self.entries else None
+        deltas_since_base = 0
+        for entry in reversed(self.entries):
+            if entry['kind'] == 'base':
+                break
+            deltas_since_base += 1
+
+        delta = self.diff(previous or {}, current)
+        stamp = day.replace('-', '')
+        if previous is None or deltas_since_base >= self.base_interval:
+            filename = f"base_{stamp}.json.gz"
+            _write_gzip_json(self.history_dir / filename, list(current.values()))
+            entry = {'date': day, 'kind': 'base', 'file': filename, 'records': len(current)}
+        else:
+            filename = f"delta_{stamp}.json.gz"
+            _write_gzip_json(self.history_dir / filename, delta)
+            entry = {'date': day, 'kind': 'delta', 'file': filename, 'records': len(current)}
+
+        entry.update({
+            'added': len(delta['added']),
+            'changed': len(delta['changed']),
+            'removed': len(delta['removed']),
+        })
+        self.entries.append(entry)
+        self._save_manifest()
+        if replaced and replaced['file'] != filename:
+            (self.history_dir / replaced['file']).unlink(missing_ok=True)
+
+        logger.info(f"History {entry['kind']} saved for {day}: "
+                    f"{entry['added']} added, {entry['changed']} changed, {entry['removed']} removed")
+        return delta
+
+    def disk_usage(self) -> int:
+        return sum(p.stat().st_size for p in self.history_dir.glob('*.json.gz'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect or rebuild snapshots from the compressed history store'
+    )
+    parser.add_argument(
+        '--history-dir',
+        default=HISTORY_DIR,
+        help=f'History directory (default: {HISTORY_DIR})'
+    )
+    parser.add_argument(
+        '--list',
+        action='store_true',
+        help='List stored bases and deltas'
+    )
+    parser.add_argument(
+        '--date',
+        help='Rebuild the dataset as of this day (YYYY-MM-DD)'
+    )
+    parser.add_argument(
+        '--output',
+        help='Write the rebuilt dataset to this JSON file (default: stdout summary only)'
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    store = SnapshotStore(args.history_dir)
+
+    if args.list or not args.date:
+        for entry in store.entries:
+            print(f"{entry['date']}  {entry['kind']:5s}  records={entry['records']:6d}  "
+                  f"+{entry['added']} ~{entry['changed']} -{entry['removed']}  {entry['file']}")
+        print(f"Disk usage: {store.disk_usage() / 1024:.1f} KiB")
+        return 0
+
+    records = store.snapshot(args.date)
+    if not records:
+        print(f"No history on or before {args.date}")
+        return 1
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2, default=str)
+        print(f"Wrote {len(records)} records as of {args.date} to {args.output}")
+    else:
+        print(f"{len(records)} records as of {args.date}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+
+Local index of the IRS Exempt Organizations Business Master File (EO BMF).
+
+Download the state/region CSVs (eo1.csv ... eo4.csv, or eo_xx.csv per state) from
+https://www.irs.gov/charities-non-profits/exempt-organizations-business-master-file-extract-eo-bmf
+and import them once:
+
+python tophat_irs.py --import eo1.csv eo2.csv eo3.csv eo4.csv
+python tophat_irs.py --lookup 13-1624100
+python tophat_irs.py --enrich fetched_records.json --output enriched.json
+
+The monitor then answers "is this EIN a nonprofit" with an indexed lookup and only
+calls the ProPublica API for EINs the file doesn't list (--irs-index).
+
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tophat_records import ein_of, normalize_ein
+
+IRS_INDEX_FILE = "irs_eo_bmf.sqlite"
+IMPORT_BATCH = 50000
+PROPUBLICA_ORG_URL = "https://projects.propublica.org/nonprofits/organizations/{ein}"
+
+# EO BMF column -> index column
+BMF_COLUMNS = {
+    'EIN': 'ein',
+    'NAME': 'name',
+    'CITY': 'city',
+    'STATE': 'state',
+    'SUBSECTION': 'subsection',
+    'NTEE_CD': 'ntee',
+    'RULING': 'ruling',
+}
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exempt_orgs (
+    ein TEXT PRIMARY KEY,
+    name TEXT,
+    city TEXT,
+    state TEXT,
+    subsection TEXT,
+    ntee TEXT,
+    ruling TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS imports (
+    source TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    imported_at TEXT NOT NULL
+);
+"""
+
+
+def propublica_url(ein: str) -> str:
+    return PROPUBLICA_ORG_URL.format(ein=ein)
+
+
+class IRSExemptIndex:
+
+    def __init__(self, db_path: str = IRS_INDEX_FILE, readonly: bool = False):
+        self.db_path = db_path
+        # Lookups come from the pipeline's enrich thread as well as the main thread
+        if readonly:
+            self.conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                        check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def import_bmf(self, filepath: str) -> int:
+        """Load one EO BMF CSV; later files win for EINs listed twice"""
+        columns = list(BMF_COLUMNS.values())
+        sql = (f"INSERT OR REPLACE INTO exempt_orgs ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' for _ in columns)})")
+        count = 0
+        batch = []
+        with open(filepath, 'r', encoding='utf-8', errors='replace', newline='') as f:
+            with self._lock:
+                for row in csv.DictReader(f):
+                    ein = normalize_ein(row.get('EIN'))
+                    if not ein:
+                        continue
+                    batch.append([ein] + [(row.get(source) or '').strip()
+                                          for source in list(BMF_COLUMNS)[1:]])
+                    if len(batch) >= IMPORT_BATCH:
+                        self.conn.executemany(sql, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self.conn.executemany(sql, batch)
+                    count += len(batch)
+                self.conn.execute("INSERT INTO imports (source, rows, imported_at) VALUES (?, ?, ?)",
+                                  (str(filepath), count, datetime.now().isoformat()))
+                self.conn.commit()
+        logger.info(f"Imported {count} exempt organizations from {filepath}")
+        return count
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM exempt_orgs").fetchone()[0]
+
+    def lookup(self, ein: str) -> Optional[Dict]:
+        ein = normalize_ein(ein)
+        if not ein:
+            return None
+        with self._lock:
+            cursor = self.conn.execute("SELECT * FROM exempt_orgs WHERE ein = ?", (ein,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def contains(self, ein: str) -> bool:
+        ein = normalize_ein(ein)
+        if not ein:
+            return False
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM exempt_orgs WHERE ein = ?", (ein,)).fetchone() is not None
+
+    def enrich(self, records: List[Dict]) -> int:
+        """Add ProPublicaURL to records whose EIN is in the index; returns the number matched"""
+        matched = 0
+        for record in records:
+            ein = ein_of(record)
+            if ein and self.contains(ein):
+                record['ProPublicaURL'] = propublica_url(ein)
+                matched += 1
+        return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build and query a local index of the IRS EO Business Master File'
+    )
+    parser.add_argument(
+        '--db',
+        default=IRS_INDEX_FILE,
+        help=f'Index file (default: {IRS_INDEX_FILE})'
+    )
+    parser.add_argument(
+        '--import',
+        dest='import_files',
+        nargs='+',
+        metavar='CSV',
+        help='EO BMF CSV files to load'
+    )
+    parser.add_argument(
+        '--lookup',
+        metavar='EIN',
+        help='Print the index entry for one EIN'
+    )
+    parser.add_argument(
+        '--enrich',
+        metavar='JSON',
+        help='Add ProPublicaURL to every record in a fetched/new records JSON file'
+    )
+    parser.add_argument(
+        '--output',
+        help='Where --enrich writes (default: overwrite the input)'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    index = IRSExemptIndex(args.db)
+
+    if args.import_files:
+        for filepath in args.import_files:
+            index.import_bmf(filepath)
+        logger.info(f"Index now holds {index.count()} EINs")
+
+    if args.lookup:
+        entry = index.lookup(args.lookup)
+        if entry is None:
+            print(f"{args.lookup}: not in the EO BMF")
+            return 1
+        print(json.dumps(dict(entry, propublica_url=propublica_url(entry['ein'])), indent=2))
+
+    if args.enrich:
+        with open(args.enrich, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        start = datetime.now()
+        matched = index.enrich(records)
+        with open(args.output or args.enrich, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+        elapsed = (datetime.now() - start).total_seconds()
+        logger.info(f"Matched {matched} of {len(records)} records in {elapsed:.2f}s")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+
+Logging setup shared by the command-line entry points.
+
+Records are put on an in-memory queue by the thread that logs them and written
+by a background listener, so a slow disk never stalls the fetch loop. The log file
+holds one JSON object per line and is rotated by size (or at midnight); the
+console keeps the plain text format. Every line carries the run id, and
+messages logged with extra={'rate_limit': key} (one per page, one per EIN) are
+passed at most once per interval per key.
+
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+RATE_LIMIT_INTERVAL = 10.0  # Seconds between rate-limited messages with the same key
+LOG_FORMATS = ['json', 'text']
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [%(run_id)s] %(message)s'
+
+_context = threading.local()
+_latest_run_id = '-'
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def set_run_id(run_id: str):
+    """Tag this thread's lines (and those of threads without their own run) with run_id"""
+    global _latest_run_id
+    _context.run_id = run_id
+    _latest_run_id = run_id
+
+
+class RunIdFilter(logging.Filter):
+
+    def filter(self, record):
+        record.run_id = getattr(_context, 'run_id', _latest_run_id)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """At most one message per interval for each rate_limit key; the next one says how many were dropped"""
+
+    def __init__(self, interval: float = RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_at: Dict[str, float] = {}
+        self._dropped: Dict[str, int] = {}
+
+    def filter(self, record):
+        key = getattr(record, 'rate_limit', None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_at.get(key, 0.0):
+                self._dropped[key] = self._dropped.get(key, 0) + 1
+                return False
+            self._next_at[key] = now + self.interval
+            dropped = self._dropped.pop(key, 0)
+        if dropped:
+            record.msg = f"{record.getMessage()} (+{dropped} similar since last)"
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'run_id': getattr(record, 'run_id', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues the merged message and traceback text, leaving formatting to the listener"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(log_file: str, log_format: str = 'json', max_bytes: int = LOG_MAX_BYTES,
+                      backups: int = LOG_BACKUPS, rotate_when: Optional[str] = None,
+                      level: int = logging.INFO):
+    """Route the root logger through a queue to a rotating file and stdout"""
+    global _listener
+    if _listener is not None:
+        return
+
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when,
+                                                                 backupCount=backups)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                            backupCount=backups)
+    file_handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    # Filters run in the thread that logs: tag its run id, drop noise before it is queued
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    queue_handler.addFilter(RunIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and close the handlers"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+
+Durable notification outbox with a background dispatcher per sink.
+
+New records are written to the outbox (SQLite) before the baseline is saved, so a
+failed SMTP login or webhook outage can't lose an alert: each record/sink pair
+stays pending, with exponential backoff, until that sink acknowledges it.
+
+python tophat_outbox.py --outbox tophat_outbox.sqlite status
+python tophat_outbox.py --outbox tophat_outbox.sqlite retry-now
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from html import escape
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from tophat_records import as_dict, received_of
+
+OUTBOX_FILE = "tophat_outbox.sqlite"
+DRAIN_SECONDS = 120  # How long a run waits for deliveries before leaving them for the next run
+POLL_SECONDS = 1.0
+FEED_ITEMS = 200
+TAIL_BLOCK = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY,
+    form_type TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    subject_prefix TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL,
+    created TEXT NOT NULL,
+    UNIQUE (form_type, record_id)
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    notification_id INTEGER NOT NULL,
+    sink TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    delivered_at TEXT,
+    PRIMARY KEY (notification_id, sink)
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (sink, status, next_attempt);
+"""
+
+
+def tail_lines(filepath: Path, count: int) -> List[str]:
+    """Last count lines of a file, read backwards in blocks (the feed log only grows)"""
+    with open(filepath, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(TAIL_BLOCK, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    return [line.decode('utf-8') for line in data.splitlines()[-count:] if line.strip()]
+
+
+class Sink(ABC):
+    """A delivery target; deliver() raises on failure"""
+
+    name = 'sink'
+    batch_size = 50
+    concurrency = 1
+    retry_base = 30.0    # Seconds before the first retry, doubled per attempt
+    max_backoff = 3600.0
+
+    @abstractmethod
+    def deliver(self, records: List[Dict], subject_prefix: str):
+        ...
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.retry_base * 2 ** (attempts - 1), self.max_backoff)
+
+
+class EmailSink(Sink):
+
+    name = 'email'
+    batch_size = 500  # One digest per batch
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+
+    def deliver(self, records: List[Dict], subject_prefix: str):
+        if not self.monitor.send_email(records, subject_prefix=subject_prefix):
+            raise RuntimeError("send_email failed")
+
+
+class WebhookSink(Sink):
+
+    name = 'webhook'
+    batch_size = 100
+    concurrency = 4
+    retry_base = 10.0
+
+    def __init__(self, url: str, monitor, form_type: str, timeout: int = 15):
+        self.url = url
+        self.monitor = monitor
+        self.form_type = form_type
+        self.timeout = timeout
+
+    def deliver(self, records: List[Dict], subject_prefix: str):
+        # The monitor's session is created on first use, so resolve it only when sending
+        response = self.monitor.session.post(self.url, json={
+            'form_type': self.form_type,
+            'subject_prefix': subject_prefix,
+            'records': records,
+        }, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class FeedSink(Sink):
+    """Appends records to a JSONL log and rewrites an RSS feed of the latest ones"""
+
+    name = 'feed'
+    batch_size = 500
+    retry_base = 5.0
+
+    def __init__(self, feed_file: str, monitor):
+        self.feed_file = Path(feed_file)
+        self.log_file = self.feed_file.with_suffix('.jsonl')
+        self.monitor = monitor
+
+    def deliver(self, records: List[Dict], subject_prefix: str):
+        from email.utils import format_datetime
+
+        with open(self.log_file, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+        latest = [json.loads(line) for line in tail_lines(self.log_file, FEED_ITEMS)]
+
+        items = []
+        for record in reversed(latest):
+            received = received_of(record)
+            items.append(
+                "<item>"
+                f"<title>{escape(record.get('Employer') or 'Unknown')} - {escape(record.get('PlanName') or '')}</title>"
+                f"<link>{escape(self.monitor.generate_pdf_link(record.get('Id', '')))}</link>"
+                f"<guid isPermaLink=\"false\">{escape(str(record.get('Id')))}</guid>"
+                + (f"<pubDate>{format_datetime(received)}</pubDate>" if received else '') +
+                f"<description>EIN {escape(str(record.get('Ein') or ''))}</description>"
+                "</item>"
+            )
+        tmp = self.feed_file.with_name(self.feed_file.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>'
+                    f"<title>TopHat Monitor: {escape(self.monitor.form_label)}</title>"
+                    "<link>https://www.askebsa.dol.gov/tophatplansearch</link>"
+                    "<description>New filings detected by the TopHat monitor</description>"
+                    + ''.join(items) + '</channel></rss>\n')
+        tmp.replace(self.feed_file)
+
+
+class Outbox:
+
+    def __init__(self, db_path: str = OUTBOX_FILE, readonly: bool = False):
+        """readonly opens an existing outbox for status only, never touching a running dispatcher's rows"""
+        self.db_path = db_path
+        if readonly:
+            self.conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                        check_same_thread=False, timeout=60)
+        else:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+            self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def recover(self, sink: str, form_type: str) -> int:
+        """Release deliveries a crashed dispatcher claimed but never acknowledged"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE deliveries SET status = 'pending' WHERE status = 'sending' AND sink = ? "
+                "AND notification_id IN (SELECT id FROM notifications WHERE form_type = ?)",
+                (sink, form_type)
+            )
+            self.conn.commit()
+        if cursor.rowcount:
+            logger.warning(f"Outbox: {cursor.rowcount} {form_type} {sink} deliveries were interrupted; retrying")
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, records: List[Dict], form_type: str, sinks: List[str],
+                subject_prefix: str = '', key: Optional[Callable[[Dict], str]] = None) -> int:
+        """Durably queue records for each sink; records already queued (same key, default Id) are skipped"""
+        created = datetime.now().isoformat()
+        key = key or (lambda record: str(record.get('Id')))
+        queued = 0
+        with self._lock:
+            try:
+                for record in records:
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO notifications (form_type, record_id, subject_prefix, payload, created) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (form_type, key(record), subject_prefix,
+                         json.dumps(as_dict(record), default=str), created)
+                    )
+                    if cursor.rowcount != 1:
+                        continue
+                    self.conn.executemany(
+                        "INSERT INTO deliveries (notification_id, sink, status) VALUES (?, ?, 'pending')",
+                        [(cursor.lastrowid, sink) for sink in sinks]
+                    )
+                    queued += 1
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return queued
+
+    def claim(self, sink: str, form_type: str, limit: int) -> List[Dict]:
+        """Mark up to limit due deliveries as sending and return them"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT d.notification_id, d.attempts, n.subject_prefix, n.payload "
+                "FROM deliveries d JOIN notifications n ON n.id = d.notification_id "
+                "WHERE d.sink = ? AND d.status = 'pending' AND d.next_attempt <= ? AND n.form_type = ? "
+                "ORDER BY d.notification_id LIMIT ?",
+                (sink, time.time(), form_type, limit)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE deliveries SET status = 'sending' WHERE notification_id = ? AND sink = ?",
+                [(row[0], sink) for row in rows]
+            )
+            self.conn.commit()
+        return [{'id': row[0], 'attempts': row[1], 'subject_prefix': row[2],
+                 'record': json.loads(row[3])} for row in rows]
+
+    def ack(self, sink: str, ids: List[int]):
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE deliveries SET status = 'delivered', delivered_at = ?, attempts = attempts + 1 "
+                "WHERE notification_id = ? AND sink = ?",
+                [(datetime.now().isoformat(), notification_id, sink) for notification_id in ids]
+            )
+            self.conn.commit()
+
+    def fail(self, sink: str, items: List[Dict], error: str, backoff):
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE deliveries SET status = 'pending', attempts = ?, next_attempt = ?, last_error = ? "
+                "WHERE notification_id = ? AND sink = ?",
+                [(item['attempts'] + 1, now + backoff(item['attempts'] + 1), error[:500], item['id'], sink)
+                 for item in items]
+            )
+            self.conn.commit()
+
+    def pending(self, form_type: Optional[str] = None, due_before: Optional[float] = None) -> int:
+        sql = ("SELECT COUNT(*) FROM deliveries d JOIN notifications n ON n.id = d.notification_id "
+               "WHERE d.status != 'delivered'")
+        params: List = []
+        if form_type:
+            sql += " AND n.form_type = ?"
+            params.append(form_type)
+        if due_before is not None:
+            sql += " AND d.next_attempt <= ?"
+            params.append(due_before)
+        with self._lock:
+            return self.conn.execute(sql, params).fetchone()[0]
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT n.form_type, d.sink, d.status, COUNT(*), MAX(d.attempts), MAX(d.last_error) "
+                "FROM deliveries d JOIN notifications n ON n.id = d.notification_id "
+                "GROUP BY n.form_type, d.sink, d.status ORDER BY n.form_type, d.sink, d.status"
+            ).fetchall()
+        return [{'form_type': r[0], 'sink': r[1], 'status': r[2], 'count': r[3],
+                 'max_attempts': r[4], 'last_error': r[5]} for r in rows]
+
+    def retry_now(self) -> int:
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE deliveries SET next_attempt = 0 WHERE status = 'pending' AND next_attempt > 0"
+            )
+            self.conn.commit()
+        return cursor.rowcount
+
+
+class Dispatcher:
+    """Delivers one form type's outbox entries to its sinks from background threads"""
+
+    def __init__(self, outbox: Outbox, sinks: List[Sink], form_type: str):
+        self.outbox = outbox
+        self.sinks = sinks
+        self.form_type = form_type
+        self.threads: List[threading.Thread] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    @property
+    def sink_names(self) -> List[str]:
+        return [sink.name for sink in self.sinks]
+
+    def start(self):
+        if self.threads:
+            return
+        self._stop.clear()
+        for sink in self.sinks:
+            # Nothing of this form type is in flight until these workers start
+            self.outbox.recover(sink.name, self.form_type)
+            for n in range(sink.concurrency):
+                thread = threading.Thread(target=self._work, args=(sink,),
+                                          name=f'outbox-{sink.name}-{n}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def _work(self, sink: Sink):
+        while not self._stop.is_set():
+            items = self.outbox.claim(sink.name, self.form_type, sink.batch_size)
+            if not items:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+                continue
+
+            by_prefix = defaultdict(list)
+            for item in items:
+                by_prefix[item['subject_prefix']].append(item)
+            for subject_prefix, group in by_prefix.items():
+                try:
+                    sink.deliver([item['record'] for item in group], subject_prefix)
+                except Exception as e:
+                    logger.warning(f"Outbox: {sink.name} delivery of {len(group)} record(s) failed "
+                                   f"(attempt {group[0]['attempts'] + 1}): {e}")
+                    self.outbox.fail(sink.name, group, str(e), sink.backoff)
+                    continue
+                self.outbox.ack(sink.name, [item['id'] for item in group])
+                logger.info(f"Outbox: delivered {len(group)} record(s) to {sink.name}")
+
+    def drain(self, timeout: float = DRAIN_SECONDS) -> int:
+        """Wait out deliveries (and retries) due within timeout, stop the workers; returns deliveries still pending"""
+        deadline = time.time() + timeout
+        self.wake()
+        while time.time() < deadline and self.outbox.pending(self.form_type, due_before=deadline):
+            time.sleep(0.1)
+        self._stop.set()
+        self._wake.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        remaining = self.outbox.pending(self.form_type)
+        if remaining:
+            logger.warning(f"Outbox: {remaining} {self.form_type} deliveries pending; retried on the next run")
+        return remaining
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect the TopHat notification outbox'
+    )
+    parser.add_argument(
+        'command',
+        choices=['status', 'retry-now'],
+        help='show delivery counts, or clear backoff so pending deliveries go out on the next run'
+    )
+    parser.add_argument(
+        '--outbox',
+        default=OUTBOX_FILE,
+        help=f'Outbox file (default: {OUTBOX_FILE})'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'status' and not Path(args.outbox).exists():
+        print(f"No outbox at {args.outbox}")
+        return 1
+    outbox = Outbox(args.outbox, readonly=args.command == 'status')
+
+    if args.command == 'retry-now':
+        print(f"{outbox.retry_now()} deliveries rescheduled")
+        return 0
+
+    for row in outbox.status():
+        line = f"{row['form_type']:<15} {row['sink']:<8} {row['status']:<10} {row['count']:>6}"
+        if row['status'] != 'delivered' and row['last_error']:
+            line += f"  attempts {row['max_attempts']}, last error: {row['last_error']}"
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
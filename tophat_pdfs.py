@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+
+Content-hash tracking of filing PDFs, to catch statements DOL generates or replaces
+after the filing first appears.
+
+Recent (and externally flagged) filings are kept in an SQLite index with the
+validators and SHA-256 of their last download. A background verifier re-checks the
+ones that are due after each scan: HEAD first, then a conditional GET streamed
+through the hash, so an unchanged PDF usually costs one small request. Younger
+filings are checked more often, and each run stops at a fixed request budget,
+flagged and still-missing PDFs first. A PDF that appears (after being missing) or
+whose hash changes is returned as an alert.
+
+python tophat_pdfs.py --pdf-index tophat_pdfs.sqlite status
+python tophat_pdfs.py --pdf-index tophat_pdfs.sqlite changes
+python tophat_pdfs.py --pdf-index tophat_pdfs.sqlite recheck 0000000123456
+
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+from tophat_records import ID_WIDTH, as_dict, received_of
+
+PDF_INDEX_FILE = "tophat_pdfs.sqlite"
+PDF_TRACK_DAYS = 180     # Filings received longer ago than this are dropped from the index
+FLAGGED_TRACK_DAYS = 365  # ... unless an external dataset flagged them
+CHECK_TIERS = [(7, 1), (30, 3), (90, 7), (FLAGGED_TRACK_DAYS, 14)]  # (filing age, days between checks)
+PDF_CHECK_BUDGET = 100   # Requests per run
+RETRY_HOURS = 6          # Wait after a failed check
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+    record_id TEXT PRIMARY KEY,
+    received TEXT,
+    pdf_created INTEGER,
+    flagged INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'unchecked',
+    etag TEXT,
+    last_modified TEXT,
+    content_length INTEGER,
+    sha256 TEXT,
+    first_seen TEXT NOT NULL,
+    last_checked TEXT,
+    last_changed TEXT,
+    next_check REAL NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pdfs_due ON pdfs (next_check);
+CREATE TABLE IF NOT EXISTS versions (
+    record_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    content_length INTEGER,
+    seen_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_versions_seen ON versions (seen_at);
+"""
+
+
+def check_interval(received: Optional[datetime], flagged: bool, now: datetime) -> timedelta:
+    """Days between checks for a filing of this age; flagged filings twice as often"""
+    age = (now - received).days if received else CHECK_TIERS[-1][0]
+    days = next((interval for max_age, interval in CHECK_TIERS if age < max_age), CHECK_TIERS[-1][1])
+    if flagged:
+        days = max(days / 2, 1)
+    return timedelta(days=days)
+
+
+def describe(change: Dict) -> str:
+    """One-line digest flag for an appeared or replaced PDF"""
+    if change['kind'] == 'appeared':
+        text = "Statement PDF is now available"
+    else:
+        text = f"Statement PDF was replaced (previous version checked {(change['previous_checked'] or '?')[:10]})"
+    size = change.get('content_length')
+    return text + (f", {max(size // 1024, 1):,} KB" if size else '') + f", sha256 {change['sha256'][:12]}"
+
+
+class PdfIndex:
+
+    def __init__(self, db_path: str = PDF_INDEX_FILE, readonly: bool = False):
+        self.db_path = db_path
+        if readonly:
+            self.conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                        check_same_thread=False, timeout=60)
+        else:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+            self.conn.executescript(SCHEMA)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def track(self, records: List[Dict], flagged_ids: Optional[Set[str]] = None,
+              now: Optional[datetime] = None) -> int:
+        """Add recent and flagged filings (flagged_ids: Ids with external events, tracked longer);
+        a record whose PdfCreated changed is due again at once"""
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=PDF_TRACK_DAYS)
+        flagged_cutoff = now - timedelta(days=FLAGGED_TRACK_DAYS)
+        flagged_ids = flagged_ids or set()
+        rows = []
+        for record in records:
+            received = received_of(record)
+            flagged = record.get('Id') in flagged_ids
+            if received is None or received < (flagged_cutoff if flagged else cutoff):
+                continue
+            payload = {key: value for key, value in as_dict(record).items() if key != 'ExternalFlags'}
+            rows.append((record.get('Id'), received.isoformat(), record.get('PdfCreated'), int(flagged),
+                         json.dumps(payload, default=str), now.isoformat()))
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO pdfs (record_id, received, pdf_created, flagged, payload, first_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (record_id) DO UPDATE SET "
+                "payload = excluded.payload, flagged = max(flagged, excluded.flagged), "
+                "next_check = CASE WHEN excluded.pdf_created IS NOT pdf_created THEN 0 ELSE next_check END, "
+                "pdf_created = excluded.pdf_created",
+                rows
+            )
+            self.conn.commit()
+        return len(rows)
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """Forget filings that have aged out of tracking"""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            cursor = self.conn.execute(
+                "DELETE FROM pdfs WHERE received < ? AND (flagged = 0 OR received < ?)",
+                ((now - timedelta(days=PDF_TRACK_DAYS)).isoformat(),
+                 (now - timedelta(days=FLAGGED_TRACK_DAYS)).isoformat())
+            )
+            self.conn.commit()
+        return cursor.rowcount
+
+    def due(self, limit: int, now: Optional[float] = None) -> List[Dict]:
+        """Filings due for a check: flagged first, then PDFs not yet seen, then the newest"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM pdfs WHERE next_check <= ? "
+                "ORDER BY flagged DESC, status = 'present', received DESC LIMIT ?",
+                (now or time.time(), limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_check(self, row: Dict, outcome: Dict, now: datetime):
+        """Store one check's result and schedule the next"""
+        checked = now.isoformat()
+        with self._lock:
+            if outcome['status'] == 'error':
+                self.conn.execute(
+                    "UPDATE pdfs SET errors = errors + 1, last_error = ?, next_check = ? WHERE record_id = ?",
+                    (outcome['error'][:500], (now + timedelta(hours=RETRY_HOURS)).timestamp(), row['record_id'])
+                )
+            else:
+                received = datetime.fromisoformat(row['received']) if row['received'] else None
+                next_check = now + check_interval(received, bool(row['flagged']), now)
+                changed = outcome.get('kind') is not None
+                self.conn.execute(
+                    "UPDATE pdfs SET status = ?, etag = ?, last_modified = ?, content_length = ?, sha256 = ?, "
+                    "last_checked = ?, next_check = ?, errors = 0, last_error = NULL, "
+                    "changes = changes + ?, last_changed = CASE WHEN ? THEN ? ELSE last_changed END "
+                    "WHERE record_id = ?",
+                    (outcome['status'], outcome.get('etag', row['etag']),
+                     outcome.get('last_modified', row['last_modified']),
+                     outcome.get('content_length', row['content_length']), outcome.get('sha256', row['sha256']),
+                     checked, next_check.timestamp(), int(changed), changed, checked, row['record_id'])
+                )
+                if 'sha256' in outcome and outcome['sha256'] != row['sha256']:
+                    self.conn.execute(
+                        "INSERT INTO versions (record_id, kind, sha256, content_length, seen_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (row['record_id'], outcome.get('kind') or 'first', outcome['sha256'],
+                         outcome.get('content_length'), checked)
+                    )
+            self.conn.commit()
+
+    def get(self, record_id) -> Optional[Dict]:
+        """One filing's PDF status, without the stored row"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status, sha256, content_length, first_seen, last_checked, last_changed, changes, flagged "
+                "FROM pdfs WHERE record_id = ?",
+                (str(record_id).zfill(ID_WIDTH),)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def recheck(self, record_ids: List[str]) -> int:
+        """Make these filings due on the next run"""
+        with self._lock:
+            cursor = self.conn.executemany(
+                "UPDATE pdfs SET next_check = 0 WHERE record_id = ?",
+                [(str(record_id).zfill(ID_WIDTH),) for record_id in record_ids]
+            )
+            self.conn.commit()
+        return cursor.rowcount
+
+    def summary(self) -> Dict:
+        with self._lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM pdfs GROUP BY status").fetchall())
+            due = self.conn.execute("SELECT COUNT(*) FROM pdfs WHERE next_check <= ?",
+                                    (time.time(),)).fetchone()[0]
+            flagged = self.conn.execute("SELECT COUNT(*) FROM pdfs WHERE flagged = 1").fetchone()[0]
+        return {'tracked': sum(counts.values()), 'by_status': counts, 'due': due, 'flagged': flagged}
+
+    def changes(self, limit: int = 50) -> List[Dict]:
+        """Latest appeared/replaced versions, newest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT v.record_id, v.kind, v.sha256, v.content_length, v.seen_at, p.payload "
+                "FROM versions v LEFT JOIN pdfs p ON p.record_id = v.record_id "
+                "WHERE v.kind != 'first' ORDER BY v.seen_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class PdfVerifier(threading.Thread):
+    """Re-checks the index's due PDFs in the background, within a request budget"""
+
+    def __init__(self, index: PdfIndex, session, pdf_link: Callable[[str], str], pace: Callable[[], None],
+                 budget: int = PDF_CHECK_BUDGET, timeout: int = 60):
+        super().__init__(name='pdf-verifier', daemon=True)
+        self.index = index
+        self.session = session
+        self.pdf_link = pdf_link
+        self.pace = pace
+        self.budget = budget
+        self.timeout = timeout
+        self.use_head = True
+        self.requests = 0
+        self.counts: Counter = Counter()
+        self.alerts: List[Dict] = []
+        self.unsaved: List[tuple] = []  # Changed PDFs' checks, saved once their alerts are sent
+
+    def run(self):
+        try:
+            for row in self.index.due(self.budget):
+                if self.requests >= self.budget:
+                    break
+                try:
+                    outcome = self.check(row)
+                except Exception as e:
+                    outcome = {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+                    logger.debug(f"PDF check of {row['record_id']} failed: {e}", extra={'rate_limit': 'pdf'})
+                if outcome is None:
+                    break  # Budget ran out mid-check; the filing stays due
+                self.counts[outcome.get('kind') or outcome['status']] += 1
+                if outcome.get('kind'):
+                    # The stored hash is what the next check compares with, so an alert that
+                    # isn't sent must leave it (and the due time) as it was
+                    self.alerts.append(self.alert(row, outcome))
+                    self.unsaved.append((row, outcome, datetime.now(timezone.utc)))
+                else:
+                    self.index.save_check(row, outcome, datetime.now(timezone.utc))
+        except Exception as e:
+            logger.error(f"Error verifying PDFs: {e}")
+
+    def save_changes(self):
+        """Store the changed PDFs' new hashes once their alerts are delivered or queued"""
+        try:
+            for row, outcome, checked in self.unsaved:
+                self.index.save_check(row, outcome, checked)
+        except Exception as e:
+            logger.error(f"Error saving PDF changes: {e}")
+        self.unsaved = []
+
+    def _request(self, method: str, url: str, **kwargs):
+        if self.requests:
+            self.pace()
+        self.requests += 1
+        return self.session.request(method, url, timeout=self.timeout, allow_redirects=True, **kwargs)
+
+    def check(self, row: Dict) -> Optional[Dict]:
+        """One PDF's status now; 'kind' is set when it appeared or changed.
+        None when the budget has no request left for the download"""
+        url = self.pdf_link(row['record_id'])
+        known = row['status'] == 'present'
+
+        # A HEAD answers "still missing" or "same validators" without the download
+        if self.use_head and row['status'] in ('present', 'missing'):
+            response = self._request('HEAD', url)
+            content_type = response.headers.get('Content-Type', '').lower()
+            if response.status_code in (405, 501):
+                self.use_head = False  # GET-only endpoint; don't ask again this run
+            elif response.status_code == 404 or (response.ok and content_type and 'pdf' not in content_type):
+                return {'status': 'missing'}
+            elif response.ok:
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if known and ((etag and etag == row['etag']) or
+                              (not etag and last_modified and last_modified == row['last_modified'])):
+                    return {'status': 'present'}
+
+        if self.requests >= self.budget:
+            return None
+        headers = {}
+        if known and row['etag']:
+            headers['If-None-Match'] = row['etag']
+        if known and row['last_modified']:
+            headers['If-Modified-Since'] = row['last_modified']
+        with self._request('GET', url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return {'status': 'present'}
+            if response.status_code == 404:
+                return {'status': 'missing'}
+            response.raise_for_status()
+            # Not-yet-generated statements come back as an HTML page, not an error
+            if 'pdf' not in response.headers.get('Content-Type', '').lower():
+                return {'status': 'missing'}
+            digest = hashlib.sha256()
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+            outcome = {'status': 'present', 'sha256': digest.hexdigest(), 'content_length': size,
+                       'etag': response.headers.get('ETag'),
+                       'last_modified': response.headers.get('Last-Modified')}
+
+        if row['status'] == 'missing':
+            outcome['kind'] = 'appeared'
+        elif known and row['sha256'] and outcome['sha256'] != row['sha256']:
+            outcome['kind'] = 'changed'
+        return outcome
+
+    @staticmethod
+    def alert(row: Dict, outcome: Dict) -> Dict:
+        record = json.loads(row['payload'])
+        record['PdfChange'] = describe({
+            'kind': outcome['kind'],
+            'sha256': outcome['sha256'],
+            'content_length': outcome.get('content_length'),
+            'previous_checked': row['last_checked'],
+        })
+        record['PdfSha256'] = outcome['sha256']
+        return record
+
+    def summary(self) -> Dict:
+        return {'requests': self.requests, **dict(self.counts), 'alerts': len(self.alerts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect the TopHat PDF hash index'
+    )
+    parser.add_argument(
+        'command',
+        choices=['status', 'changes', 'recheck'],
+        help='show tracked/due counts, list PDFs that appeared or were replaced, '
+             'or make the given record ids due on the next run'
+    )
+    parser.add_argument(
+        'record_ids',
+        nargs='*',
+        help='Record ids for recheck'
+    )
+    parser.add_argument(
+        '--pdf-index',
+        default=PDF_INDEX_FILE,
+        help=f'PDF index file (default: {PDF_INDEX_FILE})'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=50,
+        help='Changes to list (default: 50)'
+    )
+    args = parser.parse_args()
+
+    index = PdfIndex(args.pdf_index)
+    try:
+        if args.command == 'status':
+            summary = index.summary()
+            print(f"Tracked filings: {summary['tracked']} ({summary['flagged']} flagged), due now: {summary['due']}")
+            for status, count in sorted(summary['by_status'].items()):
+                print(f"  {status:<10} {count}")
+        elif args.command == 'changes':
+            for change in index.changes(args.limit):
+                record = json.loads(change['payload']) if change['payload'] else {}
+                print(f"{change['seen_at'][:19]}  {change['kind']:<8} {change['record_id']}  "
+                      f"{record.get('Employer') or '?'}  sha256 {change['sha256'][:12]}")
+        else:
+            if not args.record_ids:
+                print("recheck needs one or more record ids", file=sys.stderr)
+                return 1
+            print(f"{index.recheck(args.record_ids)} filing(s) due on the next run")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+
+Streaming scan pipeline: fetch -> de-duplicate/diff -> write -> enrich, joined by bounded queues.
+
+Each stage runs in its own thread so network, CPU and disk work overlap. Queue
+limits provide backpressure: a slow disk or slow enrichment stalls the fetcher
+instead of letting pages pile up in memory.
+
+"""
+
+import csv
+import json
+import logging
+import os
+import queue
+import textwrap
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from tophat_reconcile import offsets_to_refetch, reconcile
+from tophat_records import FIELDNAMES as RECORD_FIELDNAMES, as_dict, ein_of
+
+PAGE_QUEUE_SIZE = 4
+WRITE_QUEUE_SIZE = 8
+ENRICH_QUEUE_SIZE = 500
+ENRICH_LIMIT = 500  # Beyond this many new records the digest is not worth enriching live
+
+BASELINE_FIELDNAMES = ['Id', 'DocId', 'Employer', 'Ein', 'PlanName', 'DateReceived', 'Efile']
+
+_DONE = object()
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingCSVWriter:
+    """CSV file that is only created once the first row arrives"""
+
+    def __init__(self, filepath: Path, fieldnames: List[str]):
+        self.filepath = filepath
+        self.fieldnames = fieldnames
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, rows: List[Dict]):
+        if not rows:
+            return
+        if self._file is None:
+            self._file = open(self.filepath, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerows(rows)
+        self.count += len(rows)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+class StreamingJSONWriter:
+    """JSON array written one record at a time, same layout as json.dump(indent=2)"""
+
+    def __init__(self, filepath: Path):
+        self.filepath = filepath
+        self.count = 0
+        self._file = None
+
+    def write(self, rows: List[Dict]):
+        for row in rows:
+            if self._file is None:
+                self._file = open(self.filepath, 'w', encoding='utf-8')
+                self._file.write('[\n')
+            else:
+                self._file.write(',\n')
+            self._file.write(textwrap.indent(json.dumps(as_dict(row), indent=2, default=str), '  '))
+            self.count += 1
+
+    def close(self):
+        if self._file:
+            self._file.write('\n]')
+            self._file.close()
+
+
+class ScanPipeline:
+
+    def __init__(self, monitor, baseline_ids: Set[str], timestamp: str, page_size: int,
+                 request_delay: float, fast_lane=None, keep_records: bool = False,
+                 enrich: bool = False, on_commit=None):
+        self.monitor = monitor
+        self.baseline_ids = baseline_ids
+        self.timestamp = timestamp
+        self.page_size = page_size
+        self.request_delay = request_delay
+        self.fast_lane = fast_lane
+        self.keep_records = keep_records
+        self.enrich_records = enrich
+        self.on_commit = on_commit  # Runs before the baseline is replaced (outbox writes)
+
+        self.pages: queue.Queue = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+        self.writes: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.enrich: queue.Queue = queue.Queue(maxsize=ENRICH_QUEUE_SIZE)
+
+        self.seen_ids: Set[str] = set()
+        self.page_log: List[Dict] = []
+        self.records: List[Dict] = []
+        self.new_records: List[Dict] = []
+        self.fetched = 0
+        self.max_doc_id = 0
+        self.newest_date: Optional[str] = None
+        self.oldest_date: Optional[str] = None
+        self.reconciliation: Optional[Dict] = None
+        self.complete = False
+        self.errors: List[str] = []
+
+    # Stage 1: network
+    def _fetch_stage(self):
+        try:
+            offset = 0
+            total_records = None
+            while True:
+                data = self.monitor.fetch_page(offset)
+                if data is None:
+                    logger.error(f"Failed to fetch data for offset {offset}")
+                    break
+
+                if total_records is None:
+                    total_records = data.get('total', 0)
+                    logger.info(f"Total records in database: {total_records}")
+
+                rows = data.get('rows', [])
+                if not rows:
+                    # A total that shrank mid-scan ends on an empty page; same as fetch_all_records
+                    logger.info(f"No more records at offset {offset}")
+                    self.complete = True
+                    break
+
+                self.pages.put((offset, data.get('total', total_records), rows))
+                offset += self.page_size
+
+                if offset >= total_records:
+                    logger.info(f"Reached end of data at offset {offset}")
+                    self.complete = True
+                    break
+
+                time.sleep(self.request_delay)
+
+            # Let the diff stage catch up, then chase removals and drift
+            self.pages.join()
+            if self.baseline_ids and self.complete:
+                self._reconcile_stage()
+        except Exception as e:
+            logger.exception(f"Fetch stage failed: {e}")
+            self.errors.append(f"fetch: {e}")
+            self.complete = False
+        finally:
+            self.pages.put(_DONE)
+
+    def _reconcile_stage(self):
+        report = reconcile(self.seen_ids, self.baseline_ids, self.page_log,
+                           self.page_size)
+        offsets = offsets_to_refetch(report)
+        if offsets:
+            logger.info(f"Reconciliation: re-fetching offsets {offsets}")
+            before = self.fetched
+            for offset in offsets:
+                time.sleep(self.request_delay)
+                data = self.monitor.fetch_page(offset)
+                if data is not None:
+                    self.pages.put((None, None, data.get('rows', [])))
+            self.pages.join()
+            logger.info(f"Re-fetched {len(offsets)} page(s): recovered {self.fetched - before} records")
+            report = reconcile(self.seen_ids, self.baseline_ids, self.page_log,
+                               self.page_size)
+            report['refetched_offsets'] = offsets
+        self.reconciliation = report
+
+    # Stage 2: CPU
+    def _diff_stage(self):
+        while True:
+            item = self.pages.get()
+            try:
+                if item is _DONE:
+                    self.writes.put(_DONE)
+                    self.enrich.put(_DONE)
+                    return
+
+                offset, total, rows = item
+                accepted = []
+                duplicates = 0
+                for row in self.monitor.validator.validate_page(rows, offset):
+                    record_id = row.get('Id')
+                    if record_id is None:
+                        continue
+                    if record_id in self.seen_ids:
+                        duplicates += 1
+                        continue
+                    record = self.monitor.to_record(row)
+                    if record is None:
+                        continue
+                    self.seen_ids.add(record_id)
+                    accepted.append(record)
+
+                if offset is not None:
+                    self.page_log.append({'offset': offset, 'total': total,
+                                          'rows': len(rows), 'duplicates': duplicates})
+                    logger.info(f"Processed offset {offset}: found {len(rows)} records, "
+                                f"{self.fetched + len(accepted)} total fetched", extra={'rate_limit': 'page'})
+
+                new_rows = [r for r in accepted if str(r.get('Id', '')) not in self.baseline_ids]
+                self.fetched += len(accepted)
+                self.new_records.extend(new_rows)
+                if self.keep_records:
+                    self.records.extend(accepted)
+                for row in accepted:
+                    if row.doc_id > self.max_doc_id:
+                        self.max_doc_id = row.doc_id
+                    date_received = row.get('DateReceived')
+                    if date_received:
+                        if self.newest_date is None or date_received > self.newest_date:
+                            self.newest_date = date_received
+                        if self.oldest_date is None or date_received < self.oldest_date:
+                            self.oldest_date = date_received
+
+                if self.fast_lane and offset is not None:
+                    self.fast_lane.on_page(accepted)
+
+                self.writes.put((accepted, new_rows))
+                for row in new_rows:
+                    self.enrich.put(row)
+            except Exception as e:
+                logger.exception(f"Diff stage failed: {e}")
+                self.errors.append(f"diff: {e}")
+            finally:
+                self.pages.task_done()
+
+    # Stage 3: disk
+    def _write_stage(self):
+        output_dir = self.monitor.output_dir
+        baseline_tmp = self.monitor.baseline_file.with_name(self.monitor.baseline_file.name + '.tmp')
+        writers = {
+            'fetched_csv': StreamingCSVWriter(output_dir / f"fetched_records_{self.timestamp}.csv",
+                                              RECORD_FIELDNAMES),
+            'fetched_json': StreamingJSONWriter(output_dir / f"fetched_records_{self.timestamp}.json"),
+            'new_csv': StreamingCSVWriter(output_dir / f"new_records_{self.timestamp}.csv",
+                                          RECORD_FIELDNAMES),
+            'new_json': StreamingJSONWriter(output_dir / f"new_records_{self.timestamp}.json"),
+            'baseline': StreamingCSVWriter(baseline_tmp, BASELINE_FIELDNAMES),
+        }
+        try:
+            while True:
+                item = self.writes.get()
+                if item is _DONE:
+                    break
+                accepted, new_rows = item
+                writers['fetched_csv'].write(accepted)
+                writers['fetched_json'].write(accepted)
+                writers['baseline'].write(accepted)
+                writers['new_csv'].write(new_rows)
+                writers['new_json'].write(new_rows)
+        except Exception as e:
+            logger.exception(f"Write stage failed: {e}")
+            self.errors.append(f"write: {e}")
+            # Keep draining so upstream stages never block on a full queue
+            while self.writes.get() is not _DONE:
+                pass
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        for name, writer in writers.items():
+            if writer.count and name != 'baseline':
+                logger.info(f"Saved {writer.count} records to {writer.filepath}")
+                self.monitor.catalog.register(writer.filepath, self.timestamp)
+
+        if self.on_commit and self.complete and not self.errors:
+            try:
+                self.on_commit(self.new_records)
+            except Exception as e:
+                logger.exception(f"Commit hook failed: {e}")
+                self.errors.append(f"commit: {e}")
+
+        # Only replace the baseline after a complete, error-free scan. Its rows are in fetch
+        # order (refetched rows last) rather than save_baseline's Id order; the baseline is only
+        # ever read back as a set of Ids, so the order doesn't matter and isn't worth holding
+        # every row in memory to sort
+        if writers['baseline'].count and self.complete and not self.errors:
+            os.replace(baseline_tmp, self.monitor.baseline_file)
+            logger.info(f"Baseline saved with {writers['baseline'].count} records")
+        elif baseline_tmp.exists():
+            logger.warning("Scan incomplete; keeping previous baseline")
+            baseline_tmp.unlink()
+
+    # Stage 4: enrichment (ProPublica lookups are cached on the monitor)
+    def _enrich_stage(self):
+        enriched = 0
+        while True:
+            row = self.enrich.get()
+            if row is _DONE:
+                return
+            if enriched >= ENRICH_LIMIT:
+                continue
+            enriched += 1
+            try:
+                self.monitor.check_propublica_nonprofit(ein_of(row))
+            except Exception as e:
+                logger.warning(f"Enrichment failed for Id {row.get('Id')}: {e}")
+
+    def run(self) -> 'ScanPipeline':
+        threads = [
+            threading.Thread(target=self._fetch_stage, name='pipeline-fetch'),
+            threading.Thread(target=self._diff_stage, name='pipeline-diff'),
+            threading.Thread(target=self._write_stage, name='pipeline-write'),
+        ]
+        if self.enrich_records:
+            threads.append(threading.Thread(target=self._enrich_stage, name='pipeline-enrich'))
+        else:
+            self.enrich = _NullQueue()
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        logger.info(f"Fetch complete. Found {self.fetched} records")
+        return self
+
+
+class _NullQueue:
+    """Stand-in for the enrichment queue when enrichment is off"""
+
+    def put(self, item):
+        pass
@@ -0,0 +1,211 @@
+"""
+
+Per-stage CPU and memory profiling of a monitor run (--profile).
+
+'full' wraps each stage of TopHatAPIMonitor.run in cProfile and tracemalloc and
+reports the top functions and the allocation diff between stage boundaries.
+cProfile only sees the thread that runs the monitor, so pipeline worker threads
+show up as waits there.
+
+'sample' is the low-overhead option for production: a background thread looks at
+every thread's stack every few milliseconds, and memory is reported as peak RSS.
+
+Reports go to <output_dir>/profile_<run_id>/ (report.txt plus one .prof per stage
+for pstats/snakeviz).
+
+"""
+
+import cProfile
+import io
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_MODES = ['full', 'sample']
+PROFILE_TOP_N = 25
+PROFILE_SAMPLE_INTERVAL = 0.01  # Seconds between stack samples
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+class StackSampler(threading.Thread):
+    """Counts the functions on every thread's stack, attributed to the current stage"""
+
+    def __init__(self, profiler: 'RunProfiler', interval: float = PROFILE_SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.profiler = profiler
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            stage = self.profiler.current
+            if stage is None:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stage['samples'] += 1
+                stage['self'][frame_label(frame)] += 1
+                # Inclusive counts: each function once per sample, however deep it recurses
+                names = set()
+                while frame is not None:
+                    code = frame.f_code
+                    names.add(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stage['inclusive'].update(names)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class RunProfiler:
+
+    def __init__(self, mode: str = 'full', top_n: int = PROFILE_TOP_N,
+                 sample_interval: float = PROFILE_SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r} (expected one of {', '.join(PROFILE_MODES)})")
+        self.mode = mode
+        self.top_n = top_n
+        self.stages: List[Dict] = []
+        self.current: Optional[Dict] = None
+        self.sampler = None
+        self.owns_tracemalloc = False
+        self.snapshot = None
+
+        if mode == 'sample':
+            self.sampler = StackSampler(self, sample_interval)
+            self.sampler.start()
+        elif not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.owns_tracemalloc = True
+
+    def stage(self, name: str):
+        """End the current stage (if any) and start timing the next one"""
+        self._end_stage()
+        stage = {'name': name, 'started': time.perf_counter(), 'cpu_started': time.process_time()}
+        if self.mode == 'sample':
+            stage.update(samples=0, self=Counter(), inclusive=Counter())
+        else:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+                self.snapshot = self._snapshot()
+            stage['profile'] = cProfile.Profile()
+            try:
+                stage['profile'].enable()
+            except ValueError as e:
+                # Another profiler is already active in this thread
+                logger.warning(f"CPU profiling unavailable for stage {name}: {e}")
+                stage['profile'] = None
+        self.current = stage
+
+    def _end_stage(self):
+        stage = self.current
+        if stage is None:
+            return
+        self.current = None
+        if stage.get('profile'):
+            stage['profile'].disable()
+        stage['seconds'] = time.perf_counter() - stage['started']
+        stage['cpu_seconds'] = time.process_time() - stage['cpu_started']
+        if self.mode == 'sample':
+            stage['peak_mb'] = peak_rss_mb()
+        elif tracemalloc.is_tracing():
+            stage['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+            if self.snapshot is not None:
+                stage['memory_diff'] = self._snapshot().compare_to(self.snapshot, 'lineno')[:self.top_n]
+                self.snapshot = None
+        self.stages.append(stage)
+
+    @staticmethod
+    def _snapshot():
+        # Leave out the profiler's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    def finish(self, report_dir) -> Optional[Path]:
+        """Stop profiling and write the reports; returns the report file"""
+        self._end_stage()
+        if self.sampler:
+            self.sampler.stop()
+        if self.owns_tracemalloc:
+            tracemalloc.stop()
+            self.owns_tracemalloc = False
+
+        try:
+            report_dir = Path(report_dir)
+            report_dir.mkdir(parents=True, exist_ok=True)
+            report_file = report_dir / 'report.txt'
+            with open(report_file, 'w', encoding='utf-8') as f:
+                f.write(self.summary())
+                for i, stage in enumerate(self.stages, 1):
+                    f.write(f"\n\n{'=' * 78}\nStage {i}: {stage['name']}\n{'=' * 78}\n")
+                    if stage.get('profile'):
+                        stage['profile'].dump_stats(str(report_dir / f"{i:02d}_{stage['name']}.prof"))
+                    f.write(self.stage_report(stage))
+            logger.info(f"Profile written to {report_file}")
+            return report_file
+        except Exception as e:
+            logger.error(f"Error writing profile: {e}")
+            return None
+
+    def summary(self) -> str:
+        lines = [f"Profile mode: {self.mode}",
+                 f"{'stage':<16} {'wall s':>9} {'cpu s':>9} {'peak MB':>9}"]
+        for stage in self.stages:
+            peak = f"{stage['peak_mb']:9.1f}" if stage.get('peak_mb') is not None else f"{'-':>9}"
+            lines.append(f"{stage['name']:<16} {stage['seconds']:9.3f} {stage['cpu_seconds']:9.3f} {peak}")
+        if self.mode == 'sample':
+            lines.append("(peak MB is the process's peak RSS so far)")
+        return '\n'.join(lines) + '\n'
+
+    def stage_report(self, stage: Dict) -> str:
+        out = io.StringIO()
+        if self.mode == 'sample':
+            samples = stage['samples']
+            out.write(f"{samples} thread samples\n\nMost time inside (inclusive):\n")
+            for name, count in stage['inclusive'].most_common(self.top_n):
+                out.write(f"  {100 * count / samples:5.1f}%  {name}\n")
+            out.write("\nMost time at (innermost Python line):\n")
+            for name, count in stage['self'].most_common(self.top_n):
+                out.write(f"  {100 * count / samples:5.1f}%  {name}\n")
+            return out.getvalue()
+
+        if stage.get('profile'):
+            import pstats
+
+            stats = pstats.Stats(stage['profile'], stream=out)
+            stats.sort_stats('cumulative').print_stats(self.top_n)
+            stats.sort_stats('tottime').print_stats(self.top_n)
+        if stage.get('memory_diff'):
+            out.write("Allocation change over the stage:\n")
+            for diff in stage['memory_diff']:
+                out.write(f"  {diff}\n")
+        return out.getvalue()
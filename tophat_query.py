@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+
+Point-in-time queries over the snapshot history.
+
+python tophat_query.py as-of 2026-02-14 [--output records.json]
+python tophat_query.py first-seen 16075
+python tophat_query.py per-day 2026-01-01 2026-02-14
+python tophat_query.py rebuild-index
+
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from tophat_history import HISTORY_DIR, SnapshotStore, to_day
+
+INDEX_FILE = "index.sqlite"
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER,
+    employer TEXT,
+    ein TEXT,
+    date_received TEXT,
+    received_day TEXT,
+    first_seen TEXT NOT NULL,
+    last_changed TEXT,
+    removed_on TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_records_received_day ON records(received_day);
+CREATE INDEX IF NOT EXISTS idx_records_first_seen ON records(first_seen);
+CREATE TABLE IF NOT EXISTS indexed_days (
+    day TEXT PRIMARY KEY
+);
+-- One row per stretch an Id was listed; removed and re-added Ids get a second row
+CREATE TABLE IF NOT EXISTS presence (
+    id INTEGER NOT NULL,
+    added_on TEXT NOT NULL,
+    removed_on TEXT,
+    PRIMARY KEY (id, added_on)
+);
+-- records rows as they were before the latest indexed day, so a rerun of that day can undo it
+CREATE TABLE IF NOT EXISTS day_undo (
+    day TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    existed INTEGER NOT NULL,
+    doc_id INTEGER,
+    employer TEXT,
+    ein TEXT,
+    date_received TEXT,
+    received_day TEXT,
+    first_seen TEXT,
+    last_changed TEXT,
+    removed_on TEXT,
+    PRIMARY KEY (day, id)
+);
+"""
+
+RECORD_COLUMNS = "doc_id, employer, ein, date_received, received_day, first_seen, last_changed, removed_on"
+
+
+def _record_id(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _row_values(row: Dict) -> Tuple:
+    date_received = row.get('DateReceived') or None
+    return (
+        _record_id(row.get('DocId')),
+        row.get('Employer'),
+        row.get('Ein'),
+        date_received,
+        date_received[:10] if date_received else None,
+    )
+
+
+class HistoryIndex:
+
+    def __init__(self, history_dir: str = HISTORY_DIR):
+        self.history_dir = Path(history_dir)
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        # Opened by the monitor, then updated from its monitor-<form type> thread
+        self.conn = sqlite3.connect(str(self.history_dir / INDEX_FILE), check_same_thread=False, timeout=60)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Indexes built before presence intervals: one stretch per Id is the best that's known
+        seeded = self.conn.execute("SELECT EXISTS (SELECT 1 FROM presence)").fetchone()[0]
+        if not seeded and self.conn.execute("SELECT EXISTS (SELECT 1 FROM records)").fetchone()[0]:
+            logger.info("History index predates presence intervals; run rebuild-index for removed and re-added Ids")
+            with self.conn:
+                self.conn.execute("INSERT INTO presence (id, added_on, removed_on) "
+                                  "SELECT id, first_seen, removed_on FROM records")
+
+    def close(self):
+        self.conn.close()
+
+    def _save_undo(self, day: str, record_id: int):
+        """Keep a records row's state from before day's delta, once per day"""
+        cursor = self.conn.execute(
+            f"INSERT OR IGNORE INTO day_undo (day, id, existed, {RECORD_COLUMNS}) "
+            f"SELECT ?, id, 1, {RECORD_COLUMNS} FROM records WHERE id = ?",
+            (day, record_id)
+        )
+        if cursor.rowcount == 0:
+            self.conn.execute("INSERT OR IGNORE INTO day_undo (day, id, existed) VALUES (?, ?, 0)",
+                              (day, record_id))
+
+    def _undo(self, day: str):
+        """Take back a day's delta before that day's rerun is applied"""
+        self.conn.execute("DELETE FROM presence WHERE added_on = ?", (day,))
+        self.conn.execute("UPDATE presence SET removed_on = NULL WHERE removed_on = ?", (day,))
+        self.conn.execute("DELETE FROM records WHERE id IN (SELECT id FROM day_undo WHERE day = ?)", (day,))
+        self.conn.execute(
+            f"INSERT INTO records (id, {RECORD_COLUMNS}) "
+            f"SELECT id, {RECORD_COLUMNS} FROM day_undo WHERE day = ? AND existed = 1",
+            (day,)
+        )
+
+    def update(self, day, delta: Dict):
+        """Apply one day's delta (as returned by SnapshotStore.record); a day already
+        indexed was rerun, and its new delta replaces the old one"""
+        day = to_day(day)
+        with self._lock, self.conn:
+            if self.conn.execute("SELECT 1 FROM indexed_days WHERE day = ?", (day,)).fetchone():
+                self._undo(day)
+            # History only ever replaces its latest day
+            self.conn.execute("DELETE FROM day_undo WHERE day != ?", (day,))
+            for row in delta['added']:
+                record_id = _record_id(row.get('Id'))
+                if record_id is None:
+                    continue
+                self._save_undo(day, record_id)
+                self.conn.execute(
+                    "INSERT INTO presence (id, added_on) SELECT ?, ? WHERE NOT EXISTS "
+                    "(SELECT 1 FROM presence WHERE id = ? AND removed_on IS NULL)",
+                    (record_id, day, record_id)
+                )
+                self.conn.execute(
+                    "INSERT INTO records (id, doc_id, employer, ein, date_received, received_day, first_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET doc_id=excluded.doc_id, employer=excluded.employer, "
+                    "ein=excluded.ein, date_received=excluded.date_received, "
+                    "received_day=excluded.received_day, removed_on=NULL, "
+                    "first_seen=min(first_seen, excluded.first_seen)",
+                    (record_id,) + _row_values(row) + (day,)
+                )
+            for row in delta['changed']:
+                record_id = _record_id(row.get('Id'))
+                if record_id is None:
+                    continue
+                self._save_undo(day, record_id)
+                self.conn.execute(
+                    "UPDATE records SET doc_id=?, employer=?, ein=?, date_received=?, received_day=?, "
+                    "last_changed=? WHERE id=?",
+                    _row_values(row) + (day, record_id)
+                )
+            removed = [record_id for record_id in map(_record_id, delta['removed']) if record_id is not None]
+            for record_id in removed:
+                self._save_undo(day, record_id)
+            self.conn.executemany(
+                "UPDATE records SET removed_on=? WHERE id=?",
+                [(day, record_id) for record_id in removed]
+            )
+            self.conn.executemany(
+                "UPDATE presence SET removed_on=? WHERE id=? AND removed_on IS NULL",
+                [(day, record_id) for record_id in removed]
+            )
+            self.conn.execute("INSERT OR IGNORE INTO indexed_days (day) VALUES (?)", (day,))
+
+    def rebuild(self, store: SnapshotStore):
+        """Recreate the index by replaying every base and delta once"""
+        with self._lock, self.conn:
+            for table in ('records', 'indexed_days', 'presence', 'day_undo'):
+                self.conn.execute(f"DELETE FROM {table}")
+
+        current = None
+        for entry in store.entries:
+            payload = store.load_entry(entry)
+            if entry['kind'] == 'base':
+                rows = {str(row.get('Id')): row for row in payload}
+                delta = store.diff(current or {}, rows)
+                current = rows
+            else:
+                delta = payload
+                for record_id in delta['removed']:
+                    current.pop(record_id, None)
+                for row in delta['added'] + delta['changed']:
+                    current[str(row.get('Id'))] = row
+            self.update(entry['date'], delta)
+
+        logger.info(f"Rebuilt history index from {len(store.entries)} entries")
+
+    def ids_as_of(self, as_of) -> List[int]:
+        day = to_day(as_of)
+        with self._lock:
+            cursor = self.conn.execute(
+                "SELECT DISTINCT id FROM presence WHERE added_on <= ? AND (removed_on IS NULL OR removed_on > ?) "
+                "ORDER BY id DESC",
+                (day, day)
+            )
+            return [row[0] for row in cursor]
+
+    def first_seen(self, record_id) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, doc_id, employer, ein, date_received, first_seen, last_changed, removed_on "
+                "FROM records WHERE id = ?",
+                (_record_id(record_id),)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ['Id', 'DocId', 'Employer', 'Ein', 'DateReceived', 'first_seen', 'last_changed', 'removed_on']
+        return dict(zip(keys, row))
+
+    def filings_per_day(self, start, end) -> List[Tuple[str, int]]:
+        """Filings still listed, grouped by DateReceived day, start and end inclusive"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT received_day, COUNT(*) FROM records "
+                "WHERE received_day >= ? AND received_day <= ? AND removed_on IS NULL "
+                "GROUP BY received_day ORDER BY received_day",
+                (to_day(start), to_day(end))
+            ).fetchall()
+
+
+class HistoryQuery:
+    """Point-in-time questions answered from the snapshot store and its index"""
+
+    def __init__(self, history_dir: str = HISTORY_DIR):
+        self.store = SnapshotStore(history_dir)
+        self.index = HistoryIndex(history_dir)
+
+    def as_of(self, as_of) -> List[Dict]:
+        """Full rows as they stood on the given day (replays from the nearest base only)"""
+        return self.store.snapshot(as_of)
+
+    def first_seen(self, record_id) -> Optional[Dict]:
+        return self.index.first_seen(record_id)
+
+    def filings_per_day(self, start, end) -> List[Tuple[str, int]]:
+        return self.index.filings_per_day(start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Query the TopHat snapshot history'
+    )
+    parser.add_argument(
+        '--history-dir',
+        default=HISTORY_DIR,
+        help=f'History directory (default: {HISTORY_DIR})'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    as_of_parser = subparsers.add_parser('as-of', help='Dataset as it stood on a day')
+    as_of_parser.add_argument('date', help='YYYY-MM-DD')
+    as_of_parser.add_argument('--output', help='Write rows to this JSON file')
+
+    first_seen_parser = subparsers.add_parser('first-seen', help='When an Id first appeared')
+    first_seen_parser.add_argument('record_id', help='Id or DocId, with or without leading zeros')
+
+    per_day_parser = subparsers.add_parser('per-day', help='Filings per DateReceived day')
+    per_day_parser.add_argument('start', help='YYYY-MM-DD')
+    per_day_parser.add_argument('end', help='YYYY-MM-DD')
+
+    subparsers.add_parser('rebuild-index', help='Recreate the Id/DateReceived index from history')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    query = HistoryQuery(args.history_dir)
+
+    if args.command == 'as-of':
+        records = query.as_of(args.date)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2, default=str)
+            print(f"Wrote {len(records)} records as of {args.date} to {args.output}")
+        else:
+            print(f"{len(records)} records as of {args.date}")
+
+    elif args.command == 'first-seen':
+        result = query.first_seen(args.record_id)
+        if result is None:
+            print(f"Id {args.record_id} not found in history")
+            return 1
+        for key, value in result.items():
+            print(f"{key:15s} {value}")
+
+    elif args.command == 'per-day':
+        rows = query.filings_per_day(args.start, args.end)
+        for day, count in rows:
+            print(f"{day}  {count}")
+        print(f"{'TOTAL':10s}  {sum(count for _, count in rows)}")
+
+    elif args.command == 'rebuild-index':
+        query.index.rebuild(query.store)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+
+Reconcile a finished scan against the baseline: removed Ids and pagination drift.
+
+"""
+
+import logging
+from array import array
+from typing import Dict, Iterable, List
+
+MAX_REFETCH_PAGES = 25  # Past this, a rescan is cheaper than chasing offsets
+
+logger = logging.getLogger(__name__)
+
+
+def sorted_id_array(ids: Iterable) -> array:
+    """Integer Ids as a sorted, compact array"""
+    values = []
+    for record_id in ids:
+        try:
+            values.append(int(record_id))
+        except (TypeError, ValueError):
+            continue
+    values.sort()
+    return array('q', values)
+
+
+def missing_from(reference: array, candidates: array) -> array:
+    """Ids in reference that are not in candidates (both sorted ascending)"""
+    missing = array('q')
+    i = j = 0
+    n, m = len(reference), len(candidates)
+    while i < n:
+        if j >= m:
+            missing.extend(reference[i:])
+            break
+        a, b = reference[i], candidates[j]
+        if a == b:
+            i += 1
+            j += 1
+        elif a < b:
+            missing.append(a)
+            i += 1
+        else:
+            j += 1
+    return missing
+
+
+def offsets_for_ids(ids: array, fetched: array, page_size: int) -> List[int]:
+    """Page offsets where the given Ids would sit in a DocId-descending scan"""
+    offsets = set()
+    j = 0
+    # Walk both ascending: Ids above the missing one are the rows in front of it
+    for record_id in ids:
+        while j < len(fetched) and fetched[j] < record_id:
+            j += 1
+        position = len(fetched) - j
+        offsets.add((position // page_size) * page_size)
+    return sorted(offsets)
+
+
+def drift_offsets(page_log: List[Dict], page_size: int) -> List[int]:
+    """Offsets to refetch because the result set moved while we paged through it"""
+    offsets = set()
+    if not page_log:
+        return []
+
+    initial_total = page_log[0]['total']
+    previous_total = initial_total
+    for page in page_log:
+        # Rows were skipped as already seen: inserts pushed earlier rows down
+        if page['duplicates']:
+            offsets.add(page['offset'])
+            offsets.add(max(page['offset'] - page_size, 0))
+        # Rows deleted mid-scan pull later rows up past the page boundary
+        if page['total'] < previous_total:
+            offsets.add(page['offset'])
+            offsets.add(max(page['offset'] - page_size, 0))
+        previous_total = page['total']
+
+    # New filings landing mid-scan sit ahead of offset 0's snapshot
+    grown = page_log[-1]['total'] - initial_total
+    if grown > 0:
+        for offset in range(0, grown + page_size - 1, page_size):
+            offsets.add(offset)
+
+    return sorted(offsets)
+
+
+def reconcile(fetched_ids: Iterable, baseline_ids: Iterable, page_log: List[Dict],
+              page_size: int) -> Dict:
+    """Compare a scan with the baseline and with its own paging log (page_size: the
+    monitor's RECORDS_PER_PAGE)"""
+    fetched = sorted_id_array(fetched_ids)
+    baseline = sorted_id_array(baseline_ids)
+    removed = missing_from(baseline, fetched)
+
+    totals = [page['total'] for page in page_log]
+    report = {
+        'fetched': len(fetched),
+        'baseline': len(baseline),
+        'removed_ids': [str(record_id).zfill(13) for record_id in removed],
+        'total_start': totals[0] if totals else None,
+        'total_end': totals[-1] if totals else None,
+        'duplicates_skipped': sum(page['duplicates'] for page in page_log),
+        'drift_offsets': drift_offsets(page_log, page_size),
+        'removed_offsets': offsets_for_ids(removed, fetched, page_size) if removed else [],
+    }
+    report['drift'] = bool(report['drift_offsets'])
+    return report
+
+
+def offsets_to_refetch(report: Dict, max_pages: int = MAX_REFETCH_PAGES) -> List[int]:
+    """Offsets worth re-requesting: drift first, then removals, at most max_pages in all"""
+    offsets = set(report['drift_offsets'][:max_pages])
+    for offset in report['removed_offsets']:
+        if len(offsets) >= max_pages:
+            break
+        offsets.add(offset)
+
+    wanted = len(set(report['drift_offsets']) | set(report['removed_offsets']))
+    if wanted > len(offsets):
+        logger.warning(f"{wanted} offsets affected; re-fetching {len(offsets)} only")
+    return sorted(offsets)
@@ -0,0 +1,247 @@
+"""
+
+Compact, typed filing record parsed once from the API's page JSON.
+
+FilingRecord keeps integer Id/DocId, a normalized EIN and a parsed DateReceived
+for sorting, lookups and comparisons, and an interned FormType, in __slots__. record.get('Field') still
+answers with exactly what the API sent, so CSV/JSON outputs and digest code can
+treat it like the raw row.
+
+"""
+
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Union
+
+ID_WIDTH = 13
+
+FIELDNAMES = [
+    'DocId', 'Id', 'Employer', 'Ein', 'Pn', 'PlanName',
+    'FormType', 'DateReceived', 'PdfLink', 'PdfCreated',
+    'TextFilePath', 'Efile'
+]
+
+# Keys added to a record by a run's enrichment, not sent by the API
+ANNOTATIONS = frozenset({'ExternalFlags', 'PdfChange', 'PdfSha256', 'WatchLabel'})
+
+_ATTRIBUTES = {
+    'Employer': 'employer',
+    'Pn': 'pn',
+    'PlanName': 'plan_name',
+    'FormType': 'form_type',
+    'PdfLink': 'pdf_link',
+    'PdfCreated': 'pdf_created',
+    'TextFilePath': 'text_file_path',
+    'Efile': 'efile',
+}
+
+
+def normalize_ein(value) -> Optional[str]:
+    """Digits only, left-padded to 9 (DOL data drops leading zeros)"""
+    if value is None:
+        return None
+    ein = str(value).strip().replace('-', '')
+    if not ein:
+        return None
+    if ein.isdigit() and len(ein) < 9:
+        ein = ein.zfill(9)
+    return ein
+
+
+def parse_received(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _doc_id(value, record_id: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return record_id
+
+
+class FilingRecord:
+
+    __slots__ = ('id', 'doc_id', 'employer', 'ein', 'pn', 'plan_name', 'form_type', 'date_received',
+                 'received', 'pdf_link', 'pdf_created', 'text_file_path', 'efile', 'raw', 'extra')
+
+    def __init__(self, id: int, doc_id: int, employer: Optional[str] = None, ein=None,
+                 pn=None, plan_name: Optional[str] = None, form_type: Optional[str] = None,
+                 date_received=None, received: Optional[datetime] = None, pdf_link: Optional[str] = None,
+                 pdf_created=None, text_file_path: Optional[str] = None, efile=None,
+                 raw: Optional[Dict] = None, extra: Optional[Dict] = None):
+        self.id = id
+        self.doc_id = doc_id
+        self.employer = employer
+        self.ein = ein  # normalize_ein() of the sent value, for lookups
+        self.pn = pn
+        self.plan_name = plan_name
+        self.form_type = form_type
+        self.date_received = date_received  # As sent
+        self.received = received  # Parsed (UTC when DOL sends no offset), None if unparseable
+        self.pdf_link = pdf_link
+        self.pdf_created = pdf_created
+        self.text_file_path = text_file_path
+        self.efile = efile
+        # Id/DocId/Ein as sent, only when the parsed values don't reproduce them (unpadded Id,
+        # missing DocId, dashed or unpadded Ein)
+        self.raw = raw
+        # Fields DOL sends that the fixed layout doesn't know about
+        self.extra = extra
+
+    @classmethod
+    def from_row(cls, row: Dict) -> 'FilingRecord':
+        """Convert one raw API row; raises ValueError if Id is missing or not numeric"""
+        if isinstance(row, FilingRecord):
+            return row
+        sent_id = row['Id']
+        record_id = int(sent_id)
+        sent_doc_id = row.get('DocId')
+        doc_id = _doc_id(sent_doc_id, record_id)
+        raw = {}
+        if sent_id != str(record_id).zfill(ID_WIDTH):
+            raw['Id'] = sent_id
+        if sent_doc_id != str(doc_id):
+            raw['DocId'] = sent_doc_id
+        sent_ein = row.get('Ein')
+        ein = normalize_ein(sent_ein)
+        if sent_ein != ein:
+            raw['Ein'] = sent_ein
+        received = row.get('DateReceived')
+        form_type = row.get('FormType')
+        extra = {key: value for key, value in row.items() if key not in _KNOWN_FIELDS}
+        return cls(
+            id=record_id,
+            doc_id=doc_id,
+            employer=row.get('Employer'),
+            ein=ein,
+            pn=row.get('Pn'),
+            plan_name=row.get('PlanName'),
+            form_type=sys.intern(form_type) if isinstance(form_type, str) else form_type,
+            date_received=received,
+            received=parse_received(received),
+            pdf_link=row.get('PdfLink'),
+            pdf_created=row.get('PdfCreated'),
+            text_file_path=row.get('TextFilePath'),
+            efile=row.get('Efile'),
+            raw=raw or None,
+            extra=extra or None,
+        )
+
+    def get(self, key: str, default=None):
+        """Field exactly as the API sent it, like dict.get on the raw row"""
+        if key in ('Id', 'DocId', 'Ein') and self.raw and key in self.raw:
+            value = self.raw[key]
+        elif key == 'Id':
+            value = str(self.id).zfill(ID_WIDTH)
+        elif key == 'DocId':
+            value = str(self.doc_id)
+        elif key == 'DateReceived':
+            value = self.date_received
+        elif key == 'Ein':
+            value = self.ein
+        elif key in _ATTRIBUTES:
+            value = getattr(self, _ATTRIBUTES[key])
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        else:
+            return default
+        return value
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        if key in _KNOWN_FIELDS:
+            raise KeyError(f"{key} is a typed field; set the attribute instead")
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key in _KNOWN_FIELDS or bool(self.extra and key in self.extra)
+
+    def keys(self) -> List[str]:
+        return FIELDNAMES + list(self.extra or ())
+
+    def copy(self) -> 'FilingRecord':
+        """Copy without enrichment annotations, for handing one scan to another monitor"""
+        record = FilingRecord.__new__(FilingRecord)
+        for name in self.__slots__:
+            setattr(record, name, getattr(self, name))
+        if self.extra:
+            record.extra = {key: value for key, value in self.extra.items() if key not in ANNOTATIONS} or None
+        return record
+
+    def to_dict(self) -> Dict:
+        """The row as the API sent it (for JSON output)"""
+        row = {key: self.get(key) for key in FIELDNAMES}
+        if self.extra:
+            row.update(self.extra)
+        return row
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, FilingRecord):
+            return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"FilingRecord(id={self.id}, doc_id={self.doc_id}, employer={self.employer!r})"
+
+
+_KNOWN_FIELDS = frozenset(FIELDNAMES)
+_MISSING = object()
+
+
+def as_dict(record: Union[FilingRecord, Dict]) -> Dict:
+    return record.to_dict() if isinstance(record, FilingRecord) else record
+
+
+def copy_record(record: Union[FilingRecord, Dict]) -> Union[FilingRecord, Dict]:
+    """Copy to annotate for a digest, so the scanned record (history, snapshots) stays as fetched"""
+    if isinstance(record, FilingRecord):
+        return record.copy()
+    return {key: value for key, value in record.items() if key not in ANNOTATIONS}
+
+
+def as_dicts(records: Iterable[Union[FilingRecord, Dict]]) -> List[Dict]:
+    return [as_dict(record) for record in records]
+
+
+def doc_id_of(record: Union[FilingRecord, Dict]) -> int:
+    if isinstance(record, FilingRecord):
+        return record.doc_id
+    return int(record.get('DocId', 0) or 0)
+
+
+def id_of(record: Union[FilingRecord, Dict]) -> int:
+    if isinstance(record, FilingRecord):
+        return record.id
+    return int(record.get('Id', 0) or 0)
+
+
+def ein_of(record: Union[FilingRecord, Dict]) -> Optional[str]:
+    """Normalized EIN, for reference, IRS, ProPublica and watchlist lookups"""
+    if isinstance(record, FilingRecord):
+        return record.ein
+    return normalize_ein(record.get('Ein'))
+
+
+def received_of(record: Union[FilingRecord, Dict]) -> Optional[datetime]:
+    if isinstance(record, FilingRecord):
+        return record.received
+    return parse_received(record.get('DateReceived'))
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+
+Read-only local HTTP API (and a small dashboard) over the monitor's data.
+
+Runs next to the monitor and answers from local files only, opening the monitor's
+databases read-only: the newest fetched_records_*.json in the output directory is
+loaded once per monitor run into the server's own SQLite index (kept outside the
+output directory) keyed by Id, EIN and normalized employer name, and the rendered
+responses sit in an in-process LRU cache keyed by that run and the state file.
+Every response carries an ETag, so pollers that send If-None-Match get a 304.
+
+GET /                          dashboard
+GET /api/filings?limit=50      newest filings (&since=<run id> for those first seen after it)
+GET /api/filings?ein=...       by EIN; &employer=... matches part of the normalized name
+GET /api/filings/<id>          one filing with address, nonprofit, PPP/WARN/FOIA and PDF details
+GET /api/status                last run, watermark, validation, anomalies, PDF checks
+GET /api/runs                  runs with their output files and filings first seen
+
+python tophat_server.py --port 8765 --reference-file reference.csv --irs-index tophat_irs.sqlite
+
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from tophat_api_monitor import (BASELINE_FILE, DEFAULT_FORM_TYPE, FORM_TYPES, OUTPUT_DIR, STATE_FILE,
+                                form_type_paths, load_reference_addresses, monitor_status, namespaced_file,
+                                pdf_link)
+from tophat_catalog import CATALOG_FILE, OutputCatalog
+from tophat_external import ExternalIndex, describe as describe_event, normalize_name
+from tophat_irs import IRSExemptIndex, propublica_url
+from tophat_logging import configure_logging
+from tophat_outbox import OUTBOX_FILE
+from tophat_pdfs import PdfIndex
+from tophat_records import ID_WIDTH, ein_of, normalize_ein, received_of
+
+SERVER_INDEX_FILE = "server_index.sqlite"  # The server's own; never in the monitor's output directory
+SERVER_LOG_FILE = "tophat_server.log"
+DEFAULT_PORT = 8765
+CACHE_SIZE = 1024        # Rendered responses kept in memory
+REFRESH_SECONDS = 30     # How often to look for a newer snapshot
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+_RECORD_PATH = re.compile(r'/api/filings/(\d{1,13})\Z')
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    id INTEGER PRIMARY KEY,
+    ein TEXT,
+    name_key TEXT,
+    received TEXT,
+    first_seen TEXT NOT NULL,
+    seen_run TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_filings_ein ON filings (ein);
+CREATE INDEX IF NOT EXISTS idx_filings_first_seen ON filings (first_seen);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>TopHat Monitor</title>
+<style>
+body { font-family: Arial, sans-serif; margin: 20px; color: #333; }
+table { border-collapse: collapse; width: 100%; margin-top: 10px; }
+th, td { border-bottom: 1px solid #ddd; padding: 6px; text-align: left; font-size: 14px; }
+th { background: #2c3e50; color: white; }
+#status { background: #ecf0f1; padding: 10px; border-radius: 5px; white-space: pre-wrap; }
+</style></head>
+<body>
+<h1>TopHat Filing Monitor</h1>
+<div id="status">Loading...</div>
+<form id="search"><input name="ein" placeholder="EIN"> <input name="employer" placeholder="Employer">
+<button>Search</button> <a href="/">Newest</a></form>
+<table><thead><tr><th>Id</th><th>Employer</th><th>EIN</th><th>Plan</th><th>Received</th><th>First seen</th><th>PDF</th></tr></thead>
+<tbody id="rows"></tbody></table>
+<script>
+const text = s => String(s == null ? '' : s).replace(/[&<>"]/g, c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;'}[c]));
+async function load(query) {
+  const data = await (await fetch('/api/filings' + query)).json();
+  document.getElementById('rows').innerHTML = data.filings.map(r =>
+    `<tr><td><a href="/api/filings/${text(r.Id)}">${text(r.Id)}</a></td><td>${text(r.Employer)}</td>` +
+    `<td>${text(r.Ein)}</td><td>${text(r.PlanName)}</td><td>${text((r.DateReceived || '').slice(0, 10))}</td>` +
+    `<td>${text(r.first_seen)}</td><td><a href="${text(r.pdf_url)}">PDF</a></td></tr>`).join('');
+}
+fetch('/api/status').then(r => r.json()).then(s => {
+  document.getElementById('status').textContent =
+    `Last run: ${s.last_run || 'never'}   Records: ${s.records_fetched}   New last run: ${s.new_records_found}` +
+    (s.last_error ? `\\nLast error: ${s.last_error.at} ${s.last_error.message}` : '') +
+    (s.anomalies || []).map(a => `\\nAnomaly: ${a}`).join('');
+});
+document.getElementById('search').onsubmit = e => {
+  e.preventDefault();
+  const params = new URLSearchParams([...new FormData(e.target)].filter(([k, v]) => v));
+  load('?' + params);
+};
+load('');
+</script>
+</body></html>
+"""
+
+
+class FilingStore:
+    """The newest snapshot, indexed for lookups; rebuilt once per monitor run"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # Request threads and the refresher share the connection
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    @property
+    def indexed_run(self) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'run_id'").fetchone()
+        return row[0] if row else None
+
+    def load_snapshot(self, filepath: Path, run_id: str) -> int:
+        """Replace the indexed rows with one fetched_records JSON file, keeping first-seen runs"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        values = []
+        for row in rows:
+            try:
+                record_id = int(row['Id'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            received = received_of(row)
+            values.append((record_id, ein_of(row), normalize_name(row.get('Employer')),
+                           received.isoformat() if received else None, run_id, run_id,
+                           json.dumps(row, default=str)))
+        with self._lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO filings (id, ein, name_key, received, first_seen, seen_run, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET ein = excluded.ein, name_key = excluded.name_key, "
+                    "received = excluded.received, seen_run = excluded.seen_run, payload = excluded.payload",
+                    values
+                )
+                # Ids the API no longer returns
+                self.conn.execute("DELETE FROM filings WHERE seen_run != ?", (run_id,))
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('run_id', ?)", (run_id,))
+        return len(values)
+
+    def _query(self, where: str, params: Tuple, limit: int) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT payload, first_seen FROM filings {where} ORDER BY id DESC LIMIT ?",
+                params + (limit,)
+            ).fetchall()
+        return [dict(json.loads(row['payload']), first_seen=row['first_seen']) for row in rows]
+
+    def recent(self, limit: int, since: Optional[str] = None) -> List[Dict]:
+        if since:
+            return self._query("WHERE first_seen > ?", (since,), limit)
+        return self._query('', (), limit)
+
+    def search(self, ein: Optional[str], employer: Optional[str], limit: int) -> List[Dict]:
+        clauses = []
+        params = []
+        if ein:
+            clauses.append("ein = ?")
+            params.append(normalize_ein(ein))
+        name_key = normalize_name(employer)
+        if name_key:
+            clauses.append("instr(name_key, ?) > 0")
+            params.append(name_key)
+        return self._query(f"WHERE {' AND '.join(clauses)}", tuple(params), limit)
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        found = self._query("WHERE id = ?", (record_id,), 1)
+        return found[0] if found else None
+
+    def first_seen_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.conn.execute("SELECT first_seen, COUNT(*) FROM filings GROUP BY first_seen").fetchall())
+
+
+class FilingAPI:
+    """Routes and renders responses; rendering is cached per data version"""
+
+    def __init__(self, output_dir: str = OUTPUT_DIR, state_file: str = STATE_FILE,
+                 baseline_file: str = BASELINE_FILE, form_type: str = DEFAULT_FORM_TYPE,
+                 reference_file: Optional[str] = None, irs_index: Optional[str] = None,
+                 external_index: Optional[str] = None, pdf_index: Optional[str] = None,
+                 outbox_file: Optional[str] = None, index_file: str = SERVER_INDEX_FILE,
+                 cache_size: int = CACHE_SIZE):
+        self.output_dir = Path(output_dir)
+        self.state_file = Path(state_file)
+        self.baseline_file = baseline_file
+        self.form_type = form_type
+        self.form_label = FORM_TYPES.get(form_type, form_type)
+        self.outbox_file = outbox_file
+        # The monitor owns these; opened read-only so serving never changes them
+        self.catalog: Optional[OutputCatalog] = None
+        self.store = FilingStore(index_file)
+        self.ein_to_address = load_reference_addresses(reference_file) if reference_file else {}
+        self.irs_index = IRSExemptIndex(irs_index, readonly=True) if irs_index else None
+        self.external_index = ExternalIndex(external_index, readonly=True) if external_index else None
+        self.pdf_index = PdfIndex(pdf_index, readonly=True) if pdf_index else None
+        self._refresh_lock = threading.Lock()
+        self._catalog_lock = threading.Lock()
+        self.render = lru_cache(maxsize=cache_size)(self._render)
+
+    def artifacts(self, kind: Optional[str] = None) -> List[Dict]:
+        """The monitor's catalog, once its first run has created it"""
+        with self._catalog_lock:
+            if self.catalog is None:
+                if not (self.output_dir / CATALOG_FILE).exists():
+                    return []
+                self.catalog = OutputCatalog(self.output_dir, readonly=True)
+        return self.catalog.artifacts(kind)
+
+    def refresh(self) -> bool:
+        """Index the newest fetched snapshot if the monitor has written one since; True if it did"""
+        with self._refresh_lock:
+            for artifact in self.artifacts('fetched_json'):
+                filepath = self.output_dir / artifact['name']
+                if not filepath.exists():
+                    continue
+                if artifact['run_id'] == self.store.indexed_run:
+                    return False
+                count = self.store.load_snapshot(filepath, artifact['run_id'])
+                logger.info(f"Indexed {count} filings from {artifact['name']}")
+                return True
+        return False
+
+    def version(self) -> str:
+        """Changes whenever a response could: a new snapshot, state file or outbox delivery"""
+        mtimes = []
+        for filepath in (self.state_file, self.outbox_file):
+            try:
+                mtimes.append(Path(filepath).stat().st_mtime_ns if filepath else 0)
+            except OSError:
+                mtimes.append(0)
+        return f"{self.store.indexed_run}:{mtimes[0]}:{mtimes[1]}"
+
+    def handle(self, url: str) -> Tuple[int, str, bytes, str]:
+        """(status, content type, body, ETag) for a GET"""
+        parts = urlsplit(url)
+        # Sorted, so the same question asked with reordered parameters shares a cache entry
+        query = '&'.join(sorted(parts.query.split('&'))) if parts.query else ''
+        return self.render(parts.path.rstrip('/') or '/', query, self.version())
+
+    def _render(self, path: str, query: str, version: str) -> Tuple[int, str, bytes, str]:
+        try:
+            if path == '/':
+                status, content_type, body = 200, 'text/html; charset=utf-8', DASHBOARD_HTML.encode('utf-8')
+            else:
+                status, payload = self.route(path, {key: values[0] for key, values in parse_qs(query).items()})
+                content_type = 'application/json'
+                body = json.dumps(payload, default=str).encode('utf-8')
+        except Exception as e:
+            logger.error(f"Error serving {path}?{query}: {e}")
+            status, content_type = 500, 'application/json'
+            body = json.dumps({'error': 'internal error'}).encode('utf-8')
+        return status, content_type, body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    def route(self, path: str, params: Dict[str, str]) -> Tuple[int, object]:
+        try:
+            limit = max(1, min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+        except ValueError:
+            return 400, {'error': 'limit must be a number'}
+
+        if path == '/api/filings':
+            if params.get('ein') or params.get('employer'):
+                filings = self.store.search(params.get('ein'), params.get('employer'), limit)
+            else:
+                filings = self.store.recent(limit, params.get('since'))
+            return 200, {'run_id': self.store.indexed_run,
+                         'filings': [self._with_link(filing) for filing in filings]}
+
+        match = _RECORD_PATH.match(path)
+        if match:
+            filing = self.store.get(int(match.group(1)))
+            if filing is None:
+                return 404, {'error': f"filing {match.group(1)} not in the latest snapshot"}
+            return 200, self.enrich(self._with_link(filing))
+
+        if path == '/api/status':
+            return 200, monitor_status(self.form_type, str(self.state_file), self.baseline_file,
+                                       self.outbox_file)
+
+        if path == '/api/runs':
+            runs = {}
+            for artifact in self.artifacts():
+                run = runs.setdefault(artifact['run_id'], {'run_id': artifact['run_id'], 'files': []})
+                run['files'].append({'name': artifact['name'], 'kind': artifact['kind'], 'size': artifact['size']})
+            first_seen = self.store.first_seen_counts()
+            for run_id, run in runs.items():
+                run['filings_first_seen'] = first_seen.get(run_id)
+            return 200, {'runs': list(runs.values())[:limit]}
+
+        return 404, {'error': f"no such endpoint: {path}"}
+
+    def _with_link(self, filing: Dict) -> Dict:
+        filing['pdf_url'] = pdf_link(filing.get('Id', ''), self.form_label)
+        return filing
+
+    def enrich(self, filing: Dict) -> Dict:
+        """Everything the digest would show about a filing, from local data only"""
+        ein = ein_of(filing)
+        enrichment = {'address': self.ein_to_address.get(ein) if ein else None}
+        if self.irs_index and ein:
+            organization = self.irs_index.lookup(ein)
+            enrichment['nonprofit'] = dict(organization, propublica_url=propublica_url(ein)) if organization else None
+        if self.external_index:
+            events = self.external_index.matches(ein, filing.get('Employer'), received_of(filing))
+            enrichment['external_flags'] = [describe_event(event) for event in events]
+        if self.pdf_index:
+            enrichment['pdf'] = self.pdf_index.get(str(filing.get('Id')).zfill(ID_WIDTH))
+        return dict(filing, enrichment=enrichment)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+
+def make_handler(api: FilingAPI):
+
+    class Handler(BaseHTTPRequestHandler):
+        server_version = 'TopHatServer/1.0'
+
+        def do_GET(self):
+            self._respond(include_body=True)
+
+        def do_HEAD(self):
+            self._respond(include_body=False)
+
+        def _respond(self, include_body: bool):
+            status, content_type, body, etag = api.handle(self.path)
+            if status == 200 and etag_matches(self.headers.get('If-None-Match'), etag):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')  # Revalidate; unchanged answers are a 304
+            self.end_headers()
+            if include_body:
+                self.wfile.write(body)
+
+        def _read_only(self):
+            self.send_response(405)
+            self.send_header('Allow', 'GET, HEAD')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_POST = do_PUT = do_PATCH = do_DELETE = _read_only
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}", extra={'rate_limit': 'request'})
+
+    return Handler
+
+
+def refresh_forever(api: FilingAPI, stopped: threading.Event, interval: float = REFRESH_SECONDS):
+    while not stopped.wait(interval):
+        try:
+            api.refresh()
+        except Exception as e:
+            logger.error(f"Error indexing the latest snapshot: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve the monitor\'s filings, enrichment and run metrics over a read-only local HTTP API'
+    )
+    parser.add_argument(
+        '--state-file',
+        default=STATE_FILE,
+        help=f'Path to state file (default: {STATE_FILE})'
+    )
+    parser.add_argument(
+        '--output-dir',
+        default=OUTPUT_DIR,
+        help=f'Monitor output directory (default: {OUTPUT_DIR})'
+    )
+    parser.add_argument(
+        '--baseline-file',
+        default=BASELINE_FILE,
+        help=f'Path to baseline file (default: {BASELINE_FILE})'
+    )
+    parser.add_argument(
+        '--form-type',
+        default=DEFAULT_FORM_TYPE,
+        help=f'Form type whose data to serve (default: {DEFAULT_FORM_TYPE})'
+    )
+    parser.add_argument(
+        '--reference-file',
+        help='Reference CSV with EIN-to-address mappings'
+    )
+    parser.add_argument(
+        '--irs-index',
+        help='SQLite index built by tophat_irs.py'
+    )
+    parser.add_argument(
+        '--external-index',
+        help='SQLite index built by tophat_external.py'
+    )
+    parser.add_argument(
+        '--pdf-index',
+        help='PDF hash index kept by the monitor (--pdf-index)'
+    )
+    parser.add_argument(
+        '--outbox',
+        default=OUTBOX_FILE,
+        help=f'Outbox file, for pending alerts in /api/status (default: {OUTBOX_FILE})'
+    )
+    parser.add_argument(
+        '--index-file',
+        help=f'The server\'s own snapshot index, outside the output directory '
+             f'(default: {SERVER_INDEX_FILE}, with the form type for other form types)'
+    )
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Address to listen on (default: 127.0.0.1; 0.0.0.0 for the newsroom network)'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=DEFAULT_PORT,
+        help=f'Port to listen on (default: {DEFAULT_PORT})'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=CACHE_SIZE,
+        help=f'Rendered responses kept in memory (default: {CACHE_SIZE})'
+    )
+    args = parser.parse_args()
+
+    configure_logging(SERVER_LOG_FILE)
+
+    paths = form_type_paths(args.form_type, args.state_file, args.output_dir, args.baseline_file)
+    index_file = Path(args.index_file or namespaced_file(SERVER_INDEX_FILE, args.form_type))
+    if Path(paths['output_dir']).resolve() in index_file.resolve().parents:
+        print("--index-file must be outside the monitor's output directory", file=sys.stderr)
+        return 1
+    api = FilingAPI(reference_file=args.reference_file, irs_index=args.irs_index,
+                    external_index=args.external_index, pdf_index=args.pdf_index,
+                    outbox_file=args.outbox, index_file=str(index_file), form_type=args.form_type,
+                    cache_size=args.cache_size, **paths)
+    try:
+        api.refresh()
+    except Exception as e:
+        logger.error(f"Error indexing the latest snapshot: {e}")
+
+    stopped = threading.Event()
+    threading.Thread(target=refresh_forever, args=(api, stopped), name='server-refresh', daemon=True).start()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(api))
+    logger.info(f"Serving {paths['output_dir']} on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("User interruption")
+    finally:
+        stopped.set()
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+
+Row validation for API pages, with a quarantine file for the rows that fail.
+
+Rows are checked a page at a time with precompiled patterns and plain string
+comparisons (no parsing on the happy path), before they become FilingRecords:
+
+- rejected: no usable Id, so the row can't be tracked at all (dropped)
+- repaired: a bad DocId, Ein, DateReceived, Efile or PdfCreated is cleared so the
+  record still sorts and alerts (kept)
+- flagged: DocId disagrees with Id (kept as sent)
+
+Every problem row is written to quarantine_<run_id>.jsonl with its reasons.
+
+"""
+
+import json
+import logging
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tophat_records import parse_received
+
+_ID = re.compile(r'\d{1,13}\Z')
+_DIGITS = re.compile(r'\d+\Z')
+_EIN = re.compile(r'\d{2}-?\d{7}\Z|\d{1,9}\Z')  # DOL drops leading zeros; normalize_ein pads them
+_RECEIVED = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?\Z')
+
+ACTIONS = ('rejected', 'repaired', 'flagged')
+
+logger = logging.getLogger(__name__)
+
+
+def _is_int(value) -> bool:
+    return value is None or value == '' or isinstance(value, int) or bool(_DIGITS.match(str(value)))
+
+
+class RowValidator:
+    """Checks pages of raw API rows and collects the problems found during one run"""
+
+    def __init__(self):
+        self.checked = 0
+        self.counts: Counter = Counter()
+        self.reasons: Counter = Counter()
+        self.quarantine: List[Dict] = []
+
+    def validate_page(self, rows: List[Dict], offset: Optional[int] = None) -> List[Dict]:
+        """Rows to process: rejected rows dropped, repaired rows replaced by fixed copies"""
+        id_match = _ID.match
+        ein_match = _EIN.match
+        received_match = _RECEIVED.match
+        valid = []
+        append = valid.append
+        self.checked += len(rows)
+
+        for row in rows:
+            record_id = row.get('Id')
+            id_text = record_id if isinstance(record_id, str) else (None if record_id is None else str(record_id))
+            doc_id = row.get('DocId')
+            ein = row.get('Ein')
+            received = row.get('DateReceived')
+            efile = row.get('Efile')
+            pdf_created = row.get('PdfCreated')
+
+            # Happy path: Id is digits, DocId is Id without padding, the rest well-formed
+            if (id_text and id_match(id_text)
+                    and (doc_id == id_text.lstrip('0') or doc_id == int(id_text))
+                    and (not ein or ein_match(ein if isinstance(ein, str) else str(ein)))
+                    and (not received or (isinstance(received, str) and received_match(received)))
+                    and (efile is None or isinstance(efile, int))
+                    and (pdf_created is None or isinstance(pdf_created, int))):
+                append(row)
+                continue
+
+            row = self._check_slowly(row, id_text, offset)
+            if row is not None:
+                append(row)
+        return valid
+
+    def _check_slowly(self, row: Dict, id_text: Optional[str], offset: Optional[int]) -> Optional[Dict]:
+        if not id_text or not _ID.match(id_text):
+            self._quarantine(row, 'rejected', ['missing_id' if not id_text else 'bad_id'], offset)
+            return None
+
+        reasons = []
+        fixes = {}
+        doc_id = row.get('DocId')
+        if doc_id in (None, ''):
+            reasons.append('missing_doc_id')
+            fixes['DocId'] = id_text.lstrip('0') or '0'
+        elif not _DIGITS.match(str(doc_id)):
+            reasons.append('bad_doc_id')
+            fixes['DocId'] = id_text.lstrip('0') or '0'
+        elif int(doc_id) != int(id_text):
+            reasons.append('doc_id_mismatch')
+
+        ein = row.get('Ein')
+        if ein not in (None, '') and not _EIN.match(str(ein).strip()):
+            reasons.append('bad_ein')
+            fixes['Ein'] = None
+
+        received = row.get('DateReceived')
+        if received not in (None, '') and not (isinstance(received, str) and _RECEIVED.match(received)):
+            if parse_received(received) is None:
+                reasons.append('bad_date_received')
+                fixes['DateReceived'] = None
+
+        for field, reason in (('Efile', 'bad_efile'), ('PdfCreated', 'bad_pdf_created')):
+            if not _is_int(row.get(field)):
+                reasons.append(reason)
+                fixes[field] = None
+
+        if fixes:
+            self._quarantine(row, 'repaired', reasons, offset)
+            row = dict(row, **fixes)
+        elif reasons:
+            self._quarantine(row, 'flagged', reasons, offset)
+        return row
+
+    def _quarantine(self, row: Dict, action: str, reasons: List[str], offset: Optional[int]):
+        self.counts[action] += 1
+        self.reasons.update(reasons)
+        self.quarantine.append({'offset': offset, 'action': action, 'reasons': reasons, 'row': row})
+
+    def summary(self) -> Dict:
+        return {'checked': self.checked, **{action: self.counts[action] for action in ACTIONS},
+                'reasons': dict(self.reasons)}
+
+    def save(self, filepath) -> Optional[Path]:
+        """Write the quarantined rows (JSON lines); nothing is written for a clean run"""
+        if not self.quarantine:
+            return None
+        filepath = Path(filepath)
+        try:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                for entry in self.quarantine:
+                    f.write(json.dumps(entry, default=str) + '\n')
+            return filepath
+        except Exception as e:
+            logger.error(f"Error saving quarantine file: {e}")
+            return None
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+
+Targeted watchlist polling: filtered ein/employer_name queries instead of a full scan.
+
+python tophat_watchlist.py --watchlist watchlist.csv --email-config email_config.json
+
+watchlist.csv columns: ein, employer_name, label (ein or employer_name required)
+
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import tophat_api_monitor
+from tophat_api_monitor import DeliveryOptions, RateLimiter, TopHatAPIMonitor
+from tophat_records import ein_of, normalize_ein
+
+WATCHLIST_STATE_FILE = "tophat_watchlist_state.json"
+WATCHLIST_RATE = 5.0        # Requests per second across the whole sweep
+WATCHLIST_WORKERS = 4       # Concurrent queries in a batch
+WATCHLIST_MAX_QUERIES = 60  # Per sweep; the rest rotate in on later sweeps
+RECENT_FILER_DAYS = 90      # Targets that filed this recently are polled every sweep
+SEEN_IDS_PER_TARGET = 200
+
+logger = logging.getLogger(__name__)
+
+
+def target_key(target: Dict) -> str:
+    if target.get('ein'):
+        return f"ein:{target['ein']}"
+    return f"employer:{target['employer_name'].upper()}"
+
+
+def load_watchlist(filepath: str) -> List[Dict]:
+    targets = []
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            # 12-3456789, 123456789 and a dropped leading zero are all the same target
+            ein = normalize_ein(row.get('ein')) or ''
+            employer_name = (row.get('employer_name') or '').strip()
+            if not ein and not employer_name:
+                continue
+            targets.append({
+                'ein': ein,
+                'employer_name': employer_name,
+                'label': (row.get('label') or '').strip() or employer_name or ein,
+            })
+    logger.info(f"Loaded {len(targets)} watchlist targets from {filepath}")
+    return targets
+
+
+class WatchlistPoller:
+
+    def __init__(self, monitor: TopHatAPIMonitor, targets: List[Dict],
+                 state_file: str = WATCHLIST_STATE_FILE, rate: float = WATCHLIST_RATE,
+                 max_queries: int = WATCHLIST_MAX_QUERIES, workers: int = WATCHLIST_WORKERS):
+        self.monitor = monitor
+        self.targets = targets
+        self.state_file = Path(state_file)
+        self.limiter = RateLimiter(1.0 / rate)
+        self.max_queries = max_queries
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+        self.unsent: Dict[str, set] = {}  # Target key -> hit Ids, marked seen once delivered
+
+    def _load_state(self) -> Dict:
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Couldn't load watchlist state: {e}")
+        return {'targets': {}}
+
+    def _save_state(self):
+        try:
+            with open(self.state_file, 'w') as f:
+                json.dump(self.state, f, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving watchlist state: {e}")
+
+    def schedule(self, now: datetime) -> List[Dict]:
+        """Recent filers first, then whoever was checked longest ago, up to the query budget"""
+        recent_cutoff = (now - timedelta(days=RECENT_FILER_DAYS)).isoformat()
+        entries = self.state['targets']
+
+        def priority(target):
+            entry = entries.get(target_key(target), {})
+            last_filed = entry.get('last_filed') or ''
+            return (0 if last_filed >= recent_cutoff else 1, entry.get('last_checked') or '')
+
+        ordered = sorted(self.targets, key=priority)
+        return ordered[:self.max_queries] if self.max_queries > 0 else ordered
+
+    def poll_target(self, target: Dict, now: datetime) -> List[Dict]:
+        """Query one target and return rows not seen on earlier sweeps"""
+        self.limiter.wait()
+        # DOL stores EINs without leading zeros; results are matched on the normalized EIN
+        data = self.monitor.fetch_page(0, employer_name='' if target['ein'] else target['employer_name'],
+                                       ein=target['ein'].lstrip('0'))
+        if data is None:
+            return []
+
+        rows = [row for row in data.get('rows', []) if row.get('Id') is not None
+                and (not target['ein'] or ein_of(row) == target['ein'])]
+        key = target_key(target)
+        with self._lock:
+            entry = self.state['targets'].setdefault(key, {})
+            first_check = 'seen_ids' not in entry
+            seen = set(entry.get('seen_ids', []))
+            hits = [] if first_check else [row for row in rows if row['Id'] not in seen]
+
+            entry['last_checked'] = now.isoformat()
+            hit_ids = {row['Id'] for row in hits}
+            entry['seen_ids'] = sorted(seen | {row['Id'] for row in rows} - hit_ids,
+                                       reverse=True)[:SEEN_IDS_PER_TARGET]
+            if hit_ids:
+                self.unsent[key] = hit_ids
+            dates = [row['DateReceived'] for row in rows if row.get('DateReceived')]
+            if dates:
+                entry['last_filed'] = max(dates + [entry.get('last_filed') or ''])
+
+        for row in hits:
+            row['WatchLabel'] = target['label']
+        return hits
+
+    def mark_seen(self):
+        """Remember the sweep's hits; left unseen, a failed send is retried on the next sweep"""
+        with self._lock:
+            for key, hit_ids in self.unsent.items():
+                entry = self.state['targets'][key]
+                entry['seen_ids'] = sorted(set(entry['seen_ids']) | hit_ids, reverse=True)[:SEEN_IDS_PER_TARGET]
+            self.unsent = {}
+
+    def deliver(self, hits: List[Dict]) -> bool:
+        """Queue the hits in the outbox if there is one (and deliver them), otherwise email them"""
+        delivered = self.monitor.notify(hits, subject_prefix='[Watchlist] ',
+                                        key=lambda record: f"{record.get('Id')}:watchlist")
+        if delivered and self.monitor.outbox:
+            self.monitor.dispatcher.start()
+            self.monitor.dispatcher.drain()
+        return delivered
+
+    def sweep(self, send_email_notification: bool = True) -> List[Dict]:
+        start_time = datetime.now()
+        self.unsent = {}
+        batch = self.schedule(start_time)
+        logger.info(f"Watchlist sweep: polling {len(batch)} of {len(self.targets)} targets")
+
+        hits: List[Dict] = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for target_hits in pool.map(lambda t: self.poll_target(t, start_time), batch):
+                hits.extend(target_hits)
+
+        # The same filing can match an EIN and an employer-name target
+        unique = {}
+        for row in hits:
+            unique.setdefault(row['Id'], row)
+        hits = list(unique.values())
+
+        elapsed = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Watchlist sweep done in {elapsed:.2f}s: {len(hits)} new filing(s)")
+
+        if not hits or not send_email_notification or self.deliver(hits):
+            self.mark_seen()
+        else:
+            logger.error(f"Watchlist: {len(hits)} new filing(s) not sent; reported again next sweep")
+
+        self.state['last_sweep'] = start_time.isoformat()
+        self.state['last_sweep_hits'] = len(hits)
+        self._save_state()
+        return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Poll the DOL TopHat search API for a watchlist of EINs and employers'
+    )
+    parser.add_argument(
+        '--watchlist',
+        required=True,
+        help='CSV with ein, employer_name and optional label columns'
+    )
+    parser.add_argument(
+        '--state-file',
+        default=WATCHLIST_STATE_FILE,
+        help=f'Watchlist state file (default: {WATCHLIST_STATE_FILE})'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=WATCHLIST_RATE,
+        help=f'Maximum requests per second (default: {WATCHLIST_RATE})'
+    )
+    parser.add_argument(
+        '--max-queries',
+        type=int,
+        default=WATCHLIST_MAX_QUERIES,
+        help=f'Targets polled per sweep, 0=all (default: {WATCHLIST_MAX_QUERIES})'
+    )
+    parser.add_argument('--email-config', help='Path to email configuration JSON file')
+    parser.add_argument('--outbox', help='Queue hits in this notification outbox before sending them')
+    parser.add_argument('--reference-file', help='Reference CSV with EIN-to-address mappings')
+    parser.add_argument('--no-email', action='store_true', help='Disable email')
+    parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+
+    args = parser.parse_args()
+    tophat_api_monitor.configure_logging()
+
+    if args.debug:
+        tophat_api_monitor.logger.setLevel(logging.DEBUG)
+
+    email_config = None
+    if args.email_config and not args.no_email:
+        try:
+            with open(args.email_config, 'r') as f:
+                email_config = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading email configuration: {e}")
+
+    monitor = TopHatAPIMonitor(email_config=email_config, reference_file=args.reference_file,
+                               delivery=DeliveryOptions(outbox_file=args.outbox))
+    poller = WatchlistPoller(monitor, load_watchlist(args.watchlist), state_file=args.state_file,
+                             rate=args.rate, max_queries=args.max_queries)
+    poller.sweep(send_email_notification=not args.no_email)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())